@@ -0,0 +1,428 @@
+#!/usr/bin/env python
+"""
+How long it takes from a tracked file being saved to each connected browser
+being told about it, and what the server spends in CPU and threads to do so.
+
+Generates a throwaway Django project in a temporary directory, starts
+runserver against it, connects a number of SSE clients (plain sockets, no
+browser), then touches the project's stylesheets in the given pattern and
+records the time from os.utime() until each client receives the
+assets_change event. Nothing is fetched from anywhere but localhost.
+
+    python benchmarks/latency.py --clients 10 --files 20 --pattern burst
+    python benchmarks/latency.py --set sleep_quick=0.1 --json after.json
+
+Any of the AppConfig's attributes may be overridden with --set, so that
+different settings (or watcher backends) can be compared on the same
+machine, using the --json output.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import textwrap
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY = os.path.dirname(HERE)
+re_stylesheet = re.compile(r'<link rel="stylesheet" href="([^"]+)">')
+
+
+SETTINGS = """
+SECRET_KEY = "livereloadish-benchmark"
+DEBUG = True
+ALLOWED_HOSTS = ["*"]
+INSTALLED_APPS = ["django.contrib.staticfiles", "bench_appconf.BenchConfig"]
+MIDDLEWARE = ["livereloadish.middleware.LivereloadishMiddleware"]
+ROOT_URLCONF = "bench_urls"
+TEMPLATES = [{{
+    "BACKEND": "django.template.backends.django.DjangoTemplates",
+    "DIRS": [{templates!r}],
+}}]
+STATIC_URL = "/static/"
+STATICFILES_DIRS = [{static!r}]
+USE_TZ = True
+"""
+
+APPCONF = """
+from livereloadish.apps import LiveReloadishConfig
+
+
+class BenchConfig(LiveReloadishConfig):
+    # Don't trample on the lockfile of whatever is being developed.
+    lockfile = {lockfile!r}
+    warm_up_pages = 0
+{overrides}
+"""
+
+URLS = """
+from django.contrib.staticfiles.urls import staticfiles_urlpatterns
+from django.urls import path
+from django.views.generic import TemplateView
+
+urlpatterns = [
+    path("", TemplateView.as_view(template_name="index.html")),
+] + staticfiles_urlpatterns()
+"""
+
+
+def make_project(root: str, files: int, overrides: Dict[str, Any]) -> List[str]:
+    templates = os.path.join(root, "templates")
+    static = os.path.join(root, "static")
+    os.makedirs(templates)
+    os.makedirs(os.path.join(static, "css"))
+    paths = []
+    links = []
+    for index in range(files):
+        name = f"bench{index}.css"
+        path = os.path.join(static, "css", name)
+        with open(path, "w") as f:
+            f.write(f".bench{index} {{ color: red; }}\n")
+        paths.append(path)
+        links.append(f'<link rel="stylesheet" href="{{% static "css/{name}" %}}">')
+    with open(os.path.join(templates, "index.html"), "w") as f:
+        f.write(
+            "{% load static %}<!doctype html><html><head><title>bench</title>"
+            + "".join(links)
+            + "</head><body></body></html>"
+        )
+    with open(os.path.join(root, "bench_settings.py"), "w") as f:
+        f.write(SETTINGS.format(templates=templates, static=static))
+    with open(os.path.join(root, "bench_appconf.py"), "w") as f:
+        f.write(
+            APPCONF.format(
+                lockfile=f"benchmark-{uuid.uuid4()}",
+                overrides="\n".join(
+                    f"    {key} = {value!r}" for key, value in overrides.items()
+                ),
+            )
+        )
+    with open(os.path.join(root, "bench_urls.py"), "w") as f:
+        f.write(URLS)
+    return paths
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]  # type: ignore[no-any-return]
+
+
+def start_server(root: str, port: int) -> subprocess.Popen:  # type: ignore[type-arg]
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        (root, REPOSITORY, env.get("PYTHONPATH", ""))
+    ).rstrip(os.pathsep)
+    env["DJANGO_SETTINGS_MODULE"] = "bench_settings"
+    # Livereloadish only switches itself on within the autoreloader's child.
+    env["RUN_MAIN"] = "true"
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "django",
+            "runserver",
+            "--noreload",
+            "--skip-checks",
+            f"127.0.0.1:{port}",
+        ],
+        cwd=root,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"runserver exited with {server.returncode}")
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            connection.request("GET", "/")
+            response = connection.getresponse()
+            page = response.read().decode("utf-8")
+            if response.status == 200:
+                # Only serving them is what gets the stylesheets tracked,
+                # as it would be for a browser.
+                for href in re_stylesheet.findall(page):
+                    connection.request("GET", href.replace("&amp;", "&"))
+                    connection.getresponse().read()
+                return server
+        except OSError:
+            pass
+        time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("runserver didn't start within 30 seconds")
+
+
+class ProcessSampler(threading.Thread):
+    """
+    CPU time and thread count of the server process, via psutil if it's
+    installed or /proc otherwise.
+    """
+
+    def __init__(self, pid: int, interval: float = 0.1) -> None:
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.threads: List[int] = []
+        self.cpu_start = self.cpu_time()
+        self.wall_start = time.perf_counter()
+        self.cpu_end = self.cpu_start
+        self.wall_end = self.wall_start
+
+    def cpu_time(self) -> float:
+        if psutil is not None:
+            times = psutil.Process(self.pid).cpu_times()
+            return times.user + times.system  # type: ignore[no-any-return]
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rpartition(")")[2].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+    def thread_count(self) -> int:
+        if psutil is not None:
+            return psutil.Process(self.pid).num_threads()  # type: ignore[no-any-return]
+        with open(f"/proc/{self.pid}/status") as f:
+            for line in f:
+                if line.startswith("Threads:"):
+                    return int(line.split()[1])
+        return 0
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            try:
+                self.threads.append(self.thread_count())
+            except (OSError, ValueError):
+                break
+
+    def stop(self) -> Dict[str, float]:
+        self.stopped.set()
+        self.join()
+        self.cpu_end = self.cpu_time()
+        self.wall_end = time.perf_counter()
+        cpu = self.cpu_end - self.cpu_start
+        wall = self.wall_end - self.wall_start
+        return {
+            "cpu_seconds": round(cpu, 3),
+            "cpu_percent": round(100 * cpu / wall, 2) if wall else 0.0,
+            "threads_max": max(self.threads, default=0),
+            "threads_mean": round(statistics.mean(self.threads), 1)
+            if self.threads
+            else 0.0,
+        }
+
+
+class Client(threading.Thread):
+    """
+    A minimal EventSource, recording when each assets_change arrives for
+    whichever file was most recently touched with that name.
+    """
+
+    def __init__(self, port: int, touched: Dict[str, float], lock: threading.Lock) -> None:
+        super().__init__(daemon=True)
+        self.port = port
+        self.touched = touched
+        self.lock = lock
+        self.latencies: List[float] = []
+        self.connected = threading.Event()
+        self.stopped = False
+        self.connection: Optional[http.client.HTTPConnection] = None
+
+    def run(self) -> None:
+        self.connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=60)
+        self.connection.request(
+            "GET", f"/livereloadish/watch/?uuid={uuid.uuid4()}&js_load={time.time()}"
+        )
+        response = self.connection.getresponse()
+        event = ""
+        while not self.stopped:
+            try:
+                line = response.fp.readline()
+            except (OSError, ValueError):
+                return
+            if not line:
+                return
+            received = time.perf_counter()
+            text = line.decode("utf-8").rstrip("\n")
+            if text.startswith("event:"):
+                event = text[6:].strip()
+                if event == "connect":
+                    self.connected.set()
+            elif text.startswith("data:") and event == "assets_change":
+                filename = json.loads(text[5:])["info"]["filename"]
+                with self.lock:
+                    touched_at = self.touched.get(filename)
+                if touched_at is not None:
+                    self.latencies.append(received - touched_at)
+
+    def stop(self) -> None:
+        self.stopped = True
+        if self.connection is not None and self.connection.sock is not None:
+            try:
+                self.connection.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.connection.close()
+
+
+def touch_schedule(
+    paths: List[str], rounds: int, pattern: str, interval: float
+) -> List[Tuple[float, List[str]]]:
+    """
+    When (relative to the start) to touch which files.
+    """
+    schedule = []
+    at = 0.0
+    for _round in range(rounds):
+        if pattern == "burst":
+            schedule.append((at, list(paths)))
+            at += interval
+        elif pattern == "sequential":
+            for path in paths:
+                schedule.append((at, [path]))
+                at += interval
+        else:
+            for _path in paths:
+                schedule.append((at, [random.choice(paths)]))
+                at += random.uniform(0, interval * 2)
+    return schedule
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    overrides = {}
+    for setting in args.set:
+        key, sep, value = setting.partition("=")
+        overrides[key] = json.loads(value)
+    random.seed(args.seed)
+    with tempfile.TemporaryDirectory(prefix="livereloadish-bench-") as root:
+        paths = make_project(root, args.files, overrides)
+        port = args.port or free_port()
+        server = start_server(root, port)
+        try:
+            touched: Dict[str, float] = {}
+            lock = threading.Lock()
+            clients = [Client(port, touched, lock) for _ in range(args.clients)]
+            for client in clients:
+                client.start()
+            for client in clients:
+                if not client.connected.wait(10):
+                    raise RuntimeError("An SSE client didn't connect within 10 seconds")
+            # Give the watcher a moment to settle on the files it has seen.
+            time.sleep(args.settle)
+            sampler = ProcessSampler(server.pid)
+            sampler.start()
+            schedule = touch_schedule(paths, args.rounds, args.pattern, args.interval)
+            started = time.perf_counter()
+            expected = 0
+            for at, batch in schedule:
+                delay = started + at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                for path in batch:
+                    with lock:
+                        touched[os.path.basename(path)] = time.perf_counter()
+                    os.utime(path)
+                expected += len(batch) * len(clients)
+            time.sleep(args.timeout)
+            process = sampler.stop()
+            for client in clients:
+                client.stop()
+        finally:
+            server.terminate()
+            try:
+                server.wait(10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+    latencies = [latency * 1000 for client in clients for latency in client.latencies]
+    return {
+        "settings": {
+            "clients": args.clients,
+            "files": args.files,
+            "rounds": args.rounds,
+            "pattern": args.pattern,
+            "interval": args.interval,
+            "overrides": overrides,
+            "python": sys.version.split()[0],
+            "psutil": psutil is not None,
+        },
+        "latency_ms": {
+            "expected": expected,
+            "received": len(latencies),
+            "min": round(min(latencies, default=0.0), 2),
+            "p50": round(percentile(latencies, 50), 2),
+            "p90": round(percentile(latencies, 90), 2),
+            "p99": round(percentile(latencies, 99), 2),
+            "max": round(max(latencies, default=0.0), 2),
+            "mean": round(statistics.mean(latencies), 2) if latencies else 0.0,
+        },
+        "server": process,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--clients", type=int, default=5, help="SSE connections")
+    parser.add_argument("--files", type=int, default=10, help="stylesheets to track")
+    parser.add_argument("--rounds", type=int, default=3, help="times through the files")
+    parser.add_argument(
+        "--pattern",
+        choices=("sequential", "burst", "random"),
+        default="sequential",
+        help="one file after another, all of them at once, or at random",
+    )
+    parser.add_argument(
+        "--interval", type=float, default=0.5, help="seconds between touches"
+    )
+    parser.add_argument(
+        "--settle", type=float, default=1.0, help="seconds to wait before touching"
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=3.0, help="seconds to wait for stragglers"
+    )
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="ATTRIBUTE=JSON",
+        help="override an AppConfig attribute, eg: sleep_quick=0.1",
+    )
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+    results = run(args)
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.json:
+        with open(args.json, "w") as f:
+            f.write(output)
+    latency = results["latency_ms"]
+    return 0 if latency["received"] >= latency["expected"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
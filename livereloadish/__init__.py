@@ -54,25 +54,32 @@ def watch_file(
     If neither the mime type (e.g: text/css) nor the mtime (eg: 1634811820.689562)
     is given, they will be inferred from the absolute path to the file.
 
+    Returns False without doing anything if the file's content type isn't
+    tracked, or it's excluded by the watch_include/watch_exclude rules.
+    Files added this way are tracked regardless of whether they're requested.
+
     Does not handle exceptions, which may be:
     getmtime => FileNotFoundError, OSError, etc.
     get_app_config => LookupError
     """
     if content_type is None:
         content_type, encoding = mimetypes.guess_type(absolute_path)
-    if mtime is None:
-        mtime = os.path.getmtime(absolute_path)
 
     try:
         appconf: LiveReloadishConfig = django_apps_registry.get_app_config("livereloadish")  # type: ignore[assignment]
     except LookupError as exc:
         raise ImproperlyConfigured("Unable to watch a file without an appconfig for 'livereloadish'") from exc
-    if content_type in appconf.seen:
-        return appconf.add_to_seen(
+    if appconf.should_track(content_type, absolute_path):
+        if mtime is None:
+            mtime = os.path.getmtime(absolute_path)
+        added = appconf.add_to_seen(
             content_type=content_type,
             relative_path=relative_path,
             absolute_path=absolute_path,
             mtime=mtime,
             requires_full_reload=requires_full_reload,
         )
+        # Asked for explicitly, so never evicted for not being requested.
+        appconf.last_requested[absolute_path] = float("inf")
+        return added
     return False
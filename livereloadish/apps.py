@@ -1,12 +1,23 @@
 import logging
 import os
 import pickle
+import threading
 import time
 import pathlib
 from datetime import datetime, timezone
 from hashlib import sha1
 from tempfile import gettempdir
-from typing import Dict, Literal, Optional, List, Any, Union, NamedTuple, TYPE_CHECKING
+from typing import (
+    Dict,
+    Iterable,
+    Optional,
+    List,
+    Any,
+    Union,
+    NamedTuple,
+    Tuple,
+    TYPE_CHECKING,
+)
 
 from asgiref.local import Local
 from django.apps import AppConfig, apps
@@ -21,19 +32,31 @@ from django.utils.autoreload import (
     BaseReloader,
 )
 from django.utils.functional import cached_property
+from django.utils.module_loading import import_string
 
 from livereloadish.patches import (
+    etag_from_stat,
     do_patch_static_serve,
     do_patch_engine_find_template,
+    do_patch_engine_get_template_loaders,
     do_patch_staticnode_url,
     do_patch_filesystemstorage_url,
     do_patch_extendsnode_get_parent,
     do_patch_template_compile_nodelist,
+    do_patch_template_render,
+    do_patch_jinja2_environment_load_template,
+    do_patch_jinja2_template_is_up_to_date,
 )
+from livereloadish.disconnects import DisconnectMonitor
+from livereloadish.manifests import PageManifests
+from livereloadish.rules import WatchRules
+from livereloadish.warmup import RecentPages
+from livereloadish.watcher import Timer, Watcher
 
 
 if TYPE_CHECKING:
     from django.dispatch import Signal
+    from livereloadish.registry import SharedRegistry
 
 
 __all__ = ["logger", "Seen", "LiveReloadishConfig"]
@@ -69,6 +92,8 @@ class Seen(NamedTuple):
     filename: Union[bytes, str]
     mtime: float
     requires_full_reload: bool
+    # Only known for things served through static files, otherwise empty.
+    etag: str = ""
 
     def mtime_as_utc_date(self) -> datetime:
         return datetime.fromtimestamp(self.mtime, timezone.utc)
@@ -89,15 +114,75 @@ class LiveReloadishConfig(AppConfig):
     name = "livereloadish"
     label = "livereloadish"
 
-    # Assuming multiple projects, and each one is a separate venv, is probably enough...
+    # Per install of livereloadish, with each project using it getting its own
+    # files within that (see lockfile_name) as they may well share a venv.
     lockfile: str = sha1(os.path.dirname(__file__).encode("utf-8")).hexdigest()
     # How long before a file (either the lockfile or the individual entries therein)
-    # is considered stale, in seconds.
+    # is considered stale, in seconds. Entries which haven't been requested for
+    # that long stop being tracked, until something requests them again.
     stale_after: int = 60 * 15
 
-    # Sleep durations for the SSE connection
+    # Sleep durations for the file watcher
     sleep_quick = 0.35
     sleep_slow = 1.0
+    # How long between scans when the machine is otherwise idle.
+    sleep_idle = 0.2
+    # How often the watcher samples the battery, the load average and its own
+    # CPU usage, to decide how long to sleep between scans.
+    sleep_sample = 5.0
+    # How long between scans when every connected page is hidden, or there
+    # are none; a page becoming visible again wakes the watcher immediately.
+    sleep_hidden = 30.0
+    # The 1 minute load average per CPU below which the machine counts as idle
+    # (scanning every sleep_idle), and above which it counts as busy, say
+    # compiling or running tests (scanning every sleep_slow).
+    load_idle = 0.25
+    load_busy = 1.0
+    # The share of a CPU the watcher's own scanning may take before it backs
+    # off as if the machine were busy.
+    load_self = 0.05
+    # How long to let a burst of filesystem events settle before scanning.
+    sleep_settle = 0.025
+    # How long an SSE connection waits for changes before sending a keep-alive ping.
+    sleep_keepalive = 7.0
+    # How long to wait, at most, for the SSE connections to be told that the
+    # autoreloader is restarting the process.
+    sleep_restart = 0.25
+    # How to find the client socket for an SSE connection under each server, so
+    # that disconnects are noticed. The first one which applies is used.
+    disconnect_adapters: Tuple[str, ...] = (
+        "livereloadish.disconnects.GunicornAdapter",
+        "livereloadish.disconnects.WaitressAdapter",
+        "livereloadish.disconnects.RunserverAdapter",
+    )
+    # Keep the seen registry in an SQLite database alongside the lockfile, so that
+    # multiple worker processes (eg: gunicorn, waitress) know about each other's
+    # files, and only one of them scans. Replaces the lockfile when enabled.
+    share_seen_between_processes = False
+    # Keep Django's cached template loader in use under DEBUG, as it is in
+    # production, with anything the watcher sees change being evicted from it,
+    # so that templates aren't re-read and re-compiled on every render.
+    cache_templates = False
+    # Wrap the output of each {% include %} in a pair of HTML comments naming the
+    # template, so that when it changes only that part of the page is morphed.
+    annotate_templates = False
+    # Rules for which of the files seen while serving and rendering are tracked,
+    # each being a glob of the absolute path ("*/node_modules/*"), or prefixed
+    # with "path:" for an absolute path prefix, "app:" for an app label (eg:
+    # "app:admin") or "type:" for a glob of the content type (eg: "type:font/*")
+    # If there are any include rules, only files matching one are tracked.
+    # Nothing excluded is ever stat'd; by default everything seen is tracked,
+    # but anything installed as a package isn't going to change under runserver
+    # if it's not an editable install, so see WatchRules.packages.
+    watch_include: Tuple[str, ...] = ()
+    watch_exclude: Tuple[str, ...] = ()
+    # How many of the most recently rendered pages to remember across restarts,
+    # to render again (anonymously) in the background as soon as the server is
+    # back up. Off unless it's set to more than 0, as it replays GET requests.
+    warm_up_pages = 0
+    # Add a Server-Timing header to each response saying how much time the
+    # patches and the middleware added to it, for the browser's devtools.
+    server_timing = True
 
     # This is intentionally mutable, fwiw.
     # It's also in a precise order, being that dicts are insertion ordered nowawdays.
@@ -140,11 +225,21 @@ class LiveReloadishConfig(AppConfig):
             (
                 do_patch_static_serve(),
                 do_patch_template_compile_nodelist(),
+                do_patch_template_render() if self.annotate_templates else True,
                 do_patch_engine_find_template(),
+                do_patch_engine_get_template_loaders()
+                if self.cache_templates
+                else True,
                 do_patch_filesystemstorage_url(),
                 do_patch_staticnode_url(),
                 do_patch_extendsnode_get_parent(),
+                do_patch_jinja2_environment_load_template(),
+                do_patch_jinja2_template_is_up_to_date(),
                 self.load_from_lockfile(),
+                self.load_recent_pages(),
+                # Cached templates have to be evicted as they change whether
+                # or not a browser has connected yet.
+                self.watcher.start() if self.cache_templates else True,
             )
         )
 
@@ -155,14 +250,24 @@ class LiveReloadishConfig(AppConfig):
         absolute_path: str,
         mtime: float,
         requires_full_reload: bool,
-    ) -> Literal[True]:
-        self.seen[content_type][absolute_path] = Seen(
+        etag: str = "",
+    ) -> bool:
+        if not self.should_track(content_type, absolute_path):
+            return False
+        file = Seen(
             relative_path,
             absolute_path,
             os.path.basename(relative_path),
             mtime,
             requires_full_reload,
+            etag,
         )
+        files = self.seen[content_type]
+        if self.shared_registry is not None and files.get(absolute_path) != file:
+            self.shared_registry.remember(content_type, file)
+        files[absolute_path] = file
+        self.touch_seen((absolute_path,))
+        self.watcher.watch(absolute_path)
         # Disabled for now ...
         if 0 and self.django_reloader is not None:
             # Apparently the modern reloader literally doesn't support str paths,
@@ -179,6 +284,162 @@ class LiveReloadishConfig(AppConfig):
             self.django_reloader.extra_files.add(pathlib.Path(absolute_path))
         return True
 
+    @cached_property
+    def last_requested(self) -> Dict[str, float]:
+        """
+        When each tracked file was last used to serve or render something,
+        by absolute path.
+        """
+        return {}
+
+    @cached_property
+    def evicted(self) -> Dict[str, Tuple[str, Seen]]:
+        """
+        Files which stopped being tracked for not being requested, by absolute
+        path, so they can be tracked again as they were if they're requested.
+        """
+        return {}
+
+    def touch_pages(self, pages: Iterable[str]) -> int:
+        """
+        Mark everything the given pages (by uuid) were rendered with as just
+        having been requested, because they're still open in a tab somewhere,
+        returning how many of them were known about.
+        """
+        known = 0
+        for page in pages:
+            manifest = self.page_manifests.get(page)
+            if manifest is not None:
+                self.touch_seen(
+                    (*manifest["templates"].values(), *manifest["files"].values())
+                )
+                known += 1
+        return known
+
+    def touch_seen(self, absolute_paths: Iterable[str]) -> int:
+        """
+        Mark the given files as just having been requested, and bring back any
+        which had been evicted for not being requested recently, because
+        templates coming out of the cached loader won't come through the
+        patches to be added again.
+        """
+        now = time.time()
+        restored = 0
+        for absolute_path in absolute_paths:
+            if self.last_requested.get(absolute_path, 0.0) < now:
+                self.last_requested[absolute_path] = now
+            evicted = self.evicted.pop(absolute_path, None)
+            if evicted is None:
+                continue
+            content_type, file = evicted
+            try:
+                stat = os.stat(absolute_path)
+            except OSError:
+                continue
+            logger.debug("Livereloadish tracking %s again", absolute_path)
+            restored += self.add_to_seen(
+                content_type,
+                file.relative_path,
+                absolute_path,
+                stat.st_mtime,
+                requires_full_reload=file.requires_full_reload,
+                etag=etag_from_stat(stat) if file.etag else "",
+            )
+        return restored
+
+    def evict_stale(self) -> int:
+        """
+        Stop tracking anything which hasn't been requested within stale_after
+        seconds, so the watcher isn't forever stat'ing the files of pages
+        looked at hours ago.
+        Not done when the seen files are shared between processes, as the
+        others may have been requesting them.
+        """
+        if self.shared_registry is not None or not self.seen_loaded.is_set():
+            return 0
+        now = time.time()
+        stale_before = now - self.stale_after
+        evicted = 0
+        for content_type, files in tuple(self.seen.items()):
+            for absolute_path, file in tuple(files.items()):
+                # Anything which didn't come through add_to_seen starts the
+                # clock now.
+                if self.last_requested.setdefault(absolute_path, now) >= stale_before:
+                    continue
+                if files.pop(absolute_path, None) is not None:
+                    self.last_requested.pop(absolute_path, None)
+                    self.evicted[absolute_path] = (content_type, file)
+                    evicted += 1
+        if evicted:
+            logger.info(
+                "Livereloadish stopped tracking %s files not requested in the last %ss",
+                evicted,
+                self.stale_after,
+            )
+        return evicted
+
+    def should_track(self, content_type: Optional[str], absolute_path: str) -> bool:
+        """
+        Whether a file of this type at this path gets tracked, which the
+        patches check before they go stat'ing anything.
+        """
+        return content_type in self.seen and self.watch_rules.allows(
+            absolute_path, content_type  # type: ignore[arg-type]
+        )
+
+    @cached_property
+    def watch_rules(self) -> WatchRules:
+        return WatchRules(include=self.watch_include, exclude=self.watch_exclude)
+
+    @cached_property
+    def watcher(self) -> Watcher:
+        return Watcher(appconf=self)
+
+    @cached_property
+    def disconnect_monitor(self) -> DisconnectMonitor:
+        return DisconnectMonitor(
+            adapters=tuple(import_string(path)() for path in self.disconnect_adapters)
+        )
+
+    @cached_property
+    def shared_registry(self) -> Optional["SharedRegistry"]:
+        if not self.share_seen_between_processes:
+            return None
+        # The registry needs Seen from this module, so is imported late.
+        from livereloadish.registry import SharedRegistry, fcntl
+
+        if fcntl is None:
+            logger.warning(
+                "Livereloadish can't share the seen files between processes without fcntl, ignoring share_seen_between_processes"
+            )
+            return None
+        os.makedirs(self.lockfile_storage.location, exist_ok=True)
+        return SharedRegistry(
+            path=self.lockfile_storage.path(f"{self.lockfile_name}.sqlite3")
+        )
+
+    @cached_property
+    def page_manifests(self) -> PageManifests:
+        return PageManifests(registry=self.shared_registry)
+
+    @cached_property
+    def recent_pages(self) -> RecentPages:
+        return RecentPages(maxsize=self.warm_up_pages)
+
+    @cached_property
+    def lockfile_name(self) -> str:
+        """
+        The lockfile, namespaced by the project, so that two projects sharing
+        a venv don't end up tracking (and scanning) each other's files.
+        """
+        project = "\0".join(
+            (
+                str(getattr(settings, "SETTINGS_MODULE", None) or ""),
+                str(getattr(settings, "BASE_DIR", None) or os.getcwd()),
+            )
+        )
+        return f"{self.lockfile}-{sha1(project.encode('utf-8')).hexdigest()[:12]}"
+
     @cached_property
     def lockfile_storage(self) -> FileSystemStorage:
         return FileSystemStorage(
@@ -192,14 +453,62 @@ class LiveReloadishConfig(AppConfig):
             and os.environ.get(DJANGO_AUTORELOAD_ENV, "false") == "true"
         )
 
+    @cached_property
+    def seen_loaded(self) -> threading.Event:
+        """
+        Set once the previously seen files have been loaded back in, if there
+        were any; until then, dumping them again would lose them.
+        """
+        loaded = threading.Event()
+        loaded.set()
+        return loaded
+
     def load_from_lockfile(self) -> bool:
+        """
+        Load the previously seen files in a background thread, so that
+        unpickling and stat'ing them all doesn't hold up the server starting
+        after every autoreload.
+        """
         if not self._should_be_enabled():
             logger.debug("Livereloadish skipping loading previously seen file cache")
             return False
-        if not self.lockfile_storage.exists(self.lockfile):
+        self.seen_loaded.clear()
+        threading.Thread(
+            target=self.read_lockfile, daemon=True, name="livereloadish-lockfile"
+        ).start()
+        return True
+
+    def read_lockfile(self) -> bool:
+        try:
+            with Timer() as timer:
+                loaded = self._read_lockfile()
+            logger.debug(
+                "Livereloadish loaded previously seen file cache in %ss", timer.elapsed()
+            )
+            return loaded
+        except Exception as e:
+            logger.exception(
+                "Livereloadish failed to load previously seen file cache", exc_info=e
+            )
+            return False
+        finally:
+            self.seen_loaded.set()
+
+    def _read_lockfile(self) -> bool:
+        if self.shared_registry is not None:
+            if self.shared_registry.last_touched() < (time.time() - self.stale_after):
+                logger.info(
+                    "Livereloadish has a stale shared registry of seen files: %s",
+                    self.shared_registry.path,
+                )
+                self.shared_registry.clear()
+                return False
+            self.shared_registry.pull_seen(self.seen)
+            return True
+        if not self.lockfile_storage.exists(self.lockfile_name):
             logger.debug("Livereloadish has no previously seen file cache")
             return False
-        lockfile_path = self.lockfile_storage.path(self.lockfile)
+        lockfile_path = self.lockfile_storage.path(self.lockfile_name)
         last_modified = os.path.getmtime(lockfile_path)
         # If it's there but older than we'd like, assume a refresh is needed
         # to collect files to watch.
@@ -208,42 +517,181 @@ class LiveReloadishConfig(AppConfig):
                 "Livereloadish has a stale cache of seen files: %s", lockfile_path
             )
             return False
-        with self.lockfile_storage.open(self.lockfile) as f:
+        with self.lockfile_storage.open(self.lockfile_name) as f:
             try:
-                self.seen = pickle.loads(f.read())
-            except EOFError:
+                previously_seen = pickle.loads(f.read())
+            except (EOFError, pickle.UnpicklingError):
                 logger.warning(
                     "Livereloadish previously seen files cache is corrupt: %s",
                     lockfile_path,
                 )
-            except TypeError:
+                return False
+            except (TypeError, AttributeError, ImportError):
                 logger.warning(
                     "Livereloadish previously seen files cache contains out of date datastructures: %s",
                     lockfile_path,
                 )
-            else:
-                file_count = sum(len(values) for values in self.seen.values())
-                logger.debug(
-                    "Livereloadish %s previously seen files are being tracked from cache (< 15 minutes old): %s",
-                    file_count,
-                    lockfile_path,
-                )
+                return False
+        last_requested: Dict[str, float] = {}
+        if isinstance(previously_seen, dict) and "seen" in previously_seen:
+            last_requested = previously_seen.get("last_requested") or {}
+            previously_seen = previously_seen["seen"]
+        file_count = self.merge_seen(
+            previously_seen, last_requested, default_requested=last_modified
+        )
+        logger.debug(
+            "Livereloadish %s previously seen files are being tracked from cache (< 15 minutes old): %s",
+            file_count,
+            lockfile_path,
+        )
+        return True
+
+    def merge_seen(
+        self,
+        previously_seen: Any,
+        last_requested: Dict[str, float],
+        default_requested: float,
+    ) -> int:
+        """
+        Add the files from the lockfile to those being tracked, skipping
+        anything which doesn't look like it came from this version, and
+        anything which was deleted while the server was down.
+        Files which changed while the server was down get their new mtime,
+        so that SSE connections from pages older than that are told about it
+        when they reconnect (see SSEView.stream) rather than the watcher
+        treating them as a brand new change.
+        Anything seen by requests since the server started is newer, and wins,
+        and anything not requested for stale_after seconds is left out.
+        """
+        stale_before = time.time() - self.stale_after
+        if not isinstance(previously_seen, dict):
+            logger.warning("Livereloadish previously seen files cache is malformed")
+            return 0
+        by_directory: Dict[str, List[Tuple[str, Seen]]] = {}
+        for content_type, files in previously_seen.items():
+            if content_type not in self.seen or not isinstance(files, dict):
+                continue
+            for absolute_path, file in files.items():
+                requested = last_requested.get(absolute_path, default_requested)
+                if (
+                    isinstance(file, Seen)
+                    and file.absolute_path == absolute_path
+                    and isinstance(requested, float)
+                    and requested >= stale_before
+                    and self.should_track(content_type, absolute_path)
+                ):
+                    if self.last_requested.get(absolute_path, 0.0) < requested:
+                        self.last_requested[absolute_path] = requested
+                    by_directory.setdefault(os.path.dirname(absolute_path), []).append(
+                        (content_type, file)
+                    )
+        merged = 0
+        changed = 0
+        deleted = 0
+        for directory, entries in by_directory.items():
+            # One listing per directory, rather than a stat per file to find
+            # out which are gone; on Windows the listing has the mtimes too.
+            try:
+                with os.scandir(directory) as listing:
+                    existing = {entry.name: entry for entry in listing}
+            except OSError:
+                existing = {}
+            for content_type, file in entries:
+                entry = existing.get(os.path.basename(file.absolute_path))
+                try:
+                    stat = entry.stat() if entry is not None else None
+                except OSError:
+                    stat = None
+                if stat is None:
+                    deleted += 1
+                    continue
+                if stat.st_mtime > file.mtime:
+                    changed += 1
+                    file = file._replace(
+                        mtime=stat.st_mtime,
+                        etag=etag_from_stat(stat) if file.etag else "",
+                    )
+                if self.seen[content_type].setdefault(file.absolute_path, file) is file:
+                    self.watcher.watch(file.absolute_path)
+                    merged += 1
+        logger.info(
+            "Livereloadish restored %s previously seen files, %s of which changed and %s were deleted while the server was down",
+            merged,
+            changed,
+            deleted,
+        )
+        return merged
+
+    def load_recent_pages(self) -> bool:
+        """
+        Render the pages which were most recently requested before the last
+        restart, so they're warm by the time the browser asks for them again.
+        Always succeeds, as there's nothing to do if they're not there.
+        """
+        if self.warm_up_pages < 1:
+            return True
+        pages_file = f"{self.lockfile_name}.pages"
+        if not self.lockfile_storage.exists(pages_file):
+            logger.debug("Livereloadish has no recently rendered pages to warm up")
             return True
+        with self.lockfile_storage.open(pages_file) as f:
+            self.recent_pages.loads(
+                f.read().decode("utf-8"), stale_before=time.time() - self.stale_after
+            )
+        self.recent_pages.warm_up()
+        return True
+
+    def dump_recent_pages(self) -> bool:
+        if self.warm_up_pages < 1:
+            return False
+        pages_file = f"{self.lockfile_name}.pages"
+        try:
+            os.makedirs(self.lockfile_storage.location, exist_ok=True)
+            self.lockfile_storage.delete(pages_file)
+            # The temporary directory is usually shared with other users, and
+            # the URLs may say more than they ought to, so keep it private.
+            fd = os.open(
+                self.lockfile_storage.path(pages_file),
+                os.O_WRONLY | os.O_CREAT | os.O_EXCL,
+                0o600,
+            )
+            with os.fdopen(fd, "wb") as f:
+                f.write(self.recent_pages.dumps().encode("utf-8"))
+        except OSError as e:
+            logger.debug(
+                "Failed to dump recently rendered pages to cache", exc_info=e
+            )
+            return False
+        return True
 
     def dump_to_lockfile(self) -> bool:
         if not self._should_be_enabled():
             logger.debug("Livereloadish skipping dumping previously seen file cache")
             return False
+        self.dump_recent_pages()
+        if not self.seen_loaded.is_set():
+            logger.debug(
+                "Livereloadish skipping dumping previously seen file cache, it's still being loaded"
+            )
+            return False
+        if self.shared_registry is not None:
+            # Everything is already in there, just mark it as not stale.
+            return self.shared_registry.touch()
         file_count = sum(len(values) for values in self.seen.values())
         logger.debug(
             "Livereloadish dumping %s previously seen files to cache: %s",
             file_count,
-            self.lockfile_storage.path(self.lockfile),
+            self.lockfile_storage.path(self.lockfile_name),
         )
         try:
-            self.lockfile_storage.delete(self.lockfile)
+            self.lockfile_storage.delete(self.lockfile_name)
             self.lockfile_storage.save(
-                self.lockfile, ContentFile(pickle.dumps(self.seen))
+                self.lockfile_name,
+                ContentFile(
+                    pickle.dumps(
+                        {"seen": self.seen, "last_requested": dict(self.last_requested)}
+                    )
+                ),
             )
         except FileNotFoundError as e:
             logger.debug(
@@ -0,0 +1,200 @@
+import logging
+import selectors
+import socket
+import threading
+from types import FrameType
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from django.core.handlers.wsgi import WSGIRequest
+from django.core.servers.basehttp import ServerHandler
+
+__all__ = [
+    "logger",
+    "SocketAdapter",
+    "GunicornAdapter",
+    "WaitressAdapter",
+    "RunserverAdapter",
+    "DisconnectMonitor",
+]
+logger = logging.getLogger(__name__)
+
+
+class SocketAdapter:
+    """
+    Finds the client socket for a streaming request under a specific server.
+    This is me just finding out and documenting where these things live.
+    By no means is it an endorsement for trying to use anything other than
+    runserver for this. AFAIK It'll lock a whole thread permanently until
+    a client disconnects, so it's only really suitable for local stuff.
+    """
+
+    __slots__ = ()
+    name = "unknown"
+
+    def applies(self, request: WSGIRequest, frame: Optional[FrameType]) -> bool:
+        # Subclasses say which server they know about; this one knows none.
+        return False
+
+    def find_socket(
+        self, request: WSGIRequest, frame: Optional[FrameType]
+    ) -> Optional[socket.socket]:
+        return None
+
+
+class GunicornAdapter(SocketAdapter):
+    __slots__ = ()
+    name = "gunicorn"
+
+    def applies(self, request: WSGIRequest, frame: Optional[FrameType]) -> bool:
+        return "gunicorn.socket" in request.environ
+
+    def find_socket(
+        self, request: WSGIRequest, frame: Optional[FrameType]
+    ) -> Optional[socket.socket]:
+        return request.environ["gunicorn.socket"]  # type: ignore[no-any-return]
+
+
+class WaitressAdapter(SocketAdapter):
+    """
+    So Waitress has waitress.channel.HTTPChannel.check_client_disconnected
+    passed in, buuuuuuut calling it once the client has gone away doesn't
+    work if the channel_request_lookahead isn't set to > 0 ... which requires
+    setting that for the whole WSGI app via config or CLI. So let's
+    find the socket in the stack. Bleh.
+    """
+
+    __slots__ = ()
+    name = "waitress"
+
+    def applies(self, request: WSGIRequest, frame: Optional[FrameType]) -> bool:
+        return "waitress.client_disconnected" in request.environ
+
+    def find_socket(
+        self, request: WSGIRequest, frame: Optional[FrameType]
+    ) -> Optional[socket.socket]:
+        if frame is None:
+            return None
+        server_handler = frame.f_locals.get("self", None)
+        try:
+            return server_handler.channel.socket  # type: ignore[union-attr,no-any-return]
+        except AttributeError:
+            return None
+
+
+class RunserverAdapter(SocketAdapter):
+    __slots__ = ()
+    name = "runserver"
+
+    def applies(self, request: WSGIRequest, frame: Optional[FrameType]) -> bool:
+        return frame is not None and isinstance(
+            frame.f_locals.get("self", None), ServerHandler
+        )
+
+    def find_socket(
+        self, request: WSGIRequest, frame: Optional[FrameType]
+    ) -> Optional[socket.socket]:
+        server_handler: ServerHandler = frame.f_locals["self"]  # type: ignore[union-attr]
+        try:
+            return server_handler.request_handler.connection  # type: ignore[attr-defined,no-any-return]
+        except AttributeError:
+            return None
+
+
+class DisconnectMonitor:
+    """
+    One thread per process which waits on every registered SSE socket at once
+    using the best selector available (epoll, kqueue, etc). A socket only
+    becomes readable when the client sends something or hangs up, which for
+    an event stream is practically always the latter, so each live connection
+    costs nothing until it goes away, at which point its callback is invoked.
+    """
+
+    # How long select() may block before picking up any sockets registered
+    # in the meantime, for selectors which can't see those immediately.
+    select_timeout = 1.0
+
+    def __init__(self, adapters: Tuple[SocketAdapter, ...]) -> None:
+        self.adapters = adapters
+        self.selector = selectors.DefaultSelector()
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+        self.callbacks: Dict[int, Callable[[], Any]] = {}
+
+    def find_socket(
+        self, request: WSGIRequest, frame: Optional[FrameType]
+    ) -> Tuple[str, Optional[socket.socket]]:
+        for adapter in self.adapters:
+            if adapter.applies(request, frame):
+                return adapter.name, adapter.find_socket(request, frame)
+        return SocketAdapter.name, None
+
+    def register(self, sock: socket.socket, callback: Callable[[], Any]) -> bool:
+        with self.lock:
+            try:
+                self.selector.register(sock, selectors.EVENT_READ, callback)
+            except (KeyError, ValueError, OSError) as e:
+                logger.debug(
+                    "Livereloadish failed to monitor socket %r for disconnects",
+                    sock,
+                    exc_info=e,
+                )
+                return False
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self.run, name="livereloadish-disconnects", daemon=True
+                )
+                self.thread.start()
+        return True
+
+    def unregister(self, sock: socket.socket) -> bool:
+        with self.lock:
+            try:
+                self.selector.unregister(sock)
+            except (KeyError, ValueError, OSError):
+                return False
+        return True
+
+    def run(self) -> None:
+        while True:
+            with self.lock:
+                if not self.selector.get_map():
+                    self.thread = None
+                    return
+            try:
+                events = self.selector.select(timeout=self.select_timeout)
+            except OSError as e:
+                logger.debug("Livereloadish failed to select sockets", exc_info=e)
+                continue
+            for key, mask in events:
+                sock: socket.socket = key.fileobj  # type: ignore[assignment]
+                if self.is_open(sock):
+                    # The client sent something other than a hang-up, which is
+                    # unexpected for an event stream. Stop watching it rather
+                    # than spin on a socket which stays readable; writing the
+                    # next keep-alive ping will find out if it's gone.
+                    logger.debug(
+                        "Livereloadish socket %r unexpectedly had data, no longer monitoring",
+                        sock,
+                    )
+                    self.unregister(sock)
+                    continue
+                self.unregister(sock)
+                try:
+                    key.data()
+                except Exception as e:
+                    logger.exception(
+                        "Livereloadish disconnect callback failed", exc_info=e
+                    )
+
+    def is_open(self, sock: socket.socket) -> bool:
+        # Test whether the client has hung up, apparently.
+        # https://stackoverflow.com/a/62277798 and
+        # https://stackoverflow.com/a/7589126 combined yo...
+        # Only done once a socket becomes readable, rather than every tick.
+        try:
+            return len(sock.recv(16, socket.MSG_DONTWAIT | socket.MSG_PEEK)) > 0
+        except BlockingIOError:
+            return True
+        except OSError:
+            # ConnectionResetError, or the fd has been closed under us.
+            return False
@@ -0,0 +1,103 @@
+import logging
+import re
+from html.parser import HTMLParser
+from typing import List, Optional, Tuple
+
+__all__ = ["logger", "extract_fragment"]
+logger = logging.getLogger(__name__)
+
+re_body_start = re.compile(r"<body[\s>]", re.IGNORECASE)
+re_body_end = re.compile(r"</body\s*>", re.IGNORECASE)
+# Bits of the <head> which the client's partial reloads keep in sync.
+re_head_extras = re.compile(
+    r"<title[\s>].*?</title\s*>|<style[\s>].*?</style\s*>", re.IGNORECASE | re.DOTALL
+)
+re_injected_templates = re.compile(
+    r'<template id="livereloadish-page-(?:templates|files)"[^>]*></template>'
+)
+
+
+class RegionFound(Exception):
+    pass
+
+
+class RegionFinder(HTMLParser):
+    """
+    Finds where the element with the given id starts and ends, by counting
+    the opening and closing tags of the same name within it.
+    """
+
+    def __init__(self, element_id: str) -> None:
+        super().__init__(convert_charrefs=False)
+        self.element_id = element_id
+        self.tag: Optional[str] = None
+        self.depth = 0
+        self.start: Optional[Tuple[int, int]] = None
+        self.end: Optional[Tuple[int, int]] = None
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        if self.tag is None:
+            if ("id", self.element_id) in attrs:
+                self.tag = tag
+                self.depth = 1
+                self.start = self.getpos()
+        elif tag == self.tag:
+            self.depth += 1
+
+    def handle_endtag(self, tag: str) -> None:
+        if self.tag == tag:
+            self.depth -= 1
+            if self.depth == 0:
+                self.end = self.getpos()
+                raise RegionFound()
+
+
+def offset_of(line_starts: List[int], position: Tuple[int, int]) -> int:
+    lineno, column = position
+    return line_starts[lineno - 1] + column
+
+
+def extract_fragment(content: str, name: str) -> Optional[str]:
+    """
+    Cut the given part of a rendered page out, for the client to morph into
+    the existing document, rather than it receiving and parsing all of it.
+    The name is either "body", or the id of an element; the page's <title>
+    and any <style> elements in the <head> are included too, along with the
+    injected livereloadish <template> elements if they're not already within it.
+    Returns None if it can't be found, in which case the whole page should
+    be sent as usual.
+    """
+    body_start = re_body_start.search(content)
+    head = content[: body_start.start()] if body_start is not None else ""
+    extras = "".join(re_head_extras.findall(head))
+    if name == "body":
+        body_end = None
+        for body_end in re_body_end.finditer(content):
+            pass
+        if body_start is None or body_end is None:
+            return None
+        return extras + content[body_start.start() : body_end.end()]
+
+    finder = RegionFinder(name)
+    try:
+        finder.feed(content)
+        finder.close()
+    except RegionFound:
+        pass
+    if finder.start is None or finder.end is None:
+        logger.debug("Livereloadish couldn't find #%s in the response", name)
+        return None
+    line_starts = [0]
+    position = content.find("\n")
+    while position > -1:
+        line_starts.append(position + 1)
+        position = content.find("\n", position + 1)
+    start = offset_of(line_starts, finder.start)
+    end = content.find(">", offset_of(line_starts, finder.end)) + 1
+    region = content[start:end]
+    templates = "".join(
+        template
+        for template in re_injected_templates.findall(content)
+        if template not in region
+    )
+    return extras + region + templates
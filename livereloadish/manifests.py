@@ -0,0 +1,106 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .registry import SharedRegistry
+
+__all__ = ["logger", "PageManifests"]
+logger = logging.getLogger(__name__)
+
+
+class PageManifests:
+    """
+    The templates and files used to render each page, keyed by the page's
+    UUID, so that the SSE connection's keep-alive pings can keep them from
+    being evicted for as long as the page is open.
+
+    Each (name, path) pair is only stored once, and pages refer to them by
+    their index; only the most recently rendered pages are kept, and pairs no
+    longer used by any of them are dropped whenever there get to be too many.
+
+    The client doesn't depend on these, being given the template names in the
+    page itself, so losing one (to eviction, or a restart) only means its files
+    aren't kept alive by the pings.
+
+    With a shared registry, each is also written there, for when the SSE
+    connection is held by a different process from the one which rendered it.
+    """
+
+    # How many pages to remember, after which the least recently used go away.
+    maxsize = 256
+    # How many (name, path) pairs to allow before dropping the unused ones.
+    maxpairs = 4096
+
+    def __init__(self, registry: Optional["SharedRegistry"] = None) -> None:
+        self.registry = registry
+        self.lock = threading.Lock()
+        self.pages: "OrderedDict[str, Tuple[Tuple[int, ...], Tuple[int, ...]]]" = (
+            OrderedDict()
+        )
+        self.ids: Dict[Tuple[str, str], int] = {}
+        self.pairs: List[Tuple[str, str]] = []
+        # How many pairs were still in use when last compacted, so that it
+        # doesn't happen on every page if they're all in use.
+        self.kept = 0
+
+    def intern(self, name: str, path: str) -> int:
+        key = (name, path)
+        try:
+            return self.ids[key]
+        except KeyError:
+            self.ids[key] = len(self.pairs)
+            self.pairs.append(key)
+            return self.ids[key]
+
+    def add(self, page: str, templates: Dict[str, str], files: Dict[str, str]) -> int:
+        if self.registry is not None:
+            self.registry.remember_page(page, templates, files)
+        with self.lock:
+            self.pages[page] = (
+                tuple(self.intern(name, path) for name, path in templates.items()),
+                tuple(self.intern(name, path) for name, path in files.items()),
+            )
+            self.pages.move_to_end(page)
+            while len(self.pages) > self.maxsize:
+                self.pages.popitem(last=False)
+            if len(self.pairs) > max(self.maxpairs, self.kept * 2):
+                self.compact()
+            return len(self.pages)
+
+    def compact(self) -> int:
+        """
+        Re-number the pairs still used by the remembered pages, forgetting the
+        rest. Must be called with the lock held.
+        """
+        pairs = self.pairs
+        self.ids = {}
+        self.pairs = []
+        for page, (templates, files) in tuple(self.pages.items()):
+            self.pages[page] = (
+                tuple(self.intern(*pairs[index]) for index in templates),
+                tuple(self.intern(*pairs[index]) for index in files),
+            )
+        self.kept = len(self.pairs)
+        logger.debug(
+            "Livereloadish kept %s of %s template/file pairs for %s pages",
+            len(self.pairs),
+            len(pairs),
+            len(self.pages),
+        )
+        return len(self.pairs)
+
+    def get(self, page: str) -> Optional[Dict[str, Dict[str, str]]]:
+        with self.lock:
+            try:
+                templates, files = self.pages[page]
+            except KeyError:
+                if self.registry is not None:
+                    return self.registry.page(page)
+                return None
+            self.pages.move_to_end(page)
+            return {
+                "templates": dict(self.pairs[index] for index in templates),
+                "files": dict(self.pairs[index] for index in files),
+            }
@@ -1,5 +1,6 @@
 import json
 import logging
+import threading
 import time
 from collections import namedtuple
 from typing import Any, Dict, TYPE_CHECKING
@@ -10,9 +11,22 @@ from django.conf import settings
 from django.core.exceptions import MiddlewareNotUsed
 from django.core.handlers.wsgi import WSGIRequest
 from django.http.response import HttpResponse, HttpResponseBase, Http404
+from django.utils.cache import patch_vary_headers
+from django.utils.html import escape
 from django.views.decorators.cache import never_cache
 from django.views.decorators.gzip import gzip_page
-from livereloadish.views import sse, js, stats
+from livereloadish.fragments import extract_fragment
+from livereloadish.timings import Timings
+from livereloadish.views import (
+    sse,
+    js,
+    stats,
+    ready,
+    visibility,
+    fingerprinted_js,
+    watcher_script,
+    watcher_script_digest,
+)
 
 if TYPE_CHECKING:
     from .apps import LiveReloadishConfig
@@ -28,13 +42,13 @@ class NamedUrlconf(namedtuple("NamedUrl", "included_patterns")):
 
 
 class LivereloadishMiddleware:
-    __slots__ = ("get_response", "process_load", "appconf")
+    __slots__ = ("get_response", "process_load", "appconf", "script_digest")
     prefix = "livereloadish"
     content_types = ("text/html", "application/xhtml+xml")
     # SSE insertion. Happens at the end of the </head> but don't worry it's marked
     # as async & defer, so it'll not block page load.
     insert_js_before = "</head>"
-    insert_js_content = f'<script type="text/javascript" data-livereloadish-url="/{prefix}/watch/?uuid={{uuid}}&process_load={{process_load}}&page_load={{page_load}}&js_load=0" src="/{{prefix}}/watcher/livereloadish.js" defer async data-turbolinks="false" data-turbolinks-eval="false"></script>\n</head>'
+    insert_js_content = f'<script type="text/javascript" data-livereloadish-url="/{prefix}/watch/?uuid={{uuid}}&process_load={{process_load}}&page_load={{page_load}}&js_load=0" src="/{{prefix}}/watcher/livereloadish.{{digest}}.js" defer async data-turbolinks="false" data-turbolinks-eval="false"></script>\n</head>'
     # When an error page (technical_404, technical_500) is shown, we want to
     # force a full page reload if they connect to the SSE, so that styles etc get
     # re-applied where they might not otherwise (eg: if I end up doing a udomdiff
@@ -48,9 +62,16 @@ class LivereloadishMiddleware:
         "</head>"
     )
     insert_templates_before = ("<!--livereloadish-page-templates-->", "</body>")
-    insert_templates_content = '<template id="livereloadish-page-templates" data-load-time="{page_load}" hidden>{templates}</template>\n{endmarker}'
+    # Only the names of the templates are needed by the client, to decide whether
+    # a change is relevant, so they're all it gets. Everything else (including
+    # the absolute paths) is kept server side, in the page manifests.
+    insert_templates_content = '<template id="livereloadish-page-templates" data-load-time="{page_load}" data-templates="{templates}" hidden></template>\n{endmarker}'
     insert_files_before = ("<!--livereloadish-page-files-->", "</body>")
-    insert_files_content = '<template id="livereloadish-page-files" data-load-time="{page_load}" hidden>{files}</template>\n{endmarker}'
+    insert_files_content = '<template id="livereloadish-page-files" data-load-time="{page_load}" hidden></template>\n{endmarker}'
+    # Sent by the client when it's only going to morph part of the page, being
+    # either "body" or the id of an element, so that only that part is sent back.
+    # The same header on the response says which part it is.
+    fragment_header = "X-Livereloadish-Fragment"
 
     def __init__(self, get_response: Any) -> None:
         if not settings.DEBUG:
@@ -61,10 +82,19 @@ class LivereloadishMiddleware:
             raise MiddlewareNotUsed("Livereloadish is in the INSTALLED_APPS")
         self.get_response = get_response
         self.process_load = time.time()
+        self.script_digest = watcher_script_digest()
+        # Compress the JS now rather than during the first page load, but off
+        # to the side, because brotli can take a few hundred milliseconds and
+        # this is on the way to serving the first request after every restart.
+        threading.Thread(
+            target=watcher_script, daemon=True, name="livereloadish-compress"
+        ).start()
 
     def __call__(self, request: WSGIRequest) -> HttpResponseBase:
         self.appconf.during_request.templates = {}
         self.appconf.during_request.files = {}
+        timings = Timings() if self.appconf.server_timing else None
+        self.appconf.during_request.timings = timings
         if request.path[0:15] == f"/{self.prefix}/" and settings.DEBUG:
             # So unfortunately it turns out that my substituting the request.urlconf
             # causes things to break if I include DebugToolbarMiddleware before OR
@@ -82,8 +112,14 @@ class LivereloadishMiddleware:
             if remainder in match_scripts:
                 prelude, sep, extension = remainder.partition(".")
                 return gzip_page(never_cache(js))(request, extension)
+            elif remainder[0:22] == "watcher/livereloadish." and remainder[-3:] == ".js":
+                return fingerprinted_js(request, remainder[22:-3])
             elif remainder in {"watch", "watch/"}:
                 return never_cache(sse)(request)
+            elif remainder in {"ready", "ready/"}:
+                return never_cache(ready)(request)
+            elif remainder in {"visibility", "visibility/"}:
+                return never_cache(visibility)(request)
             elif remainder in {"stats", "stats/"}:
                 response = never_cache(stats)(request)
                 # For some reason I have to do this here so that CommonMiddleware
@@ -101,6 +137,7 @@ class LivereloadishMiddleware:
             else:
                 raise Http404(f"Unexpected suffix under {self.prefix}")
         response = self.get_response(request)
+        started = time.perf_counter()
         # This can technically be any HttpResponseBase subtype, but mypy is dreadful and
         # because I assigned response as a name in a completely separate branch, surprise
         # it gets dumb and assumes that the types there can escape to here. They can't.
@@ -110,9 +147,22 @@ class LivereloadishMiddleware:
             self.appconf.during_request.templates,
             self.appconf.during_request.files,
         )  # type: ignore[assignment]
+        self.appconf.touch_seen(
+            (
+                *self.appconf.during_request.templates.values(),
+                *self.appconf.during_request.files.values(),
+            )
+        )
+        if timings is not None:
+            timings.add("html", time.perf_counter() - started)
+            existing = response.get("Server-Timing", "")
+            response["Server-Timing"] = (
+                f"{existing}, {timings.header()}" if existing else timings.header()
+            )
         # Empty the values ...
         del self.appconf.during_request.templates
         del self.appconf.during_request.files
+        del self.appconf.during_request.timings
         return response
 
     def insert_html(
@@ -147,6 +197,10 @@ class LivereloadishMiddleware:
 
         content = response.content.decode(response.charset)
         content_touched = False
+        # Error pages are always sent whole, because they need to force a full reload.
+        fragment = ""
+        if response.status_code < 500:
+            fragment = request.headers.get(self.fragment_header, "").strip()
 
         # I don't want to load the SSE connection for 401/403/404 etc
         # because those cannot be rectified by a CSS/JS/HTML change so the auto-reloader
@@ -168,22 +222,26 @@ class LivereloadishMiddleware:
             content_touched = True
 
         when = time.time()
+        page = uuid4()
 
-        if self.insert_js_before in content:
+        # The client asking for a fragment is already running, and the <head>
+        # isn't going to be sent back anyway.
+        if not fragment and self.insert_js_before in content:
             logger.debug("Livereloadish is being mounted for path %s", request.path)
             content = content.replace(
                 self.insert_js_before,
                 self.insert_js_content.format(
                     prefix=self.prefix,
-                    uuid=uuid4(),
+                    uuid=page,
+                    digest=self.script_digest,
                     process_load=self.process_load,
                     page_load=when,
                 ),
             )
             content_touched = True
 
-        response["X-Livereloadish-Templates"] = json.dumps(templates)
-        response["X-Livereloadish-Files"] = json.dumps(files)
+        if not fragment and request.method == "GET" and response.status_code == 200:
+            self.appconf.recent_pages.add(request)
 
         for search_fragment in self.insert_templates_before:
             if search_fragment in content:
@@ -195,7 +253,7 @@ class LivereloadishMiddleware:
                 content = content.replace(
                     search_fragment,
                     self.insert_templates_content.format(
-                        templates=response["X-Livereloadish-Templates"],
+                        templates=escape(json.dumps(list(templates))),
                         endmarker=search_fragment,
                         page_load=when,
                     ),
@@ -213,7 +271,6 @@ class LivereloadishMiddleware:
                 content = content.replace(
                     search_fragment,
                     self.insert_files_content.format(
-                        files=response["X-Livereloadish-Files"],
                         endmarker=search_fragment,
                         page_load=when,
                     ),
@@ -221,6 +278,25 @@ class LivereloadishMiddleware:
                 content_touched = True
                 break
 
+        # Partials (eg: for AJAX) with nowhere to put anything aren't pages the
+        # client will be running on, so there's no need to remember them.
+        if content_touched:
+            self.appconf.page_manifests.add(str(page), templates, files)
+            response["X-Livereloadish-Page"] = str(page)
+
+        if fragment:
+            extracted = extract_fragment(content, fragment)
+            if extracted is not None:
+                logger.debug(
+                    "Livereloadish is only sending %s for path %s", fragment, request.path
+                )
+                content = extracted
+                content_touched = True
+                response[self.fragment_header] = fragment
+                # Never to be mistaken for the whole page by anything caching it.
+                response["Cache-Control"] = "private, no-store"
+            patch_vary_headers(response, (self.fragment_header,))
+
         if content_touched:
             response.content = content
             response["Content-Length"] = len(response.content)
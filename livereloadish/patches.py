@@ -2,46 +2,80 @@ import logging
 import mimetypes
 import os
 import posixpath
+import sys
 import time
-from typing import Any, Union, Optional, TYPE_CHECKING, Tuple, List, Dict
+from typing import Any, Union, Optional, TYPE_CHECKING, Tuple, List, Dict, Iterator
 from urllib.parse import urlsplit, urlunsplit
 
 from django.apps import apps
 from django.conf import settings
 from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import StaticFilesStorage
+from django.core.exceptions import ImproperlyConfigured, SuspiciousFileOperation
 from django.core.files.storage import FileSystemStorage
 from django.core.handlers.wsgi import WSGIRequest
 from django.dispatch import receiver
 from django.http import HttpResponse, FileResponse, QueryDict, HttpResponseNotModified
-from django.template import Engine, Context, Template, NodeList, Origin
+from django.template import (
+    Engine,
+    Context,
+    Template,
+    NodeList,
+    Origin,
+    TemplateDoesNotExist,
+    engines,
+)
+from django.template.backends.django import DjangoTemplates
+from django.template.loaders.base import Loader
+from django.template.loaders.cached import Loader as CachedLoader
 from django.template.loader_tags import ExtendsNode
 from django.templatetags.static import StaticNode
 from django.utils._os import safe_join
 from django.utils.autoreload import file_changed
 from django.utils.cache import add_never_cache_headers, patch_cache_control
-from django.utils.http import parse_http_date, http_date
+from django.utils.http import parse_http_date, http_date, parse_etags
+from django.utils.module_loading import import_string
+from django.utils.safestring import SafeString, mark_safe
 from django.views import static
 from django.utils.autoreload import BaseReloader
 
+from .signals import asset_changed
+from .timings import timed, untimed
+
 if TYPE_CHECKING:
     from .apps import LiveReloadishConfig
+    from .watcher import Change
 
 logger = logging.getLogger(__name__)
 original_serve = static.serve
 original_template_compile_nodelist = Template.compile_nodelist
+original_template_render = Template.render
 original_engine_find_template = Engine.find_template
+original_engine_get_template_loaders = Engine.get_template_loaders
 original_staticnode_url = StaticNode.url
 original_extendsnode_get_parent = ExtendsNode.get_parent
 original_filesystemstorage_url = FileSystemStorage.url
+# Jinja2 takes a while to import, so these are only filled in by import_jinja2
+# if a configured template backend is going to be using it anyway.
+Jinja2Environment: Any = None
+Jinja2Template: Any = None
+original_jinja2_environment_load_template: Any = None
+original_jinja2_template_is_up_to_date: Any = None
 
 __all__ = [
     "logger",
+    "etag_from_stat",
     "do_patch_static_serve",
     "do_patch_template_compile_nodelist",
+    "do_patch_template_render",
     "do_patch_engine_find_template",
+    "do_patch_engine_get_template_loaders",
     "do_patch_staticnode_url",
     "do_patch_extendsnode_get_parent",
     "do_patch_filesystemstorage_url",
+    "import_jinja2",
+    "do_patch_jinja2_environment_load_template",
+    "do_patch_jinja2_template_is_up_to_date",
 ]
 if ".map" not in mimetypes.suffix_map:
     mimetypes.suffix_map[".map"] = ".json"
@@ -62,6 +96,87 @@ for ext in markdowns:
         mimetypes.add_type("text/markdown", ext)
 
 
+def etag_from_stat(stat: os.stat_result) -> str:
+    """
+    A strong ETag from the nanosecond mtime and the size, which unlike the
+    Last-Modified header doesn't lose anything to one second resolution.
+    """
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def etag_matches(request: WSGIRequest, etag: str) -> Optional[bool]:
+    """
+    Whether the client's If-None-Match includes the given ETag, or None if
+    the client didn't send one at all.
+    """
+    if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+    if not if_none_match:
+        return None
+    etags = parse_etags(if_none_match)
+    return "*" in etags or etag in etags
+
+
+def serve_not_modified_from_seen(
+    request: WSGIRequest,
+    path: str,
+    document_root: Optional[str] = None,
+) -> Optional[HttpResponseNotModified]:
+    """
+    Answer a conditional request for a file the watcher is already tracking
+    straight from the seen registry, before the file is opened or stat'd.
+    Returns None if it can't be answered that way, so that the file gets
+    served normally.
+    """
+    if_modified_since = request.META.get("HTTP_IF_MODIFIED_SINCE")
+    if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+    if not (if_modified_since or if_none_match) or document_root is None:
+        return None
+    try:
+        appconf: "LiveReloadishConfig" = apps.get_app_config("livereloadish")  # type: ignore[assignment]
+    except LookupError:
+        return None
+    if not appconf.watcher.is_fresh():
+        return None
+    try:
+        abspath = safe_join(document_root, posixpath.normpath(path).lstrip("/"))
+    except SuspiciousFileOperation:
+        # Let the real view deal with it.
+        return None
+    content_type, encoding = mimetypes.guess_type(abspath)
+    seen = appconf.seen.get(content_type, {}).get(abspath)  # type: ignore[arg-type]
+    if seen is None:
+        return None
+    # If-None-Match takes precedence over If-Modified-Since when both are given,
+    # and is exact where the HTTP date is only good to the second.
+    if if_none_match and seen.etag:
+        if not etag_matches(request, seen.etag):
+            return None
+    elif if_modified_since:
+        try:
+            header_mtime = parse_http_date(if_modified_since)
+        except ValueError:
+            return None
+        # This is the same comparison as django.views.static.was_modified_since
+        if int(seen.mtime) > header_mtime:
+            return None
+    else:
+        return None
+    logger.debug(
+        "Resolving HttpResponseNotModified for %s from tracked assets",
+        abspath,
+        extra={"request": request},
+    )
+    appconf.touch_seen((abspath,))
+    response = HttpResponseNotModified()
+    response["Last-Modified"] = http_date(seen.mtime)
+    if seen.etag:
+        response["ETag"] = seen.etag
+    patch_cache_control(response, no_cache=True, must_revalidate=True, max_age=0)
+    response.livereloadish_seen = True  # type: ignore[attr-defined]
+    return response
+
+
+@timed("serve")
 def patched_serve(
     request: WSGIRequest,
     path: str,
@@ -69,9 +184,19 @@ def patched_serve(
     show_indexes: bool = False,
 ) -> Union[HttpResponse, FileResponse, HttpResponseNotModified]:
     __traceback_hide__ = True
-    response: Union[HttpResponse, FileResponse, HttpResponseNotModified] = original_serve(
-        request, path, document_root, show_indexes
-    )  # type: ignore[assignment]
+    not_modified = serve_not_modified_from_seen(request, path, document_root)
+    if not_modified is not None:
+        return not_modified
+    if request.META.get("HTTP_IF_NONE_MATCH"):
+        # If-Modified-Since must be ignored when If-None-Match is given (RFC
+        # 7232 section 3.3), but the original view only knows about the former
+        # and would answer 304 for a file changed twice within the same second.
+        # The ETag is checked below instead.
+        request.META.pop("HTTP_IF_MODIFIED_SINCE", None)
+    with untimed():
+        response: Union[HttpResponse, FileResponse, HttpResponseNotModified] = original_serve(
+            request, path, document_root, show_indexes
+        )  # type: ignore[assignment]
     # Seen by another layer, skip work
     if hasattr(response, "livereloadish_seen"):
         return response
@@ -107,9 +232,12 @@ def patched_serve(
             return response
 
     mtime = 0.0
+    etag = ""
     appconf: "LiveReloadishConfig" = apps.get_app_config("livereloadish")  # type: ignore[assignment]
-    if content_type in appconf.seen:
-        mtime = os.path.getmtime(abspath)
+    if appconf.should_track(content_type, abspath):
+        stat = os.stat(abspath)
+        mtime = stat.st_mtime
+        etag = etag_from_stat(stat)
         logger.debug(
             "Adding FileResponse(%s) to tracked assets using stat syscall: %s",
             abspath,
@@ -123,6 +251,7 @@ def patched_serve(
             # We don't KNOW whether it'll require a full page reload, it's
             # just a static file. Defer it to the JS/HTML to decide.
             requires_full_reload=False,
+            etag=etag,
         )
     else:
         logger.debug(
@@ -130,6 +259,23 @@ def patched_serve(
             abspath,
             content_type,
         )
+    if etag:
+        # The original view only checks If-Modified-Since, so the file may
+        # have been opened for a client which already has it.
+        if not isinstance(response, HttpResponseNotModified) and etag_matches(
+            request, etag
+        ):
+            logger.debug(
+                "Resolving HttpResponseNotModified for %s using the ETag",
+                abspath,
+                extra={"request": request},
+            )
+            response.close()
+            last_modified = response.get("Last-Modified", None)
+            response = HttpResponseNotModified()
+            if last_modified is not None:
+                response["Last-Modified"] = last_modified
+        response["ETag"] = etag
     response.livereloadish_seen = True  # type: ignore[union-attr]
     request_mtime: Optional[Union[str, float]] = request.GET.get("livereloadish", None)
     if not request_mtime:
@@ -179,9 +325,11 @@ def do_patch_static_serve() -> bool:
     return False
 
 
+@timed("compile-nodelist")
 def patched_template_compile_nodelist(self: Template) -> NodeList:
     __traceback_hide__ = True
-    output = original_template_compile_nodelist(self)
+    with untimed():
+        output = original_template_compile_nodelist(self)
     try:
         appconf: "LiveReloadishConfig" = apps.get_app_config("livereloadish")  # type: ignore[assignment]
     except LookupError:
@@ -228,7 +376,7 @@ def patched_template_compile_nodelist(self: Template) -> NodeList:
         pass
     else:
         content_type, encoding = mimetypes.guess_type(abspath)
-        if content_type in appconf.seen:
+        if appconf.should_track(content_type, abspath):
             logger.debug(
                 "Adding Template.compile_nodelist(%s) to tracked assets using stat syscall",
                 abspath,
@@ -266,6 +414,57 @@ def do_patch_template_compile_nodelist() -> bool:
     return False
 
 
+@timed("template-render")
+def patched_template_render(self: Template, context: Context) -> SafeString:
+    """
+    Surround the output of each {% include %} (or inclusion tag) with a pair
+    of comments naming the template, so that the client can morph just the
+    parts of the page it produced when it changes, rather than the whole body.
+
+    Only HTML templates rendered with the request are annotated, as they're
+    the ones which might end up in the page; emails, text and JSON rendered
+    along the way are left as they were.
+    """
+    __traceback_hide__ = True
+    # The page's own template, and anything rendered separately from it (eg:
+    # form widgets) don't have a template bound to the context yet.
+    nested = context.template is not None
+    with untimed():
+        output = original_template_render(self, context)
+    name = self.origin.template_name
+    if not nested or not name or "--" in name:
+        return output
+    # A RequestContext, unlike the plain Context which render_to_string() uses
+    # without a request, as for most emails.
+    if getattr(context, "request", None) is None:
+        return output
+    content_type, encoding = mimetypes.guess_type(name)
+    if content_type not in ("text/html", "application/xhtml+xml"):
+        return output
+    # Only for markup; text in the middle of an attribute, or a <script>, would
+    # be broken by it.
+    stripped = output.strip()
+    if not stripped.startswith("<") or not stripped.endswith(">"):
+        return output
+    try:
+        appconf: "LiveReloadishConfig" = apps.get_app_config("livereloadish")  # type: ignore[assignment]
+        appconf.during_request.templates
+    except (LookupError, AttributeError):
+        # We're outside of the request/response cycle, or haven't got the middleware
+        return output
+    return mark_safe(f"<!--livereloadish:{name}-->{output}<!--/livereloadish:{name}-->")
+
+
+def do_patch_template_render() -> bool:
+    if not hasattr(Template.render, "livereloadish_patched"):
+        logger.debug("Patching: django.template.Template.render")
+        Template.render = patched_template_render  # type: ignore[assignment]
+        Template.render.livereloadish_patched = True  # type: ignore[attr-defined]
+        return True
+    return False
+
+
+@timed("find-template")
 def patched_engine_find_template(
     self: Engine,
     name: str,
@@ -278,7 +477,34 @@ def patched_engine_find_template(
     a new Seen data but without the requires_full_reload=True
     """
     __traceback_hide__ = True
-    template, origin = original_engine_find_template(self, name, dirs=dirs, skip=skip)
+    with untimed():
+        template, origin = original_engine_find_template(
+            self, name, dirs=dirs, skip=skip
+        )
+    try:
+        appconf: "LiveReloadishConfig" = apps.get_app_config("livereloadish")  # type: ignore[assignment]
+    except LookupError:
+        return template, origin
+    try:
+        seen_templates = appconf.during_request.templates
+    except AttributeError:
+        seen_already_during_request = False
+        # We're outside of the request/response cycle, or haven't got the middleware
+        logger.debug(
+            "Ignoring Engine.find_template(%s) for seen-during-request",
+            origin.name,
+        )
+    else:
+        seen_already_during_request = origin.template_name in seen_templates
+        # A template coming out of the cached loader won't have its nodelist
+        # compiled again, so this is the only chance to mark it as related to
+        # the request.
+        if origin.template_name and not seen_already_during_request:
+            seen_templates[origin.template_name] = origin.name
+            logger.debug(
+                "Adding Engine.find_template(%s) to seen-during-request",
+                origin.name,
+            )
     # Seen by another layer, skip work
     if hasattr(template, "livereloadish_seen"):
         return template, origin
@@ -287,33 +513,19 @@ def patched_engine_find_template(
         template.template, "livereloadish_seen"  # type: ignore[attr-defined]
     ):
         return template, origin
-    try:
-        appconf: "LiveReloadishConfig" = apps.get_app_config("livereloadish")  # type: ignore[assignment]
-    except LookupError:
-        return template, origin
     try:
         abspath = os.path.abspath(origin.name)
     except AttributeError:
         pass
     else:
-        try:
-            seen_templates = appconf.during_request.templates
-            seen_already_during_request = template.origin.template_name in seen_templates
-        except AttributeError:
-            seen_already_during_request = False
-            # We're outside of the request/response cycle, or haven't got the middleware
-            logger.debug(
-                "Ignoring Engine.find_template(%s) for seen-during-request",
-                template.origin.name,
-            )
         if seen_already_during_request:
             logger.debug(
                 "Previously seen-during-request for Engine.find_template(%s)",
-                template.origin.name,
+                origin.name,
             )
         else:
             content_type, encoding = mimetypes.guess_type(abspath)
-            if content_type in appconf.seen:
+            if appconf.should_track(content_type, abspath):
                 logger.debug(
                     "Adding Engine.find_template(%s) to tracked assets using stat syscall",
                     abspath,
@@ -356,9 +568,51 @@ def do_patch_engine_find_template() -> bool:
     return False
 
 
+def patched_engine_get_template_loaders(
+    self: Engine, template_loaders: List[Any]
+) -> List[Loader]:
+    """
+    Wrap the engine's configured loaders in the cached loader, as Django would
+    do outside of DEBUG, unless it's already being used. The watcher evicts
+    anything which changes (see evict_cached_templates) so that nothing stale
+    gets rendered.
+
+    The cached loader itself asks for its child loaders via this method, so
+    only the engine's own list of loaders is wrapped.
+    """
+    __traceback_hide__ = True
+    if template_loaders is self.loaders:
+        loader_names = {
+            loader[0] if isinstance(loader, (tuple, list)) else loader
+            for loader in template_loaders
+        }
+        if "django.template.loaders.cached.Loader" not in loader_names:
+            logger.debug(
+                "Wrapping Engine.get_template_loaders(%s) in the cached loader",
+                template_loaders,
+            )
+            # A copy, so that it's not mistaken for the engine's own list
+            # when the cached loader asks for its children.
+            template_loaders = [
+                ("django.template.loaders.cached.Loader", list(template_loaders))
+            ]
+    return original_engine_get_template_loaders(self, template_loaders)  # type: ignore[no-any-return]
+
+
+def do_patch_engine_get_template_loaders() -> bool:
+    if not hasattr(Engine.get_template_loaders, "livereloadish_patched"):
+        logger.debug("Patching: django.template.engine.Engine.get_template_loaders")
+        Engine.get_template_loaders = patched_engine_get_template_loaders  # type: ignore[assignment]
+        Engine.get_template_loaders.livereloadish_patched = True  # type: ignore[attr-defined]
+        return True
+    return False
+
+
+@timed("static-url")
 def patched_staticnode_url(self: StaticNode, context: Context) -> str:
     __traceback_hide__ = True
-    url: str = original_staticnode_url(self, context)
+    with untimed():
+        url: str = original_staticnode_url(self, context)
     scheme, netloc, path, query, fragment = urlsplit(url)
     if scheme or netloc or "livereloadish=" in query:
         return url
@@ -409,9 +663,11 @@ def do_patch_staticnode_url() -> bool:
     return False
 
 
+@timed("extends-parent")
 def patched_extendsnode_get_parent(self: ExtendsNode, context: Context) -> Any:
     __traceback_hide__ = True
-    template = original_extendsnode_get_parent(self, context)
+    with untimed():
+        template = original_extendsnode_get_parent(self, context)
     if hasattr(template, "livereloadish_seen"):
         try:
             abspath = os.path.abspath(template.origin.name)
@@ -435,6 +691,7 @@ def patched_extendsnode_get_parent(self: ExtendsNode, context: Context) -> Any:
                     existing_seen.absolute_path,
                     existing_seen.mtime,
                     requires_full_reload=True,
+                    etag=existing_seen.etag,
                 )
     return template
 
@@ -448,41 +705,127 @@ def do_patch_extendsnode_get_parent() -> bool:
     return False
 
 
+# Where finders.find() located each name, which is expensive enough (asking
+# every finder, which may mean every app's static directory) to not want to
+# do on every render.
+found_storage_files: Dict[str, str] = {}
+# The mtimes of storage files which aren't being tracked, with when they were
+# checked, so that pages full of uploads don't stat every one of them on every
+# render either.
+storage_file_mtimes: Dict[str, Tuple[float, float]] = {}
+storage_file_mtimes_max = 4096
+
+
+def find_static_file(name: str) -> Iterator[str]:
+    if name in found_storage_files:
+        yield found_storage_files[name]
+        return
+    underlying_file = finders.find(name)
+    if underlying_file is not None:
+        found_storage_files[name] = underlying_file
+        yield underlying_file
+
+
+def storage_file_candidates(storage: FileSystemStorage, name: str) -> Iterator[str]:
+    """
+    Where the file behind a storage URL might be. For static files that's
+    wherever the finders say (as that's what runserver serves, rather than
+    anything already collected) and otherwise it's the storage's own path(),
+    being where MEDIA uploads live, or where collected (and possibly hashed)
+    static files are.
+    """
+    is_static = isinstance(storage, StaticFilesStorage)
+    if is_static:
+        yield from find_static_file(name)
+    try:
+        yield storage.path(name)
+    except (
+        NotImplementedError,
+        ImproperlyConfigured,
+        SuspiciousFileOperation,
+        ValueError,
+    ):
+        pass
+    if not is_static:
+        yield from find_static_file(name)
+
+
+def storage_file_mtime(
+    storage: FileSystemStorage, name: str
+) -> Optional[Tuple[str, float]]:
+    """
+    Find the file behind a storage URL, and its mtime, for a cache-buster
+    which only changes when the file does.
+
+    If the file is being tracked and the watcher is up to date, the mtime comes
+    from the seen registry, otherwise it's stat'd at most every sleep_slow
+    seconds. Returns None if the file can't be found at all.
+    """
+    try:
+        appconf: Optional["LiveReloadishConfig"] = apps.get_app_config("livereloadish")  # type: ignore[assignment]
+    except LookupError:
+        appconf = None
+    fresh = appconf is not None and appconf.watcher.is_fresh()
+    max_age = appconf.sleep_slow if appconf is not None else 0.0
+    now = time.time()
+    for abspath in storage_file_candidates(storage, name):
+        if fresh:
+            content_type, encoding = mimetypes.guess_type(abspath)
+            seen = appconf.seen.get(content_type, {}).get(abspath)  # type: ignore[union-attr,arg-type]
+            if seen is not None:
+                return abspath, seen.mtime
+        mtime, checked = storage_file_mtimes.get(abspath, (0.0, 0.0))
+        if now - checked <= max_age:
+            return abspath, mtime
+        try:
+            mtime = os.path.getmtime(abspath)
+        except OSError:
+            storage_file_mtimes.pop(abspath, None)
+            if found_storage_files.get(name) == abspath:
+                found_storage_files.pop(name, None)
+            continue
+        if len(storage_file_mtimes) >= storage_file_mtimes_max:
+            storage_file_mtimes.clear()
+        storage_file_mtimes[abspath] = (mtime, now)
+        return abspath, mtime
+    return None
+
+
+@timed("storage-url")
 def patched_filesystemstorage_url(self: FileSystemStorage, name: str) -> str:
     __traceback_hide__ = True
-    url: str = original_filesystemstorage_url(self, name)
+    with untimed():
+        url: str = original_filesystemstorage_url(self, name)
     scheme, netloc, path, query, fragment = urlsplit(url)
     if scheme or netloc or "livereloadish=" in query:
         return url
-    qd = QueryDict(query, mutable=True)
-    underlying_file = finders.find(name)
-    if underlying_file is not None:
-        try:
-            ident = os.path.getmtime(underlying_file)
-        except FileNotFoundError:
-            ident = time.time()
-        else:
-            # And now, try and match this file to things that
-            # were loaded during "this request" (if there is one)
-            try:
-                appconf: "LiveReloadishConfig" = apps.get_app_config("livereloadish")  # type: ignore[assignment]
-                seen_files = appconf.during_request.files
-            except (LookupError, AttributeError):
-                logger.debug(
-                    "Ignoring FileSystemStorage.url(%s) for seen-during-request",
-                    name,
-                )
-            else:
-                # We've seen this file, let's try and mark it as related to a
-                # given request...
-                seen_files[name] = underlying_file
-                # seen_files[underlying_file] = name
-                logger.debug(
-                    "Adding FileSystemStorage.url(%s) to seen-during-request",
-                    name,
-                )
+    found = storage_file_mtime(self, name)
+    if found is None:
+        # Nothing to bust the cache with; leaving the URL alone at least means
+        # it's the same on every render.
+        logger.debug("Couldn't find FileSystemStorage.url(%s) for a cache-buster", name)
+        return url
+    underlying_file, ident = found
+    # And now, try and match this file to things that
+    # were loaded during "this request" (if there is one)
+    try:
+        appconf: "LiveReloadishConfig" = apps.get_app_config("livereloadish")  # type: ignore[assignment]
+        seen_files = appconf.during_request.files
+    except (LookupError, AttributeError):
+        logger.debug(
+            "Ignoring FileSystemStorage.url(%s) for seen-during-request",
+            name,
+        )
     else:
-        ident = time.time()
+        # We've seen this file, let's try and mark it as related to a
+        # given request...
+        seen_files[name] = underlying_file
+        # seen_files[underlying_file] = name
+        logger.debug(
+            "Adding FileSystemStorage.url(%s) to seen-during-request",
+            name,
+        )
+    qd = QueryDict(query, mutable=True)
     qd.setdefault("livereloadish", str(ident))
     return urlunsplit((scheme, netloc, path, qd.urlencode(), fragment))
 
@@ -496,6 +839,145 @@ def do_patch_filesystemstorage_url() -> bool:
     return False
 
 
+@timed("jinja2-load-template")
+def patched_jinja2_environment_load_template(
+    self: "Jinja2Environment", name: str, globals: Optional[Dict[str, Any]]
+) -> "Jinja2Template":
+    """
+    Every template Jinja2 gets hold of, whether directly or via extends, include
+    or import, comes through here, cached or not.
+    """
+    __traceback_hide__ = True
+    with untimed():
+        template = original_jinja2_environment_load_template(self, name, globals)
+    if template.filename is None:
+        return template
+    try:
+        appconf: "LiveReloadishConfig" = apps.get_app_config("livereloadish")  # type: ignore[assignment]
+    except LookupError:
+        return template
+    abspath = os.path.abspath(template.filename)
+    try:
+        seen_templates = appconf.during_request.templates
+    except AttributeError:
+        # We're outside of the request/response cycle, or haven't got the middleware
+        logger.debug(
+            "Ignoring Environment._load_template(%s) for seen-during-request",
+            abspath,
+        )
+    else:
+        if name not in seen_templates:
+            seen_templates[name] = abspath
+            logger.debug(
+                "Adding Environment._load_template(%s) to seen-during-request",
+                abspath,
+            )
+    # Seen by another layer, skip work
+    if hasattr(template, "livereloadish_seen"):
+        return template
+    content_type, encoding = mimetypes.guess_type(abspath)
+    if appconf.should_track(content_type, abspath):
+        logger.debug(
+            "Adding Environment._load_template(%s) to tracked assets using stat syscall",
+            abspath,
+        )
+        appconf.add_to_seen(
+            content_type,
+            name,
+            abspath,
+            os.path.getmtime(abspath),
+            # There's no ExtendsNode.get_parent equivalent to hook into for
+            # Jinja2, so defer it to the JS/HTML to decide.
+            requires_full_reload=False,
+        )
+    else:
+        logger.debug(
+            "Skipping Environment._load_template(%s) due to content type %s being un-tracked",
+            abspath,
+            content_type,
+        )
+    template.livereloadish_seen = True
+    return template
+
+
+def import_jinja2() -> bool:
+    """
+    Import Jinja2 only if one of the TEMPLATES backends needs it, which is
+    found out by importing them, as Django is going to do for the first render
+    anyway.
+    """
+    global Jinja2Environment, Jinja2Template
+    global original_jinja2_environment_load_template, original_jinja2_template_is_up_to_date
+    if Jinja2Environment is not None:
+        return True
+    for backend in settings.TEMPLATES:
+        try:
+            import_string(backend["BACKEND"])
+        except (ImportError, KeyError):
+            # Django will complain about it soon enough.
+            continue
+    if "jinja2" not in sys.modules:
+        return False
+    from jinja2 import Environment, Template as Jinja2TemplateClass
+
+    original_jinja2_environment_load_template = Environment._load_template
+    original_jinja2_template_is_up_to_date = Jinja2TemplateClass.is_up_to_date.fget
+    Jinja2Environment = Environment
+    Jinja2Template = Jinja2TemplateClass
+    return True
+
+
+def do_patch_jinja2_environment_load_template() -> bool:
+    if not import_jinja2():
+        logger.debug("Not patching jinja2.Environment._load_template, Jinja2 isn't in use")
+        return False
+    if not hasattr(Jinja2Environment, "livereloadish_patched"):
+        logger.debug("Patching: jinja2.Environment._load_template")
+        Jinja2Environment._load_template = patched_jinja2_environment_load_template
+        Jinja2Environment.livereloadish_patched = True
+        return True
+    return False
+
+
+@timed("jinja2-up-to-date")
+def patched_jinja2_template_is_up_to_date(self: "Jinja2Template") -> bool:
+    """
+    With auto_reload on (which Django turns on under DEBUG), Jinja2 asks the
+    loader whether a template is up to date every time it comes out of the
+    cache, which means a stat syscall per template per render. If the watcher
+    is keeping an eye on the file, it'll evict it from the cache when it
+    changes (see evict_jinja2_templates), so there's no need to ask.
+    """
+    __traceback_hide__ = True
+    if hasattr(self, "livereloadish_seen") and self.filename is not None:
+        try:
+            appconf: "LiveReloadishConfig" = apps.get_app_config("livereloadish")  # type: ignore[assignment]
+        except LookupError:
+            with untimed():
+                return original_jinja2_template_is_up_to_date(self)  # type: ignore[no-any-return]
+        abspath = os.path.abspath(self.filename)
+        content_type, encoding = mimetypes.guess_type(abspath)
+        if (
+            abspath in appconf.seen.get(content_type, {})  # type: ignore[arg-type]
+            and appconf.watcher.is_fresh()
+        ):
+            return True
+    with untimed():
+        return original_jinja2_template_is_up_to_date(self)  # type: ignore[no-any-return]
+
+
+def do_patch_jinja2_template_is_up_to_date() -> bool:
+    if not import_jinja2():
+        logger.debug("Not patching jinja2.Template.is_up_to_date, Jinja2 isn't in use")
+        return False
+    if not hasattr(Jinja2Template, "livereloadish_patched"):
+        logger.debug("Patching: jinja2.Template.is_up_to_date")
+        Jinja2Template.is_up_to_date = property(patched_jinja2_template_is_up_to_date)
+        Jinja2Template.livereloadish_patched = True
+        return True
+    return False
+
+
 @receiver(file_changed, dispatch_uid="livereloadish_file-changed")
 def listen_for_python_changes(
     sender: BaseReloader, file_path: Any, **kwargs: Dict[str, Any]
@@ -509,26 +991,155 @@ def listen_for_python_changes(
     except LookupError:
         return None
 
-    if content_type in appconf.seen:
+    if content_type not in appconf.seen:
+        logger.debug(
+            "Skipping listen_for_python_changes(%s) due to content type %s being un-tracked",
+            abspath,
+            content_type,
+        )
+        return None
+    existing_seen = appconf.seen[content_type].get(abspath)
+    mtime = os.path.getmtime(abspath)
+    if appconf.add_to_seen(
+        content_type,
+        abspath,
+        abspath,
+        mtime,
+        # Support the notion of whether or not a template NEEDS a hard refresh
+        # I can't do it by looking at nodelist + nodelist[0] == ExtendsNode
+        # because then things added via {% include %} would also constitute
+        # a full reload...
+        requires_full_reload=True,
+    ):
         logger.debug(
             "Adding listen_for_python_changes(%s) to tracked assets using stat syscall",
             file_path,
         )
-        appconf.add_to_seen(
-            content_type,
-            abspath,
-            abspath,
-            os.path.getmtime(abspath),
-            # Support the notion of whether or not a template NEEDS a hard refresh
-            # I can't do it by looking at nodelist + nodelist[0] == ExtendsNode
-            # because then things added via {% include %} would also constitute
-            # a full reload...
-            requires_full_reload=True,
-        )
+        file = appconf.seen[content_type][abspath]
     else:
-        logger.debug(
-            "Skipping listen_for_python_changes(%s) due to content type %s being un-tracked",
+        # Excluded by the watch rules, but the server's restarting regardless.
+        from .apps import Seen
+
+        file = Seen(abspath, abspath, os.path.basename(abspath), mtime, True)
+    if appconf.watcher.running:
+        # The watcher needs things from this module, so is imported late.
+        from .watcher import Change
+
+        logger.info(
+            "Livereloadish telling clients the server is restarting because of %s",
             abspath,
-            content_type,
+        )
+        appconf.watcher.announce_restart(
+            Change(
+                sequence=0,
+                event="restarting",
+                msg="server restarting",
+                asset_type=content_type,
+                old_time=existing_seen.mtime if existing_seen else 0,
+                new_time=mtime,
+                file=file,
+            ),
+            timeout=appconf.sleep_restart,
         )
     return None
+
+
+def cached_template_count() -> int:
+    """
+    How many templates the cached loaders (as used by cache_templates) are
+    currently holding, which the watcher needs to keep evicting as they change.
+    """
+    count = 0
+    for backend in engines.all():
+        if not isinstance(backend, DjangoTemplates):
+            continue
+        for loader in backend.engine.template_loaders:
+            if isinstance(loader, CachedLoader):
+                count += len(loader.get_template_cache)
+    return count
+
+
+@receiver(asset_changed, dispatch_uid="livereloadish_evict-cached-templates")
+def evict_cached_templates(
+    sender: Any, change: "Change", **kwargs: Dict[str, Any]
+) -> int:
+    """
+    Throw away anything the cached template loader is holding for a file which
+    the watcher says was changed or deleted, rather than the whole cache as
+    Django's own autoreloader does.
+
+    Templates which extend or include the changed one don't need evicting,
+    because {% extends %} and {% include %} look their templates up at render
+    time, and will find the cache empty.
+
+    Any template which didn't exist is also forgotten, in case the change
+    was to start using a template that's only just been created.
+    """
+    absolute_path = change.file.absolute_path
+    evicted = 0
+    for backend in engines.all():
+        if not isinstance(backend, DjangoTemplates):
+            continue
+        for loader in backend.engine.template_loaders:
+            if not isinstance(loader, CachedLoader):
+                continue
+            cache = loader.get_template_cache
+            for key, template in tuple(cache.items()):
+                if (
+                    isinstance(template, TemplateDoesNotExist)
+                    or (
+                        isinstance(template, type)
+                        and issubclass(template, TemplateDoesNotExist)
+                    )
+                    or getattr(template.origin, "name", None) == absolute_path
+                ):
+                    cache.pop(key, None)
+                    evicted += 1
+    if evicted:
+        logger.debug(
+            "Evicted %s cached templates for %s",
+            evicted,
+            change.file.relative_path,
+        )
+    return evicted
+
+
+@receiver(asset_changed, dispatch_uid="livereloadish_evict-jinja2-templates")
+def evict_jinja2_templates(
+    sender: Any, change: "Change", **kwargs: Dict[str, Any]
+) -> int:
+    """
+    Throw away anything a Jinja2 environment has cached for a file which the
+    watcher says was changed or deleted, given its own up to date checks are
+    skipped while the watcher is running.
+    """
+    if Jinja2Environment is None:
+        return 0
+    from django.template.backends.jinja2 import Jinja2
+
+    absolute_path = change.file.absolute_path
+    evicted = 0
+    for backend in engines.all():
+        if not isinstance(backend, Jinja2):
+            continue
+        cache = backend.env.cache
+        if cache is None:
+            continue
+        for key, template in tuple(cache.items()):
+            if (
+                template.filename is not None
+                and os.path.abspath(template.filename) == absolute_path
+            ):
+                try:
+                    del cache[key]
+                except KeyError:
+                    pass
+                else:
+                    evicted += 1
+    if evicted:
+        logger.debug(
+            "Evicted %s cached Jinja2 templates for %s",
+            evicted,
+            change.file.relative_path,
+        )
+    return evicted
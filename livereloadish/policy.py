@@ -0,0 +1,116 @@
+import logging
+import os
+import time
+from typing import Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .apps import LiveReloadishConfig
+
+__all__ = ["logger", "LoadPolicy"]
+logger = logging.getLogger(__name__)
+
+
+class LoadPolicy:
+    """
+    How long the watcher should sleep between scans, decided once for the
+    whole process from the state of the machine; backing off when it's running
+    low on battery, when it's busy (compiling, running tests, ...) or when
+    the scanning is itself taking up too much CPU, and scanning more often
+    when there's nothing else going on.
+
+    The battery, load average and CPU usage are only sampled every
+    sleep_sample seconds, by the watcher thread, rather than on every scan.
+    """
+
+    __slots__ = (
+        "appconf",
+        "cpus",
+        "sampled_at",
+        "thread_time",
+        "on_battery",
+        "load",
+        "cpu_share",
+    )
+
+    def __init__(self, appconf: "LiveReloadishConfig") -> None:
+        self.appconf = appconf
+        self.cpus = os.cpu_count() or 1
+        self.sampled_at = 0.0
+        self.thread_time = 0.0
+        self.on_battery = False
+        # The 1 minute load average per CPU, or None if the platform doesn't
+        # have one (ie: Windows)
+        self.load: Optional[float] = None
+        # How much of a CPU the watcher thread used since the last sample.
+        self.cpu_share = 0.0
+
+    def sample(self, now: float) -> bool:
+        """
+        Must be called from the watcher thread, as it's that thread's CPU time
+        which is measured.
+        """
+        if now - self.sampled_at < self.appconf.sleep_sample:
+            return False
+        thread_time = time.thread_time()
+        if self.sampled_at:
+            self.cpu_share = (thread_time - self.thread_time) / (now - self.sampled_at)
+        self.sampled_at = now
+        self.thread_time = thread_time
+        self.on_battery = self.battery_is_low()
+        try:
+            self.load = os.getloadavg()[0] / self.cpus
+        except (AttributeError, OSError):
+            self.load = None
+        logger.debug(
+            "Livereloadish sampled load of %s per CPU, %.3f CPU used by the watcher, on battery: %s",
+            self.load,
+            self.cpu_share,
+            self.on_battery,
+        )
+        return True
+
+    @staticmethod
+    def battery_is_low() -> bool:
+        # psutil is only imported (if it's installed) once it's needed.
+        try:
+            from psutil import sensors_battery
+        except ImportError:
+            return False
+        battery = sensors_battery()
+        return bool(
+            battery is not None
+            and battery.power_plugged is not True
+            and battery.percent <= 50
+        )
+
+    def is_busy(self) -> bool:
+        return (
+            self.load is not None and self.load >= self.appconf.load_busy
+        ) or self.cpu_share >= self.appconf.load_self
+
+    def is_idle(self) -> bool:
+        return (
+            self.load is not None
+            and self.load < self.appconf.load_idle
+            and not self.on_battery
+        )
+
+    def interval(self, scan_duration: float, file_count: int, observing: bool) -> float:
+        appconf = self.appconf
+        busy = self.is_busy()
+        if observing:
+            # Filesystem events do the waking up, polling is just a fallback
+            # in case any are missed.
+            return appconf.sleep_slow * 2 if busy else appconf.sleep_slow
+        if file_count == 0 or busy:
+            interval = appconf.sleep_slow
+        elif self.on_battery:
+            interval = appconf.sleep_quick * 2
+        elif self.is_idle():
+            interval = appconf.sleep_idle
+        else:
+            interval = appconf.sleep_quick
+        # Slow down the watcher if it starts taking too long...
+        if scan_duration >= interval:
+            return max(interval, appconf.sleep_slow)
+        return interval
@@ -0,0 +1,384 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # type: ignore[assignment]
+
+from .apps import Seen
+from .watcher import Change
+
+__all__ = ["logger", "SharedRegistry"]
+logger = logging.getLogger(__name__)
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS seen (
+        absolute_path TEXT PRIMARY KEY,
+        content_type TEXT NOT NULL,
+        relative_path TEXT NOT NULL,
+        filename TEXT NOT NULL,
+        mtime REAL NOT NULL,
+        requires_full_reload INTEGER NOT NULL,
+        etag TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS changes (
+        sequence INTEGER PRIMARY KEY AUTOINCREMENT,
+        event TEXT NOT NULL,
+        msg TEXT NOT NULL,
+        asset_type TEXT NOT NULL,
+        old_time REAL NOT NULL,
+        new_time REAL NOT NULL,
+        absolute_path TEXT NOT NULL,
+        relative_path TEXT NOT NULL,
+        filename TEXT NOT NULL,
+        mtime REAL NOT NULL,
+        requires_full_reload INTEGER NOT NULL,
+        etag TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS pages (
+        sequence INTEGER PRIMARY KEY AUTOINCREMENT,
+        page TEXT NOT NULL UNIQUE,
+        templates TEXT NOT NULL,
+        files TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS visibility (
+        sequence INTEGER PRIMARY KEY AUTOINCREMENT,
+        reqid TEXT NOT NULL UNIQUE,
+        hidden INTEGER NOT NULL,
+        relayed TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value REAL NOT NULL
+    )
+    """,
+)
+
+
+class SharedRegistry:
+    """
+    A copy of the seen registry in an SQLite database, for when there's more
+    than one process serving requests (eg: gunicorn or waitress with multiple
+    workers) so that they all know about every file any of them has seen.
+
+    Only one process at a time (whichever holds the lock on the .leader file)
+    does the scanning, and writes what it finds to the changes table; the rest
+    poll that for anything newer than they've already published to their own
+    SSE connections, which is a single indexed query rather than a stat per file.
+
+    The manifest of each page rendered, and whether each page is visible, are
+    kept here too, because the request asking about them (or saying so) may
+    not reach the process which rendered the page, or holds its SSE connection.
+    """
+
+    # How many changes to keep around for the followers to catch up on.
+    history = 1000
+    # How many page manifests to keep, across all the processes.
+    pages_history = 1000
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.local = threading.local()
+        self.leader_file: Optional[Any] = None
+        # The last change this process has published, None until it has
+        # looked for the first time, so that old changes aren't replayed.
+        self.cursor: Optional[int] = None
+        # Likewise for the last visibility change applied to this process's
+        # SSE connections.
+        self.visibility_cursor: Optional[int] = None
+
+    def connection(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared between threads by default, and
+        # each of them notices the others' commits via data_version anyway.
+        try:
+            return self.local.connection  # type: ignore[no-any-return]
+        except AttributeError:
+            pass
+        connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        for statement in SCHEMA:
+            connection.execute(statement)
+        self.local.connection = connection
+        self.local.data_version = None
+        return connection
+
+    def lead(self) -> bool:
+        """
+        Whether this process is (or has just become) the one scanning files.
+        Once taken, the lock is held until the process exits.
+        """
+        if self.leader_file is not None:
+            return True
+        if fcntl is None:
+            return True
+        leader_file = open(f"{self.path}.leader", "a")
+        try:
+            fcntl.flock(leader_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            leader_file.close()
+            return False
+        logger.info(
+            "Livereloadish process %s is now scanning files on behalf of the others",
+            os.getpid(),
+        )
+        self.leader_file = leader_file
+        return True
+
+    def remember(self, content_type: str, file: Seen) -> bool:
+        self.connection().execute(
+            """
+            INSERT INTO seen (absolute_path, content_type, relative_path, filename, mtime, requires_full_reload, etag)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (absolute_path) DO UPDATE SET
+                content_type = excluded.content_type,
+                relative_path = excluded.relative_path,
+                filename = excluded.filename,
+                mtime = excluded.mtime,
+                requires_full_reload = excluded.requires_full_reload,
+                etag = excluded.etag
+            WHERE excluded.mtime >= seen.mtime
+            """,
+            (
+                file.absolute_path,
+                content_type,
+                file.relative_path,
+                file.filename,
+                file.mtime,
+                file.requires_full_reload,
+                file.etag,
+            ),
+        )
+        return True
+
+    def forget(self, absolute_path: str) -> bool:
+        self.connection().execute(
+            "DELETE FROM seen WHERE absolute_path = ?", (absolute_path,)
+        )
+        return True
+
+    def pull_seen(self, seen: Dict[str, Dict[str, Seen]]) -> int:
+        """
+        Merge anything the other processes have seen into the given registry,
+        if anything has been written since the last time this thread looked.
+        """
+        connection = self.connection()
+        (data_version,) = connection.execute("PRAGMA data_version").fetchone()
+        if data_version == self.local.data_version:
+            return 0
+        self.local.data_version = data_version
+        merged = 0
+        for (
+            absolute_path,
+            content_type,
+            relative_path,
+            filename,
+            mtime,
+            requires_full_reload,
+            etag,
+        ) in connection.execute(
+            "SELECT absolute_path, content_type, relative_path, filename, mtime, requires_full_reload, etag FROM seen"
+        ):
+            if content_type not in seen:
+                continue
+            existing = seen[content_type].get(absolute_path)
+            if (
+                existing is None
+                or mtime > existing.mtime
+                or (requires_full_reload and not existing.requires_full_reload)
+                or (etag and not existing.etag and mtime == existing.mtime)
+            ):
+                seen[content_type][absolute_path] = Seen(
+                    relative_path,
+                    absolute_path,
+                    filename,
+                    mtime,
+                    bool(requires_full_reload),
+                    etag,
+                )
+                merged += 1
+        if merged:
+            logger.debug(
+                "Livereloadish merged %s files seen by other processes", merged
+            )
+        return merged
+
+    def push_changes(self, changes: List[Change]) -> int:
+        connection = self.connection()
+        for change in changes:
+            connection.execute(
+                """
+                INSERT INTO changes (event, msg, asset_type, old_time, new_time, absolute_path, relative_path, filename, mtime, requires_full_reload, etag)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    change.event,
+                    change.msg,
+                    change.asset_type,
+                    change.old_time,
+                    change.new_time,
+                    change.file.absolute_path,
+                    change.file.relative_path,
+                    change.file.filename,
+                    change.file.mtime,
+                    change.file.requires_full_reload,
+                    change.file.etag,
+                ),
+            )
+        (sequence,) = connection.execute("SELECT MAX(sequence) FROM changes").fetchone()
+        connection.execute(
+            "DELETE FROM changes WHERE sequence <= ?", (sequence - self.history,)
+        )
+        # The leader has already published these to its own subscribers.
+        self.cursor = sequence
+        return len(changes)
+
+    def pull_changes(self) -> List[Change]:
+        connection = self.connection()
+        if self.cursor is None:
+            (sequence,) = connection.execute(
+                "SELECT COALESCE(MAX(sequence), 0) FROM changes"
+            ).fetchone()
+            self.cursor = sequence
+            return []
+        changes = []
+        for (
+            sequence,
+            event,
+            msg,
+            asset_type,
+            old_time,
+            new_time,
+            absolute_path,
+            relative_path,
+            filename,
+            mtime,
+            requires_full_reload,
+            etag,
+        ) in connection.execute(
+            "SELECT sequence, event, msg, asset_type, old_time, new_time, absolute_path, relative_path, filename, mtime, requires_full_reload, etag FROM changes WHERE sequence > ? ORDER BY sequence",
+            (self.cursor,),
+        ):
+            self.cursor = sequence
+            changes.append(
+                Change(
+                    sequence=0,
+                    event=event,
+                    msg=msg,
+                    asset_type=asset_type,
+                    old_time=old_time,
+                    new_time=new_time,
+                    file=Seen(
+                        relative_path,
+                        absolute_path,
+                        filename,
+                        mtime,
+                        bool(requires_full_reload),
+                        etag,
+                    ),
+                )
+            )
+        return changes
+
+    def remember_page(
+        self, page: str, templates: Dict[str, str], files: Dict[str, str]
+    ) -> bool:
+        connection = self.connection()
+        cursor = connection.execute(
+            "INSERT OR REPLACE INTO pages (page, templates, files) VALUES (?, ?, ?)",
+            (page, json.dumps(templates), json.dumps(files)),
+        )
+        connection.execute(
+            "DELETE FROM pages WHERE sequence <= ?",
+            (cursor.lastrowid - self.pages_history,),
+        )
+        return True
+
+    def page(self, page: str) -> Optional[Dict[str, Dict[str, str]]]:
+        row = self.connection().execute(
+            "SELECT templates, files FROM pages WHERE page = ?", (page,)
+        ).fetchone()
+        if row is None:
+            return None
+        templates, files = row
+        return {"templates": json.loads(templates), "files": json.loads(files)}
+
+    def push_visibility(
+        self, reqid: str, hidden: bool, relayed: Tuple[str, ...] = ()
+    ) -> bool:
+        connection = self.connection()
+        cursor = connection.execute(
+            "INSERT OR REPLACE INTO visibility (reqid, hidden, relayed)"
+            " VALUES (?, ?, ?)",
+            (reqid, hidden, json.dumps(relayed)),
+        )
+        connection.execute(
+            "DELETE FROM visibility WHERE sequence <= ?",
+            (cursor.lastrowid - self.history,),
+        )
+        return True
+
+    def pull_visibility(self) -> List[Tuple[str, bool, Tuple[str, ...]]]:
+        """
+        Whichever pages have been hidden or shown since this process last
+        looked, by their reqid, in the order it happened, along with the
+        other tabs each is relaying for.
+        """
+        connection = self.connection()
+        if self.visibility_cursor is None:
+            (sequence,) = connection.execute(
+                "SELECT COALESCE(MAX(sequence), 0) FROM visibility"
+            ).fetchone()
+            self.visibility_cursor = sequence
+            return []
+        changes = []
+        for sequence, reqid, hidden, relayed in connection.execute(
+            "SELECT sequence, reqid, hidden, relayed FROM visibility"
+            " WHERE sequence > ? ORDER BY sequence",
+            (self.visibility_cursor,),
+        ):
+            self.visibility_cursor = sequence
+            changes.append((reqid, bool(hidden), tuple(json.loads(relayed))))
+        return changes
+
+    def is_hidden(self, reqid: str) -> bool:
+        row = self.connection().execute(
+            "SELECT hidden FROM visibility WHERE reqid = ?", (reqid,)
+        ).fetchone()
+        return row is not None and bool(row[0])
+
+    def touch(self) -> bool:
+        self.connection().execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('touched', ?)",
+            (time.time(),),
+        )
+        return True
+
+    def last_touched(self) -> float:
+        row = self.connection().execute(
+            "SELECT value FROM meta WHERE key = 'touched'"
+        ).fetchone()
+        return row[0] if row is not None else 0.0
+
+    def clear(self) -> bool:
+        connection = self.connection()
+        connection.execute("DELETE FROM seen")
+        connection.execute("DELETE FROM changes")
+        connection.execute("DELETE FROM pages")
+        connection.execute("DELETE FROM visibility")
+        return True
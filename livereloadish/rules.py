@@ -0,0 +1,101 @@
+import fnmatch
+import logging
+import os
+import re
+from typing import Iterable, List, Optional, Pattern
+
+from django.apps import apps
+
+__all__ = ["logger", "Matcher", "WatchRules"]
+logger = logging.getLogger(__name__)
+
+
+class Matcher:
+    """
+    Any number of rules compiled down into (at most) two regular expressions,
+    one for the absolute path and one for the content type, so that checking
+    a file is a couple of regex matches no matter how many rules there are.
+
+    Each rule is one of:
+    - "glob:*/node_modules/*" (or just "*/node_modules/*") matched against
+      the whole absolute path, where * also matches across directories.
+    - "path:/some/directory/" for anything starting with that absolute path.
+    - "app:admin" for anything within that app's directory, by label.
+    - "type:font/*" for a glob matched against the content type.
+    """
+
+    __slots__ = ("rules", "paths", "content_types")
+
+    def __init__(self, rules: Iterable[str]) -> None:
+        self.rules = tuple(rules)
+        paths: List[str] = []
+        content_types: List[str] = []
+        for rule in self.rules:
+            kind, sep, value = rule.partition(":")
+            if not sep or kind not in {"glob", "path", "app", "type"}:
+                kind, value = "glob", rule
+            if kind == "glob":
+                paths.append(fnmatch.translate(os.path.normcase(value)))
+            elif kind == "path":
+                paths.append(f"{re.escape(os.path.normcase(value))}.*")
+            elif kind == "app":
+                try:
+                    app_path = apps.get_app_config(value).path
+                except LookupError:
+                    logger.warning(
+                        "Livereloadish ignoring the %r rule, there's no app with that label",
+                        rule,
+                    )
+                    continue
+                directory = os.path.join(os.path.normcase(app_path), "")
+                paths.append(f"{re.escape(directory)}.*")
+            else:
+                content_types.append(fnmatch.translate(value))
+        self.paths = self.join(paths)
+        self.content_types = self.join(content_types)
+
+    @staticmethod
+    def join(patterns: List[str]) -> Optional[Pattern[str]]:
+        if not patterns:
+            return None
+        return re.compile("|".join(f"(?:{pattern})" for pattern in patterns), re.DOTALL)
+
+    def __bool__(self) -> bool:
+        return self.paths is not None or self.content_types is not None
+
+    def matches(self, absolute_path: str, content_type: str) -> bool:
+        if self.paths is not None and self.paths.match(
+            os.path.normcase(absolute_path)
+        ):
+            return True
+        if self.content_types is not None and self.content_types.match(content_type):
+            return True
+        return False
+
+
+class WatchRules:
+    """
+    Which of the files seen while serving and rendering get tracked at all.
+    If there are any include rules, a file has to match one of them, and then
+    must not match any of the exclude rules; anything which doesn't pass is
+    never stat'd by the watcher.
+    """
+
+    __slots__ = ("include", "exclude")
+
+    # Installed packages and frontend dependencies, to give to watch_exclude if
+    # they're not being worked on (ie: not installed with pip install -e)
+    packages = (
+        "*/node_modules/*",
+        "*/site-packages/*",
+        "*/dist-packages/*",
+    )
+
+    def __init__(self, include: Iterable[str], exclude: Iterable[str]) -> None:
+        self.include = Matcher(include)
+        self.exclude = Matcher(exclude)
+
+    def allows(self, absolute_path: str, content_type: str) -> bool:
+        if self.include and not self.include.matches(absolute_path, content_type):
+            return False
+        return not self.exclude.matches(absolute_path, content_type)
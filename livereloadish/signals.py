@@ -0,0 +1,9 @@
+from django.dispatch import Signal
+
+__all__ = ["asset_changed"]
+
+# Sent by the watcher thread for each tracked file it finds has been changed
+# or deleted, with the Change as the `change` argument, before any of the SSE
+# connections are told about it. Receivers should be quick, because nothing
+# gets pushed to the browser until they're done.
+asset_changed = Signal()
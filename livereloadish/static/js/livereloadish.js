@@ -765,6 +765,245 @@
         };
         return RelativeUrl;
     }());
+    /**
+     * Which elements (and stylesheet rules) refer to which files, by filename,
+     * so that each change is resolved with a lookup rather than the whole
+     * document being scanned with substring attribute selectors, which is slow
+     * on huge pages (admin changelists, data tables...)
+     * The elements are indexed once when the script starts, and kept up to
+     * date with a MutationObserver. The rules in each stylesheet are indexed
+     * the first time they're asked for, as there's nothing to observe them
+     * changing; a changed stylesheet is a different CSSStyleSheet anyway, and
+     * one with rules inserted or deleted since (CSS-in-JS, say) is re-indexed.
+     */
+    var AssetIndex = /** @class */ (function () {
+        function AssetIndex() {
+            this.elements = {};
+            this.keys = new WeakMap();
+            this.rules = new WeakMap();
+            this.observer = null;
+        }
+        /**
+         * Filenames are what the server sends, and what's looked for, because
+         * things may be referenced relatively rather than using {% static %}
+         */
+        AssetIndex.filenameOf = function (url) {
+            var path = url.split(/[?#]/, 1)[0];
+            var filename = path.slice(path.lastIndexOf("/") + 1);
+            try {
+                return decodeURIComponent(filename);
+            }
+            catch (e) {
+                return filename;
+            }
+        };
+        AssetIndex.filenamesInCSS = function (text) {
+            var filenames = [];
+            // Whitespace may be either side of the quotes, so it's skipped
+            // before looking for one, or url( "a.png" ) would capture a quote.
+            var urlExtractor = /url\(\s*(['"]?)(.*?)\1\s*\)/g;
+            var match;
+            while ((match = urlExtractor.exec(text)) !== null) {
+                filenames.push(AssetIndex.filenameOf(match[2]));
+            }
+            return filenames;
+        };
+        AssetIndex.filenamesFor = function (element) {
+            var filenames = [];
+            var tagName = element.tagName;
+            var href = tagName === "LINK" ? element.getAttribute("href") : (tagName === "STYLE" ? element.getAttribute("data-livereloadish-href") : null);
+            if (href) {
+                filenames.push(AssetIndex.filenameOf(href));
+            }
+            var src = tagName === "SCRIPT" || tagName === "IMG" ? element.getAttribute("src") : null;
+            if (src) {
+                filenames.push(AssetIndex.filenameOf(src));
+            }
+            var srcset = tagName === "IMG" || tagName === "SOURCE" ? element.getAttribute("srcset") : null;
+            if (srcset) {
+                for (var _i = 0, _a = srcset.split(","); _i < _a.length; _i++) {
+                    var candidate = _a[_i];
+                    var candidateHref = candidate.trim().split(/\s+/, 1)[0];
+                    if (candidateHref) {
+                        filenames.push(AssetIndex.filenameOf(candidateHref));
+                    }
+                }
+            }
+            var style = element.getAttribute("style");
+            if (style && style.indexOf("url(") > -1) {
+                filenames.push.apply(filenames, AssetIndex.filenamesInCSS(style));
+            }
+            return filenames;
+        };
+        AssetIndex.prototype.add = function (element) {
+            var filenames = AssetIndex.filenamesFor(element);
+            if (filenames.length > 0) {
+                this.keys.set(element, filenames);
+                for (var _i = 0, filenames_1 = filenames; _i < filenames_1.length; _i++) {
+                    var filename = filenames_1[_i];
+                    (this.elements[filename] = this.elements[filename] || []).push(element);
+                }
+            }
+        };
+        AssetIndex.prototype.remove = function (element) {
+            var filenames = this.keys.get(element);
+            if (filenames !== undefined) {
+                this.keys.delete(element);
+                for (var _i = 0, filenames_2 = filenames; _i < filenames_2.length; _i++) {
+                    var filename = filenames_2[_i];
+                    var elements = this.elements[filename] || [];
+                    var position = elements.indexOf(element);
+                    if (position > -1) {
+                        elements.splice(position, 1);
+                    }
+                    if (elements.length === 0) {
+                        delete this.elements[filename];
+                    }
+                }
+            }
+        };
+        AssetIndex.prototype.addTree = function (root) {
+            if (root.matches(AssetIndex.selector)) {
+                this.add(root);
+            }
+            var elements = Array.prototype.slice.call(root.querySelectorAll(AssetIndex.selector));
+            for (var _i = 0, elements_1 = elements; _i < elements_1.length; _i++) {
+                var element = elements_1[_i];
+                this.add(element);
+            }
+        };
+        AssetIndex.prototype.removeTree = function (root) {
+            this.remove(root);
+            var elements = Array.prototype.slice.call(root.getElementsByTagName("*"));
+            for (var _i = 0, elements_2 = elements; _i < elements_2.length; _i++) {
+                var element = elements_2[_i];
+                this.remove(element);
+            }
+        };
+        AssetIndex.prototype.observed = function (mutations) {
+            for (var _i = 0, mutations_1 = mutations; _i < mutations_1.length; _i++) {
+                var mutation = mutations_1[_i];
+                if (mutation.type === "attributes") {
+                    var element = mutation.target;
+                    this.remove(element);
+                    this.add(element);
+                    continue;
+                }
+                for (var i = 0; i < mutation.removedNodes.length; i++) {
+                    var node = mutation.removedNodes[i];
+                    if (node.nodeType === Node.ELEMENT_NODE) {
+                        this.removeTree(node);
+                    }
+                }
+                for (var i = 0; i < mutation.addedNodes.length; i++) {
+                    var node = mutation.addedNodes[i];
+                    if (node.nodeType === Node.ELEMENT_NODE) {
+                        this.addTree(node);
+                    }
+                }
+            }
+        };
+        AssetIndex.prototype.start = function () {
+            var _this = this;
+            if (this.observer !== null) {
+                return;
+            }
+            this.addTree(document.documentElement);
+            this.observer = new MutationObserver(function (mutations) { return _this.observed(mutations); });
+            this.observer.observe(document.documentElement, {
+                'childList': true,
+                'subtree': true,
+                'attributes': true,
+                'attributeFilter': AssetIndex.attributes,
+            });
+            console.debug(logPrefix, logFmt, "Indexed " + Object.keys(this.elements).length + " referenced filenames");
+        };
+        AssetIndex.prototype.stop = function () {
+            if (this.observer !== null) {
+                this.observer.disconnect();
+                this.observer = null;
+            }
+            this.elements = {};
+            this.keys = new WeakMap();
+            this.rules = new WeakMap();
+        };
+        /**
+         * Any elements referring to the given filename, still in the document.
+         */
+        AssetIndex.prototype.find = function (filename) {
+            if (this.observer === null) {
+                this.start();
+            }
+            // The observer's records are delivered asynchronously, so anything
+            // changed since are dealt with now rather than missed.
+            if (this.observer !== null) {
+                this.observed(this.observer.takeRecords());
+            }
+            return (this.elements[filename] || []).slice();
+        };
+        /**
+         * Any style rules in any of the document's stylesheets referring to the
+         * given filename, eg: via "background: url(...)"
+         */
+        AssetIndex.prototype.findRules = function (filename) {
+            var found = [];
+            var styleSheets = Array.prototype.slice.call(document.styleSheets);
+            for (var _i = 0, styleSheets_1 = styleSheets; _i < styleSheets_1.length; _i++) {
+                var styleSheet = styleSheets_1[_i];
+                var length_1 = AssetIndex.ruleCount(styleSheet);
+                var indexed = this.rules.get(styleSheet);
+                if (indexed === undefined || indexed.length !== length_1) {
+                    indexed = { length: length_1, index: AssetIndex.indexRules(styleSheet) };
+                    this.rules.set(styleSheet, indexed);
+                }
+                if (filename in indexed.index) {
+                    found.push.apply(found, indexed.index[filename]);
+                }
+            }
+            return found;
+        };
+        /**
+         * How many rules the stylesheet has, or -1 if they can't be read
+         * (because it's from another origin, say)
+         */
+        AssetIndex.ruleCount = function (styleSheet) {
+            try {
+                return styleSheet.cssRules.length;
+            }
+            catch (e) {
+                return -1;
+            }
+        };
+        AssetIndex.indexRules = function (styleSheet) {
+            var index = {};
+            var rules;
+            try {
+                rules = Array.prototype.slice.call(styleSheet.cssRules);
+            }
+            catch (e) {
+                console.warn(logIMG, logFmt, "Failed to read get CSSRuleList from " + styleSheet.href + ", probably it's remote and uneditable?");
+                return index;
+            }
+            for (var _i = 0, rules_1 = rules; _i < rules_1.length; _i++) {
+                var rule = rules_1[_i];
+                // Obnoxiously, the .type attribute seems to be deprecated
+                // https://developer.mozilla.org/en-US/docs/Web/API/CSSRule/type
+                // but I don't see any replacement for it? How else do I know
+                // if it's technically an instanceof CSSStyleRule
+                if (rule.type == rule.STYLE_RULE && rule instanceof CSSStyleRule && rule.cssText.indexOf("url(") > -1) {
+                    for (var _a = 0, _b = AssetIndex.filenamesInCSS(rule.cssText); _a < _b.length; _a++) {
+                        var filename = _b[_a];
+                        (index[filename] = index[filename] || []).push(rule);
+                    }
+                }
+            }
+            return index;
+        };
+        AssetIndex.selector = "link[href], style[data-livereloadish-href], script[src], img[src], img[srcset], picture > source[srcset], [style*='url(']";
+        AssetIndex.attributes = ["href", "src", "srcset", "style", "data-livereloadish-href"];
+        return AssetIndex;
+    }());
+    var assetIndex = new AssetIndex();
     var LivereloadishPageState = /** @class */ (function () {
         function LivereloadishPageState(key) {
             this.dataKey = "forms_for_" + key;
@@ -1222,11 +1461,161 @@
         }
         return '';
     };
+    /**
+     * The text of a stylesheet no longer lives at its URL once it's in a <style>
+     * element, so any relative url(...) or @import within it has to be made
+     * absolute against where it was fetched from.
+     */
+    var absoluteCSSUrls = function (text, base) {
+        var isAbsolute = /^(?:[a-z][a-z0-9+.-]*:|\/\/|#)/i;
+        return text.replace(/url\(\s*(['"]?)(.*?)\1\s*\)/g, function (fullText, quote, href) {
+            if (href === "" || isAbsolute.test(href)) {
+                return fullText;
+            }
+            return "url(" + quote + new URL(href, base).toString() + quote + ")";
+        }).replace(/@import\s+(['"])(.*?)\1/g, function (fullText, quote, href) {
+            if (isAbsolute.test(href)) {
+                return fullText;
+            }
+            return "@import " + quote + new URL(href, base).toString() + quote;
+        });
+    };
+    /**
+     * Whether swapping in the text of a stylesheet has been found not to work,
+     * in which case stylesheets are only ever replaced by link.
+     */
+    var inlineStylesBlocked = false;
+    /**
+     * Swap a <link rel="stylesheet"> (or a <style> which replaced one previously)
+     * for a <style> containing the new text, in the same place, so there's no
+     * second request for the browser to make and nothing unstyled in between.
+     * The original href is kept on it, so that it can be found again next time.
+     * If a Content-Security-Policy stops the <style> from applying, the original
+     * element is put back and null returned, and no more text swaps are tried.
+     */
+    var swapCSSText = function (element, href, text) {
+        var style = document.createElement("style");
+        for (var i = 0; i < element.attributes.length; i++) {
+            var _a = element.attributes[i], name_4 = _a.name, value = _a.value;
+            if (name_4 !== "rel" && name_4 !== "href" && name_4 !== "integrity" && name_4 !== "crossorigin") {
+                style.setAttribute(name_4, value);
+            }
+        }
+        // Browsers blank out the nonce attribute once it has been read, so the
+        // property is the only way to carry it across.
+        if (element.nonce) {
+            style.nonce = element.nonce;
+        }
+        style.setAttribute('data-livereloadish-href', href);
+        style.textContent = text;
+        var parent = element.parentNode;
+        if (parent === null) {
+            return null;
+        }
+        parent.replaceChild(style, element);
+        // A <style> blocked by the CSP never gets a stylesheet, and the check
+        // happens as soon as it's inserted.
+        if (style.sheet === null) {
+            console.debug(logCSS, logFmt, "Inline styles are blocked, probably by a Content-Security-Policy without 'unsafe-inline'; replacing " + href + " by link instead");
+            inlineStylesBlocked = true;
+            parent.replaceChild(element, style);
+            return null;
+        }
+        return style;
+    };
+    /**
+     * Changed stylesheets waiting to be fetched and swapped in, keyed by filename,
+     * so that several changing at once (eg: a preprocessor writing more than one
+     * output) are fetched in parallel and applied together, costing the browser
+     * a single style recalculation. Only one batch is fetched at a time.
+     */
+    var pendingCSS = {};
+    var pendingCSSTimer = null;
+    var pendingCSSInFlight = false;
+    var pendingCSSDelay = 20;
+    var schedulePendingCSS = function () {
+        if (pendingCSSTimer === null && !pendingCSSInFlight) {
+            pendingCSSTimer = setTimeout(flushPendingCSS, pendingCSSDelay);
+        }
+    };
+    var flushPendingCSS = function () {
+        pendingCSSTimer = null;
+        var elements = [];
+        var messages = [];
+        for (var filename in pendingCSS) {
+            var msg = pendingCSS[filename];
+            delete pendingCSS[filename];
+            // On the off-chance files are linked relatively rather than root-relative
+            // using {% static %} we look at the file NAME and potentially replace
+            // more files than necessary, instead of fewer than hoped.
+            for (var _i = 0, _a = assetIndex.find(filename); _i < _a.length; _i++) {
+                var element = _a[_i];
+                if (element.matches("link[rel=stylesheet]:not([data-no-reload]):not([data-pending-removal]):not([up-keep]), style[data-livereloadish-href]:not([data-no-reload]):not([up-keep])")) {
+                    elements.push(element);
+                    messages.push(msg);
+                }
+            }
+        }
+        if (elements.length === 0) {
+            return;
+        }
+        var hrefs = elements.map(function (element) { return element.getAttribute('data-livereloadish-href') || element.href; });
+        var texts = hrefs.map(function (href, i) {
+            var newHref = new RelativeUrl(href, document.location.origin).changeLivereloadishValue(messages[i].new_time).toString();
+            return window.fetch(newHref, {
+                'credentials': 'same-origin',
+                'cache': 'no-store',
+            }).then(function (response) {
+                if (!response.ok) {
+                    throw new TypeError(response.status + " (" + response.statusText + ")");
+                }
+                return response.text();
+            }).then(function (text) { return absoluteCSSUrls(text, new URL(newHref, document.location.href).toString()); }, function (err) {
+                console.debug(logCSS, logFmt, "Failed to fetch the text of " + newHref + "; " + err);
+                return null;
+            });
+        });
+        pendingCSSInFlight = true;
+        Promise.all(texts).then(function (results) {
+            // Everything is swapped within the same task, so the browser only
+            // recalculates styles once for the whole batch.
+            for (var i = 0; i < elements.length; i++) {
+                var element = elements[i];
+                var text = results[i];
+                if (element.parentNode === null) {
+                    continue;
+                }
+                if (text !== null && !inlineStylesBlocked) {
+                    console.debug(logCSS, logFmt, "Swapping in the new text of " + hrefs[i] + " in-place");
+                    if (swapCSSText(element, hrefs[i], text) === null && element instanceof HTMLLinkElement) {
+                        replaceCSSFile(element, messages[i], document.location.origin);
+                    }
+                }
+                else if (element instanceof HTMLLinkElement) {
+                    replaceCSSFile(element, messages[i], document.location.origin);
+                }
+                else {
+                    console.error(logCSS, logFmt, "Couldn't get the new text of " + hrefs[i] + ", leaving it as it was");
+                }
+            }
+        }).catch(function (err) {
+            console.error(logCSS, logFmt, "An error occurred swapping in stylesheets; " + err);
+        }).then(function () {
+            pendingCSSInFlight = false;
+            if (Object.keys(pendingCSS).length > 0) {
+                schedulePendingCSS();
+            }
+        });
+    };
     /**
      * Replaces each <link rel="stylesheet" href="..."> where the href matches an update
-     * notification. To avoid having a Flash-of-Unstyled-Content (how retro), it does
-     * so by adding a _new_ link element and deleting the old one when the new one
-     * has loaded or errored.
+     * notification. The new text is fetched once and swapped in as a <style> element
+     * in the same place, batched with any other stylesheets changing at the same time.
+     * If the page has <meta name="livereloadish-css-strategy" content="link"> (say,
+     * because a Content-Security-Policy forbids inline styles), or swapping in the
+     * text has already turned out to be blocked, it instead does so by adding a _new_
+     * link element and deleting the old one when the new one has loaded or errored,
+     * to avoid having a Flash-of-Unstyled-Content (how retro).
      */
     var cssStrategy = function (msg) {
         var file = msg.info.relative_path;
@@ -1236,15 +1625,18 @@
             console.debug(logCSS, logFmt, "Meta tag suggested that this must do a full reload, because " + file + " changed");
             return refreshStrategy(msg);
         }
-        // On the off-chance files are linked relatively rather than root-relative
-        // using {% static %} we look at the file NAME and potentially replace
-        // more files than necessary, instead of fewer than hoped.
-        var reloadableLinkElements = document.querySelectorAll("link[rel=stylesheet][href*=\"" + filename + "\"]:not([data-no-reload]):not([data-pending-removal]):not([up-keep])");
-        var linkElements = Array.prototype.slice.call(reloadableLinkElements);
-        for (var _i = 0, linkElements_1 = linkElements; _i < linkElements_1.length; _i++) {
-            var linkElement = linkElements_1[_i];
-            replaceCSSFile(linkElement, msg, origin);
+        var documentSaysLink = document.querySelector("meta[name='livereloadish-css-strategy'][content='link']");
+        if (documentSaysLink || inlineStylesBlocked) {
+            for (var _i = 0, _a = assetIndex.find(filename); _i < _a.length; _i++) {
+                var element = _a[_i];
+                if (element.matches("link[rel=stylesheet]:not([data-no-reload]):not([data-pending-removal]):not([up-keep])")) {
+                    replaceCSSFile(element, msg, origin);
+                }
+            }
+            return;
         }
+        pendingCSS[filename] = msg;
+        schedulePendingCSS();
     };
     /**
      * Forces the current URL to be reloaded in the browser. Used as a fallback elsewhere,
@@ -1289,6 +1681,99 @@
      * obeys previous decisions.
      */
     var promptDecisions = {};
+    /**
+     * When templates are annotated (see `annotate_templates` on the AppConfig) the
+     * output of each {% include %} sits between a pair of comments naming it, in
+     * the same parent element. Finds the outermost such pairs for a template.
+     * Returns null if they're not balanced, in which case they can't be trusted.
+     */
+    var templateBoundaries = function (doc, name) {
+        var walker = doc.createTreeWalker(doc.body, NodeFilter.SHOW_COMMENT);
+        var boundaries = [];
+        var opened = [];
+        var node;
+        while ((node = walker.nextNode()) !== null) {
+            if (node.nodeValue === "livereloadish:" + name) {
+                opened.push(node);
+            }
+            else if (node.nodeValue === "/livereloadish:" + name) {
+                var start = opened.pop();
+                if (start === undefined || start.parentNode !== node.parentNode) {
+                    return null;
+                }
+                if (opened.length === 0) {
+                    boundaries.push([start, node]);
+                }
+            }
+        }
+        return opened.length === 0 ? boundaries : null;
+    };
+    var nodesBetween = function (start, end) {
+        var nodes = [];
+        for (var node = start.nextSibling; node !== null && node !== end; node = node.nextSibling) {
+            nodes.push(node);
+        }
+        return nodes;
+    };
+    /**
+     * Morph only the parts of the page which the changed template rendered,
+     * so that the time taken is proportional to the size of the template
+     * rather than the whole document. Returns false without touching anything
+     * if the page doesn't have matching boundaries for it.
+     */
+    var morphTemplateBoundaries = function (incoming, name) {
+        var _a, _b;
+        var currentBoundaries = templateBoundaries(document, name);
+        var incomingBoundaries = templateBoundaries(incoming, name);
+        if (currentBoundaries === null || incomingBoundaries === null || currentBoundaries.length === 0 || currentBoundaries.length !== incomingBoundaries.length) {
+            return false;
+        }
+        var _loop_1 = function (i) {
+            var _c = currentBoundaries[i], start = _c[0], end = _c[1];
+            var currentNodes = nodesBetween(start, end);
+            var incomingNodes = nodesBetween(incomingBoundaries[i][0], incomingBoundaries[i][1]);
+            var sameShape = currentNodes.length === incomingNodes.length && currentNodes.every(function (node, j) { return node.nodeName === incomingNodes[j].nodeName; });
+            if (sameShape) {
+                for (var j = 0; j < currentNodes.length; j++) {
+                    if (currentNodes[j].nodeType === Node.ELEMENT_NODE) {
+                        morphdom(currentNodes[j], incomingNodes[j], {});
+                    }
+                    else if (currentNodes[j].nodeValue !== incomingNodes[j].nodeValue) {
+                        currentNodes[j].nodeValue = incomingNodes[j].nodeValue;
+                    }
+                }
+            }
+            else {
+                for (var _i = 0, currentNodes_1 = currentNodes; _i < currentNodes_1.length; _i++) {
+                    var node = currentNodes_1[_i];
+                    (_a = node.parentNode) === null || _a === void 0 ? void 0 : _a.removeChild(node);
+                }
+                for (var _d = 0, incomingNodes_1 = incomingNodes; _d < incomingNodes_1.length; _d++) {
+                    var node = incomingNodes_1[_d];
+                    (_b = end.parentNode) === null || _b === void 0 ? void 0 : _b.insertBefore(node, end);
+                }
+            }
+        };
+        for (var i = 0; i < currentBoundaries.length; i++) {
+            _loop_1(i);
+        }
+        return true;
+    };
+    /**
+     * Swap the injected <template> elements for those of the incoming page, when
+     * they weren't within whatever got morphed.
+     */
+    var replaceInjectedTemplates = function (incoming, morphed) {
+        var _a;
+        for (var _i = 0, _b = ["livereloadish-page-templates", "livereloadish-page-files"]; _i < _b.length; _i++) {
+            var injectedId = _b[_i];
+            var currentInjected = document.getElementById(injectedId);
+            var newInjected = incoming.getElementById(injectedId);
+            if (currentInjected !== null && newInjected !== null && (morphed === null || !morphed.contains(currentInjected))) {
+                (_a = currentInjected.parentNode) === null || _a === void 0 ? void 0 : _a.replaceChild(newInjected, currentInjected);
+            }
+        }
+    };
     /**
      * Refresh the page because a Django template was noticed as changing.
      * If the Django monkeypatches say that it was a _root_ template which changed,
@@ -1307,7 +1792,7 @@
         var file = msg.info.relative_path;
         // Check the list of Django template files seen during this request, hopefully.
         var seenTemplatesExists = document.querySelector("template[id=\"livereloadish-page-templates\"]");
-        var seenTemplates = {};
+        var seenTemplates = [];
         // Capture when the <template id="livereloadish-page-templates"></template> element
         // was injected into the response, and then after playing a body mutation,
         // check if it has changed.
@@ -1324,9 +1809,10 @@
             }
         };
         if (seenTemplatesExists) {
-            seenTemplates = JSON.parse((_b = seenTemplatesExists.content.textContent) !== null && _b !== void 0 ? _b : "{}");
+            // Only the names; the paths are kept server side.
+            seenTemplates = JSON.parse((_b = seenTemplatesExists.dataset.templates) !== null && _b !== void 0 ? _b : "[]");
         }
-        if (!(file in seenTemplates)) {
+        if (seenTemplates.indexOf(file) === -1) {
             // If it doesn't look related to this page, prompt the user to reload
             // and if they choose not to, ignore subsequent changes to the file.
             if (file in promptDecisions && promptDecisions[file] === false) {
@@ -1414,12 +1900,21 @@
             }
         }
         else if (documentReloadStyle === "diff" || documentReloadStyle === "auto") {
-            console.debug(logPage, logFmt, "Reloading the body content via udomdiff, because " + file + " changed");
+            // Only the body (or the element given by id in the meta tag) needs
+            // sending back, rather than the server injecting everything into
+            // a whole page for most of it to be thrown away.
+            var documentFragmentTag = document.querySelector("meta[name='livereloadish-page-fragment'][content]");
+            var requestedFragment = (documentFragmentTag === null || documentFragmentTag === void 0 ? void 0 : documentFragmentTag.content.trim()) || "body";
+            var receivedFragment_1 = "";
+            console.debug(logPage, logFmt, "Reloading the " + requestedFragment + " content via udomdiff, because " + file + " changed");
             var fetchResponse = window.fetch(url.toString(), {
                 'mode': 'same-origin',
                 'credentials': 'same-origin',
                 'cache': 'reload',
                 'redirect': 'error',
+                'headers': {
+                    'X-Livereloadish-Fragment': requestedFragment,
+                },
             });
             fetchResponse.then(function (response) {
                 if (response.status > 300 && response.status < 400) {
@@ -1428,6 +1923,7 @@
                 else if (response.status > 500) {
                     throw new TypeError("Stop due to Server error: " + response.status + " (" + response.statusText + ")");
                 }
+                receivedFragment_1 = response.headers.get('X-Livereloadish-Fragment') || "";
                 return response.text();
             }).then(function (body) {
                 console.debug(logPage, logFmt, "Received the body content, replacing via udomdiff, because " + file + " changed");
@@ -1437,8 +1933,25 @@
                     console.debug(logPage, logFmt, "Meta tag on the incoming page suggested that this must be a full reload, because " + file + " changed");
                     return refreshStrategy(msg);
                 }
-                // noinspection XHTMLIncompatabilitiesJS
-                morphdom(document.body, fragment.body, {});
+                if ((receivedFragment_1 === "" || receivedFragment_1 === "body") && morphTemplateBoundaries(fragment, file)) {
+                    console.debug(logPage, logFmt, "Morphed only the parts of the page rendered by " + file);
+                    replaceInjectedTemplates(fragment, null);
+                }
+                else if (receivedFragment_1 === "" || receivedFragment_1 === "body") {
+                    // noinspection XHTMLIncompatabilitiesJS
+                    morphdom(document.body, fragment.body, {});
+                }
+                else {
+                    var currentRegion = document.getElementById(receivedFragment_1);
+                    var newRegion = fragment.getElementById(receivedFragment_1);
+                    if (currentRegion === null || newRegion === null) {
+                        console.debug(logPage, logFmt, "Couldn't find #" + receivedFragment_1 + " in both the current and incoming page; must do a full reload, because " + file + " changed");
+                        return refreshStrategy(msg);
+                    }
+                    morphdom(currentRegion, newRegion, {});
+                    // The injected templates are sent alongside the element if they're not within it.
+                    replaceInjectedTemplates(fragment, currentRegion);
+                }
                 if (fragment.title != document.title) {
                     console.debug(logPage, logFmt, "Updated the document title, because " + file + " changed");
                     document.title = fragment.title;
@@ -1448,7 +1961,8 @@
                 // May cause a FOUC. May need to be hoisted to a separate function to
                 // allow swup/unpoly/turbolinks support, if possible?
                 var newHeadStyles = Array.prototype.slice.call(fragment.querySelectorAll("head style"));
-                var previousHeadStyles = Array.prototype.slice.call(document.querySelectorAll("head style"));
+                // Those which replaced a <link> are left alone, as the <link> isn't coming back.
+                var previousHeadStyles = Array.prototype.slice.call(document.querySelectorAll("head style:not([data-livereloadish-href])"));
                 if (previousHeadStyles.length > 0 || newHeadStyles.length > 0) {
                     for (var _i = 0, newHeadStyles_1 = newHeadStyles; _i < newHeadStyles_1.length; _i++) {
                         var headStyle = newHeadStyles_1[_i];
@@ -1497,8 +2011,7 @@
         // Reload anything matching the file NAME rather than the file PATH
         // in case items are referenced relatively rather than using {% static %}
         // or whatever. This shouldn't happen often, but can.
-        var possiblyReloadableScriptElements = document.querySelectorAll("script[src*=\"" + filename + "\"]");
-        var scriptElements = Array.prototype.slice.call(possiblyReloadableScriptElements);
+        var scriptElements = assetIndex.find(filename).filter(function (element) { return element.tagName === "SCRIPT"; });
         for (var _i = 0, scriptElements_1 = scriptElements; _i < scriptElements_1.length; _i++) {
             var scriptElement = scriptElements_1[_i];
             var reloadable = scriptElement.dataset.reloadable;
@@ -1551,8 +2064,12 @@
         // We look at the file NAME rather than PATH because it may be referenced
         // relatively (though unlikely) and it's easier to reload MORE images
         // than to accidentally skip one which SHOULD be caught.
-        var possiblyReloadableImageElements = document.querySelectorAll("img[src*=\"" + filename + "\"], img[srcset*=\"" + filename + "\"], picture > source[srcset*=\"" + filename + "\"]");
-        var imageElements = Array.prototype.slice.call(possiblyReloadableImageElements);
+        var referringElements = assetIndex.find(filename);
+        var imageElements = referringElements.filter(function (element) {
+            var isImage = element.tagName === "IMG" || (element.tagName === "SOURCE" && element.parentElement !== null && element.parentElement.tagName === "PICTURE");
+            // It may only be here because of a background in its style attribute.
+            return isImage && ((element.getAttribute("src") || "").indexOf(filename) > -1 || (element.getAttribute("srcset") || "").indexOf(filename) > -1);
+        });
         var totalReplacements = [];
         for (var _i = 0, imageElements_1 = imageElements; _i < imageElements_1.length; _i++) {
             var imageElement = imageElements_1[_i];
@@ -1564,8 +2081,7 @@
         // Can't say I care about border images, so we'll only look for backgrounds...
         // Note that we could see items from document.images in here, because they could
         // have placeholder backgrounds...
-        var inlineStyles = document.querySelectorAll("[style*=\"background\"][style*=\"" + filename + "\"]");
-        var imageStyleElements = Array.prototype.slice.call(inlineStyles);
+        var imageStyleElements = referringElements.filter(function (element) { return element.hasAttribute("style"); });
         for (var _a = 0, imageStyleElements_1 = imageStyleElements; _a < imageStyleElements_1.length; _a++) {
             var imageElement = imageStyleElements_1[_a];
             // We use the file NAME rather than the file PATH because the  text
@@ -1578,33 +2094,15 @@
                 }
             }
         }
-        var styleSheets = Array.prototype.slice.call(document.styleSheets);
-        for (var _b = 0, styleSheets_1 = styleSheets; _b < styleSheets_1.length; _b++) {
-            var styleSheet = styleSheets_1[_b];
-            var rules = void 0;
-            try {
-                rules = Array.prototype.slice.call(styleSheet.cssRules);
-            }
-            catch (e) {
-                console.warn(logIMG, logFmt, "Failed to read get CSSRuleList from " + styleSheet.href + ", probably it's remote and uneditable?");
-                continue;
-            }
-            for (var _c = 0, rules_1 = rules; _c < rules_1.length; _c++) {
-                var rule = rules_1[_c];
-                // Obnoxiously, the .type attribute seems to be deprecated
-                // https://developer.mozilla.org/en-US/docs/Web/API/CSSRule/type
-                // but I don't see any replacement for it? How else do I know
-                // if it's technically an instanceof CSSStyleRule
-                if (rule.type == rule.STYLE_RULE) {
-                    // We use the file NAME rather than the file PATH because the
-                    // text value may be relative to the page or whatever, and
-                    // thus not contain /the/full/path.jpg
-                    if (rule.cssText.indexOf("background") > -1 && rule instanceof CSSStyleRule && rule.style.backgroundImage.indexOf(filename) > -1) {
-                        var newHref = replaceImageInStyle(rule, msg, origin);
-                        if (newHref !== "") {
-                            totalReplacements.push(newHref);
-                        }
-                    }
+        for (var _b = 0, _c = assetIndex.findRules(filename); _b < _c.length; _b++) {
+            var rule = _c[_b];
+            // We use the file NAME rather than the file PATH because the
+            // text value may be relative to the page or whatever, and
+            // thus not contain /the/full/path.jpg
+            if (rule.style.backgroundImage.indexOf(filename) > -1) {
+                var newHref = replaceImageInStyle(rule, msg, origin);
+                if (newHref !== "") {
+                    totalReplacements.push(newHref);
                 }
             }
         }
@@ -1716,8 +2214,11 @@
      * reload strategies being used. When a user navigates to a different tab,
      * swap to using the background queue to replay when they come back.
      * When they come back to the tab, replay each unique file and drain the queue.
+     * Either way, let the server know, so it can stop scanning while nobody's
+     * looking and send everything that changed in the meantime when they are.
      */
     var switchStrategies = function (_event) {
+        reportVisibility(false);
         if (document.visibilityState === "hidden") {
             activeReloadStrategies = queuedUpReloadStrategies;
             console.debug(logQueue, logFmt, "Switched reloaders until page is visible again");
@@ -1725,8 +2226,12 @@
         else {
             activeReloadStrategies = reloadStrategies;
             console.debug(logQueue, logFmt, "Switched reloaders back to defaults because page became visible");
+            if (restartedWhileHidden !== null) {
+                // The page is about to be reloaded anyway.
+                return serverRestarted(restartedWhileHidden);
+            }
             var replayCount = Object.keys(queuedUp).length;
-            if (evtSource === null) {
+            if (evtSource === null && !isFollowing) {
                 if (errorCount >= maxErrors) {
                     console.debug(logQueue, logFmt, "It looks like the server may have gone away for too long, so you'll probably need to refresh");
                 }
@@ -1762,6 +2267,9 @@
             clearTimeout(errorTimer);
         }
         errorCount = 0;
+        // The server carries over whatever it was last told about this page,
+        // which may be stale after a reconnect (or a restart), so say so again.
+        reportVisibility(true);
     };
     /**
      * If the server goes away temporarily (ie: during autoreload restart), try
@@ -1780,7 +2288,7 @@
                 // Wait between 1-3 seconds before retrying.
                 var timeout = Math.max(1000, Math.round(3000 * Math.random()));
                 console.debug(logPrefix, logFmt, "Waiting for " + timeout + "ms to restart SSE connection");
-                errorTimer = setTimeout(livereloadishSetup, timeout);
+                errorTimer = setTimeout(connectEventSource, timeout);
             }
             else {
                 console.error(logPrefix, logFmt, "Cancelling SSE connection attempts after " + errorCount + " retries. Manually reload the page...");
@@ -1795,6 +2303,78 @@
         console.debug(logPrefix, logFmt, "Server asked for a reconnect");
         return connectionErrored(_event);
     };
+    var restartTimer = null;
+    var maxRestartWait = 30000;
+    /**
+     * The change which restarted the server while this tab was in the background,
+     * to be dealt with (by serverRestarted) once it's visible again.
+     */
+    var restartedWhileHidden = null;
+    /**
+     * The server has come back after restarting, and is known to be ready, so
+     * there's no point asking whether the change was related (it's Python, so it
+     * never is as far as the page's templates go) or waiting for a reconnect.
+     */
+    var serverRestarted = function (msg) {
+        restartedWhileHidden = null;
+        return refreshStrategy(msg);
+    };
+    /**
+     * Django's autoreloader is about to restart the server because of a change
+     * to some Python, and it has told us so just before going away. Rather than
+     * finding out by way of the connection dropping and retrying every few
+     * seconds, keep asking the server whether it's back, quickly at first, and
+     * carry on as if it was any other change the moment it is.
+     */
+    var restartRequested = function (event) {
+        var msg = JSON.parse(event.data);
+        console.debug(logPython, logFmt, "Server is restarting because " + msg.info.relative_path + " changed, waiting for it to come back");
+        if (evtSource !== null) {
+            evtSource.close();
+            evtSource = null;
+        }
+        if (errorTimer !== null) {
+            clearTimeout(errorTimer);
+            errorTimer = null;
+        }
+        if (restartTimer !== null) {
+            clearTimeout(restartTimer);
+        }
+        var readyUrl = new URL("../ready/", new URL(livereloadishUrl, document.location.href)).toString();
+        var started = new Date().getTime();
+        var delay = 50;
+        var probe = function () {
+            restartTimer = null;
+            window.fetch(readyUrl, {
+                'mode': 'same-origin',
+                'credentials': 'same-origin',
+                'cache': 'no-store',
+            }).then(function (response) { return response.ok; }, function (_error) { return false; }).then(function (isReady) {
+                var waited = new Date().getTime() - started;
+                if (isReady) {
+                    console.debug(logPython, logFmt, "Server came back after " + waited + "ms");
+                    if (!isFollowing) {
+                        connectEventSource();
+                    }
+                    // If the tab is in the background, this'll get dealt
+                    // with when it comes back.
+                    if (activeReloadStrategies === reloadStrategies) {
+                        return serverRestarted(msg);
+                    }
+                    console.debug(logQueue, logFmt, "Deferring the reload until the page is visible again");
+                    restartedWhileHidden = msg;
+                }
+                else if (waited >= maxRestartWait) {
+                    console.error(logPython, logFmt, "Giving up on waiting for the server to come back, after " + waited + "ms trying");
+                }
+                else {
+                    delay = Math.min(delay * 2, 1000);
+                    restartTimer = setTimeout(probe, delay);
+                }
+            });
+        };
+        restartTimer = setTimeout(probe, delay);
+    };
     /**
      * The server has the opportunity to ask the client to go away permanently,
      * this just sets the number of times it has attempted to reconnect to a
@@ -1839,6 +2419,206 @@
             console.error(logPrefix, logFmt, fileName + " has been moved or deleted, page may need manually reloading");
         }
     };
+    /**
+     * Only one tab per browser holds an SSE connection open, and relays what it's
+     * sent to the others over a BroadcastChannel. Otherwise a handful of open tabs
+     * uses up the browser's connection limit for the origin (6, under HTTP/1.1)
+     * and a server thread apiece.
+     * Whichever tab gets the Web Lock is the leader, and when it goes away (and
+     * the lock is released) one of the others takes over.
+     */
+    var relayChannelName = "livereloadish";
+    var leaderLockName = "livereloadish-sse";
+    var relay = null;
+    var leadershipAbort = null;
+    var releaseLeadership = null;
+    var isFollowing = false;
+    /**
+     * The uuid of each of the following tabs, and whether it's visible; the leader
+     * only tells the server its page is hidden once it and all of these are, and
+     * passes the uuids on so the files they use are kept alive along with its own.
+     * Every tab keeps track, so that whichever takes over as the leader already
+     * knows about any changes made while there wasn't one.
+     */
+    var followers = {};
+    var reportedHidden = false;
+    var reportedRelayed = "";
+    var pageUuid = function () {
+        var _a;
+        return (_a = new URL(livereloadishUrl, document.location.href).searchParams.get("uuid")) !== null && _a !== void 0 ? _a : "";
+    };
+    var everyTabHidden = function () {
+        if (document.visibilityState !== "hidden") {
+            return false;
+        }
+        for (var key in followers) {
+            if (followers[key]) {
+                return false;
+            }
+        }
+        return true;
+    };
+    /**
+     * Followers tell the leading tab whether they're visible, and the tab holding
+     * the SSE connection tells the server, when that or the set of followers
+     * changes (or when forced).
+     * Uses navigator.sendBeacon so that it still gets sent as the page goes away.
+     */
+    var reportVisibility = function (force) {
+        if (relay !== null && isFollowing) {
+            var relayed_1 = {
+                type: "visibility",
+                data: JSON.stringify({ uuid: pageUuid(), hidden: document.visibilityState === "hidden" }),
+            };
+            relay.postMessage(relayed_1);
+            return;
+        }
+        if (evtSource === null) {
+            return;
+        }
+        var hidden = everyTabHidden();
+        var relayed = Object.keys(followers).sort().join(",");
+        if (hidden === reportedHidden && relayed === reportedRelayed && !force) {
+            return;
+        }
+        reportedHidden = hidden;
+        reportedRelayed = relayed;
+        var visibilityUrl = new URL("../visibility/", new URL(livereloadishUrl, document.location.href));
+        visibilityUrl.search = "?uuid=" + pageUuid() + "&hidden=" + (hidden ? "1" : "0") + "&relayed=" + relayed;
+        console.debug(logPrefix, logFmt, "Telling the server this page is " + (hidden ? "hidden" : "visible"));
+        if (typeof navigator.sendBeacon === "function") {
+            navigator.sendBeacon(visibilityUrl.toString());
+        }
+        else {
+            window.fetch(visibilityUrl.toString(), {
+                'method': 'POST',
+                'mode': 'same-origin',
+                'credentials': 'same-origin',
+                'keepalive': true,
+            }).catch(function (_error) { return undefined; });
+        }
+    };
+    /**
+     * A following tab was shown or hidden, or is going away.
+     */
+    var followerVisibilityChanged = function (event) {
+        var msg = JSON.parse(event.data);
+        if (msg.gone) {
+            delete followers[msg.uuid];
+        }
+        else {
+            followers[msg.uuid] = !msg.hidden;
+        }
+        if (!isFollowing) {
+            reportVisibility(false);
+        }
+    };
+    /**
+     * A tab has just become the leader, and needs to know which of the others
+     * are visible.
+     */
+    var visibilityRequested = function (_event) {
+        if (isFollowing) {
+            reportVisibility(false);
+        }
+    };
+    /**
+     * The events worth passing on to the other tabs; connection state is
+     * only of interest to the leader. The visibility ones go the other way,
+     * from the followers to the leader.
+     */
+    var relayedEventHandlers = {
+        "assets_change": assetHasChanged,
+        "assets_delete": assetHasDeleted,
+        "restarting": restartRequested,
+        "visibility": followerVisibilityChanged,
+        "visibility-query": visibilityRequested,
+    };
+    /**
+     * Bound to the leader's EventSource before the normal handlers, so the other
+     * tabs get told before anything (eg: a confirm dialog) might block.
+     */
+    var relayEvent = function (event) {
+        if (relay !== null) {
+            var relayed = { type: event.type, data: event.data };
+            relay.postMessage(relayed);
+        }
+    };
+    /**
+     * Handle an event from the leading tab as if this tab's own EventSource
+     * had been sent it.
+     */
+    var relayedEventReceived = function (event) {
+        var relayed = event.data;
+        var handler = relayedEventHandlers[relayed.type];
+        if (handler !== undefined) {
+            console.debug(logPrefix, logFmt, "Received " + relayed.type + " from another tab");
+            handler(new MessageEvent(relayed.type, { data: relayed.data }));
+        }
+    };
+    /**
+     * Queue up for the lock, following along with the leading tab's events in
+     * the meantime. Returns false if the browser can't do it (or it's not a secure
+     * context, eg: accessing runserver by IP from another device) in which case
+     * this tab needs its own SSE connection.
+     */
+    var electLeader = function () {
+        if (typeof BroadcastChannel === "undefined" || typeof AbortController === "undefined" || !("locks" in navigator)) {
+            console.debug(logPrefix, logFmt, "Unable to share an SSE connection between tabs, using a separate one");
+            return false;
+        }
+        relay = new BroadcastChannel(relayChannelName);
+        relay.addEventListener('message', relayedEventReceived);
+        leadershipAbort = new AbortController();
+        isFollowing = true;
+        console.debug(logPrefix, logFmt, "Following the leading tab's SSE connection until this one takes over");
+        navigator.locks.request(leaderLockName, { signal: leadershipAbort.signal }, function (_lock) {
+            isFollowing = false;
+            console.debug(logPrefix, logFmt, "This tab is now the leader, holding the SSE connection for the others");
+            connectEventSource();
+            if (relay !== null) {
+                // The others have been keeping track of this one as a follower.
+                var leading = { type: "visibility", data: JSON.stringify({ uuid: pageUuid(), hidden: true, gone: true }) };
+                relay.postMessage(leading);
+                var query = { type: "visibility-query", data: "" };
+                relay.postMessage(query);
+            }
+            // Held until the page goes away.
+            return new Promise(function (resolve) {
+                releaseLeadership = resolve;
+            });
+        }).catch(function (error) {
+            if (error.name === "AbortError") {
+                return;
+            }
+            console.error(logPrefix, logFmt, "Failed to become the leading tab, using a separate SSE connection", error);
+            isFollowing = false;
+            if (evtSource === null) {
+                connectEventSource();
+            }
+        });
+        return true;
+    };
+    var livereloadishUrl = "";
+    /**
+     * Open the SSE connection, either for this tab alone or as the leader.
+     */
+    var connectEventSource = function () {
+        var jsLoad = new Date().getTime() / 1000;
+        evtSource = new EventSource(livereloadishUrl.replace('js_load=0', "js_load=" + jsLoad));
+        evtSource.addEventListener('open', connectionOpened);
+        evtSource.addEventListener('error', connectionErrored);
+        if (relay !== null) {
+            evtSource.addEventListener('assets_change', relayEvent);
+            evtSource.addEventListener('assets_delete', relayEvent);
+            evtSource.addEventListener('restarting', relayEvent);
+        }
+        evtSource.addEventListener('assets_change', assetHasChanged);
+        evtSource.addEventListener('assets_delete', assetHasDeleted);
+        evtSource.addEventListener('disconnect', disconnectRequested);
+        evtSource.addEventListener('reconnect', reconnectRequested);
+        evtSource.addEventListener('restarting', restartRequested);
+    };
     /**
      * Your basic setup of event source + various event listeners.
      */
@@ -1846,16 +2626,14 @@
         var _a;
         var includer = document.querySelectorAll("script[data-livereloadish-url]");
         if (includer.length === 1) {
-            var livereloadishUrl = (_a = includer[0].dataset.livereloadishUrl) !== null && _a !== void 0 ? _a : "";
+            livereloadishUrl = (_a = includer[0].dataset.livereloadishUrl) !== null && _a !== void 0 ? _a : "";
             if (livereloadishUrl) {
-                var jsLoad = new Date().getTime() / 1000;
-                evtSource = new EventSource(livereloadishUrl.replace('js_load=0', "js_load=" + jsLoad));
-                evtSource.addEventListener('open', connectionOpened);
-                evtSource.addEventListener('error', connectionErrored);
-                evtSource.addEventListener('assets_change', assetHasChanged);
-                evtSource.addEventListener('assets_delete', assetHasDeleted);
-                evtSource.addEventListener('disconnect', disconnectRequested);
-                evtSource.addEventListener('reconnect', reconnectRequested);
+                assetIndex.start();
+                if (!electLeader()) {
+                    connectEventSource();
+                }
+                // Let the leading tab know this one is visible (or not).
+                reportVisibility(false);
                 window.addEventListener('pagehide', livereloadishTeardown);
                 document.addEventListener('visibilitychange', switchStrategies);
             }
@@ -1879,6 +2657,16 @@
         if (errorTimer !== null) {
             clearTimeout(errorTimer);
         }
+        if (restartTimer !== null) {
+            clearTimeout(restartTimer);
+            restartTimer = null;
+        }
+        restartedWhileHidden = null;
+        if (pendingCSSTimer !== null) {
+            clearTimeout(pendingCSSTimer);
+            pendingCSSTimer = null;
+        }
+        assetIndex.stop();
         errorCount = 0;
         for (var key in queuedUp) {
             delete queuedUp[key];
@@ -1887,6 +2675,11 @@
         for (var key in promptDecisions) {
             delete promptDecisions[key];
         }
+        for (var key in followers) {
+            delete followers[key];
+        }
+        reportedHidden = false;
+        reportedRelayed = "";
         while (promptedAssetDeletedPreviously.length) {
             promptedAssetDeletedPreviously.pop();
         }
@@ -1898,13 +2691,37 @@
             console.debug(logPrefix, logFmt, "SSE connection closed, not reconnecting");
             evtSource.removeEventListener('open', connectionOpened);
             evtSource.removeEventListener('error', connectionErrored);
+            evtSource.removeEventListener('assets_change', relayEvent);
+            evtSource.removeEventListener('assets_delete', relayEvent);
+            evtSource.removeEventListener('restarting', relayEvent);
             evtSource.removeEventListener('assets_change', assetHasChanged);
             evtSource.removeEventListener('assets_delete', assetHasDeleted);
             evtSource.removeEventListener('disconnect', disconnectRequested);
             evtSource.removeEventListener('reconnect', reconnectRequested);
+            evtSource.removeEventListener('restarting', restartRequested);
             console.debug(logPrefix, logFmt, "Event listeners unbound");
             evtSource = null;
         }
+        // Let another tab take over the SSE connection, or stop waiting to.
+        if (releaseLeadership !== null) {
+            releaseLeadership();
+            releaseLeadership = null;
+        }
+        if (leadershipAbort !== null) {
+            leadershipAbort.abort();
+            leadershipAbort = null;
+        }
+        if (relay !== null) {
+            if (isFollowing) {
+                // No longer hidden or visible, as far as the leader is concerned.
+                var relayed = { type: "visibility", data: JSON.stringify({ uuid: pageUuid(), hidden: true, gone: true }) };
+                relay.postMessage(relayed);
+            }
+            relay.removeEventListener('message', relayedEventReceived);
+            relay.close();
+            relay = null;
+        }
+        isFollowing = false;
     };
     // https://cwestblog.com/2020/02/19/javascript-snippet-domready-function/
     if (/^(loaded|complete|interactive)$/.test(document.readyState)) {
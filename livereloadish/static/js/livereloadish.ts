@@ -920,6 +920,245 @@
         }
     }
 
+    /**
+     * Which elements (and stylesheet rules) refer to which files, by filename,
+     * so that each change is resolved with a lookup rather than the whole
+     * document being scanned with substring attribute selectors, which is slow
+     * on huge pages (admin changelists, data tables...)
+     * The elements are indexed once when the script starts, and kept up to
+     * date with a MutationObserver. The rules in each stylesheet are indexed
+     * the first time they're asked for, as there's nothing to observe them
+     * changing; a changed stylesheet is a different CSSStyleSheet anyway, and
+     * one with rules inserted or deleted since (CSS-in-JS, say) is re-indexed.
+     */
+    class AssetIndex {
+        static readonly selector = "link[href], style[data-livereloadish-href], script[src], img[src], img[srcset], picture > source[srcset], [style*='url(']";
+        static readonly attributes = ["href", "src", "srcset", "style", "data-livereloadish-href"];
+        private elements: { [key: string]: Element[] } = {};
+        private keys: WeakMap<Element, string[]> = new WeakMap();
+        private rules: WeakMap<CSSStyleSheet, { length: number, index: { [key: string]: CSSStyleRule[] } }> = new WeakMap();
+        private observer: MutationObserver | null = null;
+
+        /**
+         * Filenames are what the server sends, and what's looked for, because
+         * things may be referenced relatively rather than using {% static %}
+         */
+        static filenameOf(url: string): string {
+            const path = url.split(/[?#]/, 1)[0];
+            const filename = path.slice(path.lastIndexOf("/") + 1);
+            try {
+                return decodeURIComponent(filename);
+            } catch (e) {
+                return filename;
+            }
+        }
+
+        static filenamesInCSS(text: string): string[] {
+            const filenames: string[] = [];
+            // Whitespace may be either side of the quotes, so it's skipped
+            // before looking for one, or url( "a.png" ) would capture a quote.
+            const urlExtractor = /url\(\s*(['"]?)(.*?)\1\s*\)/g;
+            let match: RegExpExecArray | null;
+            while ((match = urlExtractor.exec(text)) !== null) {
+                filenames.push(AssetIndex.filenameOf(match[2]));
+            }
+            return filenames;
+        }
+
+        static filenamesFor(element: Element): string[] {
+            const filenames: string[] = [];
+            const tagName = element.tagName;
+            const href = tagName === "LINK" ? element.getAttribute("href") : (tagName === "STYLE" ? element.getAttribute("data-livereloadish-href") : null);
+            if (href) {
+                filenames.push(AssetIndex.filenameOf(href));
+            }
+            const src = tagName === "SCRIPT" || tagName === "IMG" ? element.getAttribute("src") : null;
+            if (src) {
+                filenames.push(AssetIndex.filenameOf(src));
+            }
+            const srcset = tagName === "IMG" || tagName === "SOURCE" ? element.getAttribute("srcset") : null;
+            if (srcset) {
+                for (const candidate of srcset.split(",")) {
+                    const candidateHref = candidate.trim().split(/\s+/, 1)[0];
+                    if (candidateHref) {
+                        filenames.push(AssetIndex.filenameOf(candidateHref));
+                    }
+                }
+            }
+            const style = element.getAttribute("style");
+            if (style && style.indexOf("url(") > -1) {
+                filenames.push(...AssetIndex.filenamesInCSS(style));
+            }
+            return filenames;
+        }
+
+        add(element: Element): void {
+            const filenames = AssetIndex.filenamesFor(element);
+            if (filenames.length > 0) {
+                this.keys.set(element, filenames);
+                for (const filename of filenames) {
+                    (this.elements[filename] = this.elements[filename] || []).push(element);
+                }
+            }
+        }
+
+        remove(element: Element): void {
+            const filenames = this.keys.get(element);
+            if (filenames !== undefined) {
+                this.keys.delete(element);
+                for (const filename of filenames) {
+                    const elements = this.elements[filename] || [];
+                    const position = elements.indexOf(element);
+                    if (position > -1) {
+                        elements.splice(position, 1);
+                    }
+                    if (elements.length === 0) {
+                        delete this.elements[filename];
+                    }
+                }
+            }
+        }
+
+        addTree(root: Element): void {
+            if (root.matches(AssetIndex.selector)) {
+                this.add(root);
+            }
+            const elements: Element[] = Array.prototype.slice.call(root.querySelectorAll(AssetIndex.selector));
+            for (const element of elements) {
+                this.add(element);
+            }
+        }
+
+        removeTree(root: Element): void {
+            this.remove(root);
+            const elements: Element[] = Array.prototype.slice.call(root.getElementsByTagName("*"));
+            for (const element of elements) {
+                this.remove(element);
+            }
+        }
+
+        observed(mutations: MutationRecord[]): void {
+            for (const mutation of mutations) {
+                if (mutation.type === "attributes") {
+                    const element = mutation.target as Element;
+                    this.remove(element);
+                    this.add(element);
+                    continue;
+                }
+                for (let i = 0; i < mutation.removedNodes.length; i++) {
+                    const node = mutation.removedNodes[i];
+                    if (node.nodeType === Node.ELEMENT_NODE) {
+                        this.removeTree(node as Element);
+                    }
+                }
+                for (let i = 0; i < mutation.addedNodes.length; i++) {
+                    const node = mutation.addedNodes[i];
+                    if (node.nodeType === Node.ELEMENT_NODE) {
+                        this.addTree(node as Element);
+                    }
+                }
+            }
+        }
+
+        start(): void {
+            if (this.observer !== null) {
+                return;
+            }
+            this.addTree(document.documentElement);
+            this.observer = new MutationObserver((mutations) => this.observed(mutations));
+            this.observer.observe(document.documentElement, {
+                'childList': true,
+                'subtree': true,
+                'attributes': true,
+                'attributeFilter': AssetIndex.attributes,
+            });
+            console.debug(logPrefix, logFmt, `Indexed ${Object.keys(this.elements).length} referenced filenames`);
+        }
+
+        stop(): void {
+            if (this.observer !== null) {
+                this.observer.disconnect();
+                this.observer = null;
+            }
+            this.elements = {};
+            this.keys = new WeakMap();
+            this.rules = new WeakMap();
+        }
+
+        /**
+         * Any elements referring to the given filename, still in the document.
+         */
+        find(filename: string): Element[] {
+            if (this.observer === null) {
+                this.start();
+            }
+            // The observer's records are delivered asynchronously, so anything
+            // changed since are dealt with now rather than missed.
+            if (this.observer !== null) {
+                this.observed(this.observer.takeRecords());
+            }
+            return (this.elements[filename] || []).slice();
+        }
+
+        /**
+         * Any style rules in any of the document's stylesheets referring to the
+         * given filename, eg: via "background: url(...)"
+         */
+        findRules(filename: string): CSSStyleRule[] {
+            const found: CSSStyleRule[] = [];
+            const styleSheets: CSSStyleSheet[] = Array.prototype.slice.call(document.styleSheets);
+            for (const styleSheet of styleSheets) {
+                const length = AssetIndex.ruleCount(styleSheet);
+                let indexed = this.rules.get(styleSheet);
+                if (indexed === undefined || indexed.length !== length) {
+                    indexed = {length: length, index: AssetIndex.indexRules(styleSheet)};
+                    this.rules.set(styleSheet, indexed);
+                }
+                if (filename in indexed.index) {
+                    found.push(...indexed.index[filename]);
+                }
+            }
+            return found;
+        }
+
+        /**
+         * How many rules the stylesheet has, or -1 if they can't be read
+         * (because it's from another origin, say)
+         */
+        static ruleCount(styleSheet: CSSStyleSheet): number {
+            try {
+                return styleSheet.cssRules.length;
+            } catch (e) {
+                return -1;
+            }
+        }
+
+        static indexRules(styleSheet: CSSStyleSheet): { [key: string]: CSSStyleRule[] } {
+            const index: { [key: string]: CSSStyleRule[] } = {};
+            let rules: CSSRule[];
+            try {
+                rules = Array.prototype.slice.call(styleSheet.cssRules);
+            } catch (e) {
+                console.warn(logIMG, logFmt, `Failed to read get CSSRuleList from ${styleSheet.href}, probably it's remote and uneditable?`);
+                return index;
+            }
+            for (const rule of rules) {
+                // Obnoxiously, the .type attribute seems to be deprecated
+                // https://developer.mozilla.org/en-US/docs/Web/API/CSSRule/type
+                // but I don't see any replacement for it? How else do I know
+                // if it's technically an instanceof CSSStyleRule
+                if (rule.type == rule.STYLE_RULE && rule instanceof CSSStyleRule && rule.cssText.indexOf("url(") > -1) {
+                    for (const filename of AssetIndex.filenamesInCSS(rule.cssText)) {
+                        (index[filename] = index[filename] || []).push(rule);
+                    }
+                }
+            }
+            return index;
+        }
+    }
+
+    const assetIndex = new AssetIndex();
+
     class LivereloadishPageState {
         public dataKey: string;
         public scrollKey: string;
@@ -1386,11 +1625,160 @@
         }
         return '';
     }
+    /**
+     * The text of a stylesheet no longer lives at its URL once it's in a <style>
+     * element, so any relative url(...) or @import within it has to be made
+     * absolute against where it was fetched from.
+     */
+    const absoluteCSSUrls = function (text: string, base: string): string {
+        const isAbsolute = /^(?:[a-z][a-z0-9+.-]*:|\/\/|#)/i;
+        return text.replace(/url\(\s*(['"]?)(.*?)\1\s*\)/g, function (fullText: string, quote: string, href: string): string {
+            if (href === "" || isAbsolute.test(href)) {
+                return fullText;
+            }
+            return `url(${quote}${new URL(href, base).toString()}${quote})`;
+        }).replace(/@import\s+(['"])(.*?)\1/g, function (fullText: string, quote: string, href: string): string {
+            if (isAbsolute.test(href)) {
+                return fullText;
+            }
+            return `@import ${quote}${new URL(href, base).toString()}${quote}`;
+        });
+    }
+    /**
+     * Whether swapping in the text of a stylesheet has been found not to work,
+     * in which case stylesheets are only ever replaced by link.
+     */
+    let inlineStylesBlocked = false;
+    /**
+     * Swap a <link rel="stylesheet"> (or a <style> which replaced one previously)
+     * for a <style> containing the new text, in the same place, so there's no
+     * second request for the browser to make and nothing unstyled in between.
+     * The original href is kept on it, so that it can be found again next time.
+     * If a Content-Security-Policy stops the <style> from applying, the original
+     * element is put back and null returned, and no more text swaps are tried.
+     */
+    const swapCSSText = function (element: HTMLLinkElement | HTMLStyleElement, href: string, text: string): HTMLStyleElement | null {
+        const style = document.createElement("style");
+        for (let i = 0; i < element.attributes.length; i++) {
+            const {name, value} = element.attributes[i];
+            if (name !== "rel" && name !== "href" && name !== "integrity" && name !== "crossorigin") {
+                style.setAttribute(name, value);
+            }
+        }
+        // Browsers blank out the nonce attribute once it has been read, so the
+        // property is the only way to carry it across.
+        if (element.nonce) {
+            style.nonce = element.nonce;
+        }
+        style.setAttribute('data-livereloadish-href', href);
+        style.textContent = text;
+        const parent = element.parentNode;
+        if (parent === null) {
+            return null;
+        }
+        parent.replaceChild(style, element);
+        // A <style> blocked by the CSP never gets a stylesheet, and the check
+        // happens as soon as it's inserted.
+        if (style.sheet === null) {
+            console.debug(logCSS, logFmt, `Inline styles are blocked, probably by a Content-Security-Policy without 'unsafe-inline'; replacing ${href} by link instead`);
+            inlineStylesBlocked = true;
+            parent.replaceChild(element, style);
+            return null;
+        }
+        return style;
+    }
+    /**
+     * Changed stylesheets waiting to be fetched and swapped in, keyed by filename,
+     * so that several changing at once (eg: a preprocessor writing more than one
+     * output) are fetched in parallel and applied together, costing the browser
+     * a single style recalculation. Only one batch is fetched at a time.
+     */
+    const pendingCSS: { [key: string]: AssetChangeData } = {};
+    let pendingCSSTimer: null | number = null;
+    let pendingCSSInFlight = false;
+    const pendingCSSDelay = 20;
+
+    const schedulePendingCSS = function (): void {
+        if (pendingCSSTimer === null && !pendingCSSInFlight) {
+            pendingCSSTimer = setTimeout(flushPendingCSS, pendingCSSDelay);
+        }
+    }
+
+    const flushPendingCSS = function (): void {
+        pendingCSSTimer = null;
+        const elements: (HTMLLinkElement | HTMLStyleElement)[] = [];
+        const messages: AssetChangeData[] = [];
+        for (const filename in pendingCSS) {
+            const msg = pendingCSS[filename];
+            delete pendingCSS[filename];
+            // On the off-chance files are linked relatively rather than root-relative
+            // using {% static %} we look at the file NAME and potentially replace
+            // more files than necessary, instead of fewer than hoped.
+            for (const element of assetIndex.find(filename)) {
+                if (element.matches("link[rel=stylesheet]:not([data-no-reload]):not([data-pending-removal]):not([up-keep]), style[data-livereloadish-href]:not([data-no-reload]):not([up-keep])")) {
+                    elements.push(element as HTMLLinkElement | HTMLStyleElement);
+                    messages.push(msg);
+                }
+            }
+        }
+        if (elements.length === 0) {
+            return;
+        }
+        const hrefs = elements.map((element) => element.getAttribute('data-livereloadish-href') || (element as HTMLLinkElement).href);
+        const texts = hrefs.map((href, i): Promise<string | null> => {
+            const newHref = new RelativeUrl(href, document.location.origin).changeLivereloadishValue(messages[i].new_time).toString();
+            return window.fetch(newHref, {
+                'credentials': 'same-origin',
+                'cache': 'no-store',
+            }).then((response) => {
+                if (!response.ok) {
+                    throw new TypeError(`${response.status} (${response.statusText})`);
+                }
+                return response.text();
+            }).then((text) => absoluteCSSUrls(text, new URL(newHref, document.location.href).toString()), (err: Error) => {
+                console.debug(logCSS, logFmt, `Failed to fetch the text of ${newHref}; ${err}`);
+                return null;
+            });
+        });
+        pendingCSSInFlight = true;
+        Promise.all(texts).then((results) => {
+            // Everything is swapped within the same task, so the browser only
+            // recalculates styles once for the whole batch.
+            for (let i = 0; i < elements.length; i++) {
+                const element = elements[i];
+                const text = results[i];
+                if (element.parentNode === null) {
+                    continue;
+                }
+                if (text !== null && !inlineStylesBlocked) {
+                    console.debug(logCSS, logFmt, `Swapping in the new text of ${hrefs[i]} in-place`);
+                    if (swapCSSText(element, hrefs[i], text) === null && element instanceof HTMLLinkElement) {
+                        replaceCSSFile(element, messages[i], document.location.origin);
+                    }
+                } else if (element instanceof HTMLLinkElement) {
+                    replaceCSSFile(element, messages[i], document.location.origin);
+                } else {
+                    console.error(logCSS, logFmt, `Couldn't get the new text of ${hrefs[i]}, leaving it as it was`);
+                }
+            }
+        }).catch((err: Error) => {
+            console.error(logCSS, logFmt, `An error occurred swapping in stylesheets; ${err}`);
+        }).then(() => {
+            pendingCSSInFlight = false;
+            if (Object.keys(pendingCSS).length > 0) {
+                schedulePendingCSS();
+            }
+        });
+    }
     /**
      * Replaces each <link rel="stylesheet" href="..."> where the href matches an update
-     * notification. To avoid having a Flash-of-Unstyled-Content (how retro), it does
-     * so by adding a _new_ link element and deleting the old one when the new one
-     * has loaded or errored.
+     * notification. The new text is fetched once and swapped in as a <style> element
+     * in the same place, batched with any other stylesheets changing at the same time.
+     * If the page has <meta name="livereloadish-css-strategy" content="link"> (say,
+     * because a Content-Security-Policy forbids inline styles), or swapping in the
+     * text has already turned out to be blocked, it instead does so by adding a _new_
+     * link element and deleting the old one when the new one has loaded or errored,
+     * to avoid having a Flash-of-Unstyled-Content (how retro).
      */
     const cssStrategy: ReloadStrategy = (msg: AssetChangeData): void => {
         const file = msg.info.relative_path;
@@ -1400,14 +1788,17 @@
             console.debug(logCSS, logFmt, `Meta tag suggested that this must do a full reload, because ${file} changed`);
             return refreshStrategy(msg);
         }
-        // On the off-chance files are linked relatively rather than root-relative
-        // using {% static %} we look at the file NAME and potentially replace
-        // more files than necessary, instead of fewer than hoped.
-        const reloadableLinkElements = document.querySelectorAll(`link[rel=stylesheet][href*="${filename}"]:not([data-no-reload]):not([data-pending-removal]):not([up-keep])`);
-        const linkElements: HTMLLinkElement[] = Array.prototype.slice.call(reloadableLinkElements);
-        for (const linkElement of linkElements) {
-            replaceCSSFile(linkElement, msg, origin);
+        const documentSaysLink: HTMLMetaElement | null = document.querySelector("meta[name='livereloadish-css-strategy'][content='link']")
+        if (documentSaysLink || inlineStylesBlocked) {
+            for (const element of assetIndex.find(filename)) {
+                if (element.matches("link[rel=stylesheet]:not([data-no-reload]):not([data-pending-removal]):not([up-keep])")) {
+                    replaceCSSFile(element as HTMLLinkElement, msg, origin);
+                }
+            }
+            return;
         }
+        pendingCSS[filename] = msg;
+        schedulePendingCSS();
     }
     /**
      * Forces the current URL to be reloaded in the browser. Used as a fallback elsewhere,
@@ -1454,6 +1845,89 @@
      * obeys previous decisions.
      */
     let promptDecisions: PromptDecisions = {};
+
+    /**
+     * When templates are annotated (see `annotate_templates` on the AppConfig) the
+     * output of each {% include %} sits between a pair of comments naming it, in
+     * the same parent element. Finds the outermost such pairs for a template.
+     * Returns null if they're not balanced, in which case they can't be trusted.
+     */
+    const templateBoundaries = (doc: Document, name: string): [Comment, Comment][] | null => {
+        const walker = doc.createTreeWalker(doc.body, NodeFilter.SHOW_COMMENT);
+        const boundaries: [Comment, Comment][] = [];
+        const opened: Comment[] = [];
+        let node: Node | null;
+        while ((node = walker.nextNode()) !== null) {
+            if (node.nodeValue === `livereloadish:${name}`) {
+                opened.push(node as Comment);
+            } else if (node.nodeValue === `/livereloadish:${name}`) {
+                const start = opened.pop();
+                if (start === undefined || start.parentNode !== node.parentNode) {
+                    return null;
+                }
+                if (opened.length === 0) {
+                    boundaries.push([start, node as Comment]);
+                }
+            }
+        }
+        return opened.length === 0 ? boundaries : null;
+    }
+    const nodesBetween = (start: Node, end: Node): Node[] => {
+        const nodes: Node[] = [];
+        for (let node = start.nextSibling; node !== null && node !== end; node = node.nextSibling) {
+            nodes.push(node);
+        }
+        return nodes;
+    }
+    /**
+     * Morph only the parts of the page which the changed template rendered,
+     * so that the time taken is proportional to the size of the template
+     * rather than the whole document. Returns false without touching anything
+     * if the page doesn't have matching boundaries for it.
+     */
+    const morphTemplateBoundaries = (incoming: Document, name: string): boolean => {
+        const currentBoundaries = templateBoundaries(document, name);
+        const incomingBoundaries = templateBoundaries(incoming, name);
+        if (currentBoundaries === null || incomingBoundaries === null || currentBoundaries.length === 0 || currentBoundaries.length !== incomingBoundaries.length) {
+            return false;
+        }
+        for (let i = 0; i < currentBoundaries.length; i++) {
+            const [start, end] = currentBoundaries[i];
+            const currentNodes = nodesBetween(start, end);
+            const incomingNodes = nodesBetween(incomingBoundaries[i][0], incomingBoundaries[i][1]);
+            const sameShape = currentNodes.length === incomingNodes.length && currentNodes.every((node, j) => node.nodeName === incomingNodes[j].nodeName);
+            if (sameShape) {
+                for (let j = 0; j < currentNodes.length; j++) {
+                    if (currentNodes[j].nodeType === Node.ELEMENT_NODE) {
+                        morphdom(currentNodes[j], incomingNodes[j], {});
+                    } else if (currentNodes[j].nodeValue !== incomingNodes[j].nodeValue) {
+                        currentNodes[j].nodeValue = incomingNodes[j].nodeValue;
+                    }
+                }
+            } else {
+                for (const node of currentNodes) {
+                    node.parentNode?.removeChild(node);
+                }
+                for (const node of incomingNodes) {
+                    end.parentNode?.insertBefore(node, end);
+                }
+            }
+        }
+        return true;
+    }
+    /**
+     * Swap the injected <template> elements for those of the incoming page, when
+     * they weren't within whatever got morphed.
+     */
+    const replaceInjectedTemplates = (incoming: Document, morphed: Node | null): void => {
+        for (const injectedId of ["livereloadish-page-templates", "livereloadish-page-files"]) {
+            const currentInjected = document.getElementById(injectedId);
+            const newInjected = incoming.getElementById(injectedId);
+            if (currentInjected !== null && newInjected !== null && (morphed === null || !morphed.contains(currentInjected))) {
+                currentInjected.parentNode?.replaceChild(newInjected, currentInjected);
+            }
+        }
+    }
     /**
      * Refresh the page because a Django template was noticed as changing.
      * If the Django monkeypatches say that it was a _root_ template which changed,
@@ -1471,7 +1945,7 @@
         const file = msg.info.relative_path;
         // Check the list of Django template files seen during this request, hopefully.
         const seenTemplatesExists: HTMLTemplateElement | null = document.querySelector(`template[id="livereloadish-page-templates"]`);
-        let seenTemplates = {};
+        let seenTemplates: string[] = [];
 
         // Capture when the <template id="livereloadish-page-templates"></template> element
         // was injected into the response, and then after playing a body mutation,
@@ -1489,9 +1963,10 @@
         }
 
         if (seenTemplatesExists) {
-            seenTemplates = JSON.parse(seenTemplatesExists.content.textContent ?? "{}");
+            // Only the names; the paths are kept server side.
+            seenTemplates = JSON.parse(seenTemplatesExists.dataset.templates ?? "[]");
         }
-        if (!(file in seenTemplates)) {
+        if (seenTemplates.indexOf(file) === -1) {
             // If it doesn't look related to this page, prompt the user to reload
             // and if they choose not to, ignore subsequent changes to the file.
 
@@ -1577,12 +2052,21 @@
                 return refreshStrategy(msg);
             }
         } else if (documentReloadStyle === "diff" || documentReloadStyle === "auto") {
-            console.debug(logPage, logFmt, `Reloading the body content via udomdiff, because ${file} changed`);
+            // Only the body (or the element given by id in the meta tag) needs
+            // sending back, rather than the server injecting everything into
+            // a whole page for most of it to be thrown away.
+            const documentFragmentTag: HTMLMetaElement | null = document.querySelector("meta[name='livereloadish-page-fragment'][content]");
+            const requestedFragment = documentFragmentTag?.content.trim() || "body";
+            let receivedFragment = "";
+            console.debug(logPage, logFmt, `Reloading the ${requestedFragment} content via udomdiff, because ${file} changed`);
             const fetchResponse = window.fetch(url.toString(), {
                 'mode': 'same-origin',
                 'credentials': 'same-origin',
                 'cache': 'reload',
                 'redirect': 'error',
+                'headers': {
+                    'X-Livereloadish-Fragment': requestedFragment,
+                },
             })
             fetchResponse.then((response) => {
                 if (response.status > 300 && response.status < 400) {
@@ -1590,6 +2074,7 @@
                 } else if (response.status > 500) {
                     throw new TypeError(`Stop due to Server error: ${response.status} (${response.statusText})`);
                 }
+                receivedFragment = response.headers.get('X-Livereloadish-Fragment') || "";
                 return response.text();
             }).then((body) => {
                 console.debug(logPage, logFmt, `Received the body content, replacing via udomdiff, because ${file} changed`);
@@ -1599,8 +2084,23 @@
                     console.debug(logPage, logFmt, `Meta tag on the incoming page suggested that this must be a full reload, because ${file} changed`);
                     return refreshStrategy(msg);
                 }
-                // noinspection XHTMLIncompatabilitiesJS
-                morphdom(document.body, fragment.body, {});
+                if ((receivedFragment === "" || receivedFragment === "body") && morphTemplateBoundaries(fragment, file)) {
+                    console.debug(logPage, logFmt, `Morphed only the parts of the page rendered by ${file}`);
+                    replaceInjectedTemplates(fragment, null);
+                } else if (receivedFragment === "" || receivedFragment === "body") {
+                    // noinspection XHTMLIncompatabilitiesJS
+                    morphdom(document.body, fragment.body, {});
+                } else {
+                    const currentRegion = document.getElementById(receivedFragment);
+                    const newRegion = fragment.getElementById(receivedFragment);
+                    if (currentRegion === null || newRegion === null) {
+                        console.debug(logPage, logFmt, `Couldn't find #${receivedFragment} in both the current and incoming page; must do a full reload, because ${file} changed`);
+                        return refreshStrategy(msg);
+                    }
+                    morphdom(currentRegion, newRegion, {});
+                    // The injected templates are sent alongside the element if they're not within it.
+                    replaceInjectedTemplates(fragment, currentRegion);
+                }
                 if (fragment.title != document.title) {
                     console.debug(logPage, logFmt, `Updated the document title, because ${file} changed`);
                     document.title = fragment.title;
@@ -1612,7 +2112,8 @@
                 // May cause a FOUC. May need to be hoisted to a separate function to
                 // allow swup/unpoly/turbolinks support, if possible?
                 const newHeadStyles: HTMLStyleElement[] = Array.prototype.slice.call(fragment.querySelectorAll("head style"));
-                const previousHeadStyles: HTMLStyleElement[] = Array.prototype.slice.call(document.querySelectorAll("head style"));
+                // Those which replaced a <link> are left alone, as the <link> isn't coming back.
+                const previousHeadStyles: HTMLStyleElement[] = Array.prototype.slice.call(document.querySelectorAll("head style:not([data-livereloadish-href])"));
                 if (previousHeadStyles.length > 0 || newHeadStyles.length > 0) {
                     for (const headStyle of newHeadStyles) {
                         document.head.appendChild(headStyle);
@@ -1660,8 +2161,7 @@
         // Reload anything matching the file NAME rather than the file PATH
         // in case items are referenced relatively rather than using {% static %}
         // or whatever. This shouldn't happen often, but can.
-        const possiblyReloadableScriptElements = document.querySelectorAll(`script[src*="${filename}"]`);
-        const scriptElements: HTMLScriptElement[] = Array.prototype.slice.call(possiblyReloadableScriptElements);
+        const scriptElements = assetIndex.find(filename).filter((element) => element.tagName === "SCRIPT") as HTMLScriptElement[];
         for (const scriptElement of scriptElements) {
             const reloadable = scriptElement.dataset.reloadable;
             const src = scriptElement.src;
@@ -1710,8 +2210,12 @@
         // We look at the file NAME rather than PATH because it may be referenced
         // relatively (though unlikely) and it's easier to reload MORE images
         // than to accidentally skip one which SHOULD be caught.
-        const possiblyReloadableImageElements = document.querySelectorAll(`img[src*="${filename}"], img[srcset*="${filename}"], picture > source[srcset*="${filename}"]`);
-        const imageElements: (HTMLImageElement | HTMLSourceElement)[] = Array.prototype.slice.call(possiblyReloadableImageElements);
+        const referringElements = assetIndex.find(filename);
+        const imageElements = referringElements.filter((element) => {
+            const isImage = element.tagName === "IMG" || (element.tagName === "SOURCE" && element.parentElement !== null && element.parentElement.tagName === "PICTURE");
+            // It may only be here because of a background in its style attribute.
+            return isImage && ((element.getAttribute("src") || "").indexOf(filename) > -1 || (element.getAttribute("srcset") || "").indexOf(filename) > -1);
+        }) as (HTMLImageElement | HTMLSourceElement)[];
         const totalReplacements: string[] = [];
         for (const imageElement of imageElements) {
             const newHref = replaceImageFile(imageElement, msg, origin);
@@ -1722,8 +2226,7 @@
         // Can't say I care about border images, so we'll only look for backgrounds...
         // Note that we could see items from document.images in here, because they could
         // have placeholder backgrounds...
-        const inlineStyles = document.querySelectorAll(`[style*="background"][style*="${filename}"]`);
-        const imageStyleElements: HTMLElement[] = Array.prototype.slice.call(inlineStyles);
+        const imageStyleElements = referringElements.filter((element) => element.hasAttribute("style")) as HTMLElement[];
         for (const imageElement of imageStyleElements) {
             // We use the file NAME rather than the file PATH because the  text
             // value may be relative to the page or whatever, and thus not
@@ -1735,30 +2238,14 @@
                 }
             }
         }
-        const styleSheets: CSSStyleSheet[] = Array.prototype.slice.call(document.styleSheets);
-        for (const styleSheet of styleSheets) {
-            let rules: CSSRule[];
-            try {
-                rules = Array.prototype.slice.call(styleSheet.cssRules);
-            } catch (e) {
-                console.warn(logIMG, logFmt, `Failed to read get CSSRuleList from ${styleSheet.href}, probably it's remote and uneditable?`);
-                continue;
-            }
-            for (const rule of rules) {
-                // Obnoxiously, the .type attribute seems to be deprecated
-                // https://developer.mozilla.org/en-US/docs/Web/API/CSSRule/type
-                // but I don't see any replacement for it? How else do I know
-                // if it's technically an instanceof CSSStyleRule
-                if (rule.type == rule.STYLE_RULE) {
-                    // We use the file NAME rather than the file PATH because the
-                    // text value may be relative to the page or whatever, and
-                    // thus not contain /the/full/path.jpg
-                    if (rule.cssText.indexOf("background") > -1 && rule instanceof CSSStyleRule && rule.style.backgroundImage.indexOf(filename) > -1) {
-                        const newHref = replaceImageInStyle(rule as CSSStyleRule, msg, origin);
-                        if (newHref !== "") {
-                            totalReplacements.push(newHref);
-                        }
-                    }
+        for (const rule of assetIndex.findRules(filename)) {
+            // We use the file NAME rather than the file PATH because the
+            // text value may be relative to the page or whatever, and
+            // thus not contain /the/full/path.jpg
+            if (rule.style.backgroundImage.indexOf(filename) > -1) {
+                const newHref = replaceImageInStyle(rule, msg, origin);
+                if (newHref !== "") {
+                    totalReplacements.push(newHref);
                 }
             }
         }
@@ -1871,16 +2358,23 @@
      * reload strategies being used. When a user navigates to a different tab,
      * swap to using the background queue to replay when they come back.
      * When they come back to the tab, replay each unique file and drain the queue.
+     * Either way, let the server know, so it can stop scanning while nobody's
+     * looking and send everything that changed in the meantime when they are.
      */
     const switchStrategies = (_event: Event) => {
+        reportVisibility(false);
         if (document.visibilityState === "hidden") {
             activeReloadStrategies = queuedUpReloadStrategies;
             console.debug(logQueue, logFmt, "Switched reloaders until page is visible again");
         } else {
             activeReloadStrategies = reloadStrategies;
             console.debug(logQueue, logFmt, "Switched reloaders back to defaults because page became visible");
+            if (restartedWhileHidden !== null) {
+                // The page is about to be reloaded anyway.
+                return serverRestarted(restartedWhileHidden);
+            }
             const replayCount = Object.keys(queuedUp).length;
-            if (evtSource === null) {
+            if (evtSource === null && !isFollowing) {
                 if (errorCount >= maxErrors) {
                     console.debug(logQueue, logFmt, "It looks like the server may have gone away for too long, so you'll probably need to refresh");
                 } else if (replayCount > 0) {
@@ -1915,6 +2409,9 @@
             clearTimeout(errorTimer);
         }
         errorCount = 0;
+        // The server carries over whatever it was last told about this page,
+        // which may be stale after a reconnect (or a restart), so say so again.
+        reportVisibility(true);
     }
 
     /**
@@ -1934,7 +2431,7 @@
                 // Wait between 1-3 seconds before retrying.
                 const timeout = Math.max(1000, Math.round(3000 * Math.random()));
                 console.debug(logPrefix, logFmt, `Waiting for ${timeout}ms to restart SSE connection`);
-                errorTimer = setTimeout(livereloadishSetup, timeout);
+                errorTimer = setTimeout(connectEventSource, timeout);
             } else {
                 console.error(logPrefix, logFmt, `Cancelling SSE connection attempts after ${errorCount} retries. Manually reload the page...`)
             }
@@ -1948,6 +2445,76 @@
         console.debug(logPrefix, logFmt, `Server asked for a reconnect`);
         return connectionErrored(_event);
     }
+    let restartTimer: null | number = null;
+    const maxRestartWait = 30000;
+    /**
+     * The change which restarted the server while this tab was in the background,
+     * to be dealt with (by serverRestarted) once it's visible again.
+     */
+    let restartedWhileHidden: AssetChangeData | null = null;
+    /**
+     * The server has come back after restarting, and is known to be ready, so
+     * there's no point asking whether the change was related (it's Python, so it
+     * never is as far as the page's templates go) or waiting for a reconnect.
+     */
+    const serverRestarted = (msg: AssetChangeData): void => {
+        restartedWhileHidden = null;
+        return refreshStrategy(msg);
+    }
+    /**
+     * Django's autoreloader is about to restart the server because of a change
+     * to some Python, and it has told us so just before going away. Rather than
+     * finding out by way of the connection dropping and retrying every few
+     * seconds, keep asking the server whether it's back, quickly at first, and
+     * carry on as if it was any other change the moment it is.
+     */
+    const restartRequested = (event: Event): void => {
+        const msg = JSON.parse((event as MessageEvent).data) as AssetChangeData;
+        console.debug(logPython, logFmt, `Server is restarting because ${msg.info.relative_path} changed, waiting for it to come back`);
+        if (evtSource !== null) {
+            evtSource.close();
+            evtSource = null;
+        }
+        if (errorTimer !== null) {
+            clearTimeout(errorTimer);
+            errorTimer = null;
+        }
+        if (restartTimer !== null) {
+            clearTimeout(restartTimer);
+        }
+        const readyUrl = new URL("../ready/", new URL(livereloadishUrl, document.location.href)).toString();
+        const started = new Date().getTime();
+        let delay = 50;
+        const probe = (): void => {
+            restartTimer = null;
+            window.fetch(readyUrl, {
+                'mode': 'same-origin',
+                'credentials': 'same-origin',
+                'cache': 'no-store',
+            }).then((response) => response.ok, (_error) => false).then((isReady: boolean) => {
+                const waited = new Date().getTime() - started;
+                if (isReady) {
+                    console.debug(logPython, logFmt, `Server came back after ${waited}ms`);
+                    if (!isFollowing) {
+                        connectEventSource();
+                    }
+                    // If the tab is in the background, this'll get dealt
+                    // with when it comes back.
+                    if (activeReloadStrategies === reloadStrategies) {
+                        return serverRestarted(msg);
+                    }
+                    console.debug(logQueue, logFmt, `Deferring the reload until the page is visible again`);
+                    restartedWhileHidden = msg;
+                } else if (waited >= maxRestartWait) {
+                    console.error(logPython, logFmt, `Giving up on waiting for the server to come back, after ${waited}ms trying`);
+                } else {
+                    delay = Math.min(delay * 2, 1000);
+                    restartTimer = setTimeout(probe, delay);
+                }
+            });
+        }
+        restartTimer = setTimeout(probe, delay);
+    }
     /**
      * The server has the opportunity to ask the client to go away permanently,
      * this just sets the number of times it has attempted to reconnect to a
@@ -1994,22 +2561,241 @@
         }
     }
 
+    /**
+     * Only one tab per browser holds an SSE connection open, and relays what it's
+     * sent to the others over a BroadcastChannel. Otherwise a handful of open tabs
+     * uses up the browser's connection limit for the origin (6, under HTTP/1.1)
+     * and a server thread apiece.
+     * Whichever tab gets the Web Lock is the leader, and when it goes away (and
+     * the lock is released) one of the others takes over.
+     */
+    const relayChannelName = "livereloadish";
+    const leaderLockName = "livereloadish-sse";
+    let relay: BroadcastChannel | null = null;
+    let leadershipAbort: AbortController | null = null;
+    let releaseLeadership: null | (() => void) = null;
+    let isFollowing = false;
+
+    interface RelayedEvent {
+        type: string,
+        data: string,
+    }
+
+    /**
+     * Just enough of the Web Locks API, which the DOM types don't know about yet.
+     */
+    interface LockManager {
+        request(name: string, options: { signal: AbortSignal }, callback: (lock: unknown) => Promise<void>): Promise<void>,
+    }
+
+    /**
+     * The uuid of each of the following tabs, and whether it's visible; the leader
+     * only tells the server its page is hidden once it and all of these are, and
+     * passes the uuids on so the files they use are kept alive along with its own.
+     * Every tab keeps track, so that whichever takes over as the leader already
+     * knows about any changes made while there wasn't one.
+     */
+    const followers: { [key: string]: boolean } = {};
+    let reportedHidden = false;
+    let reportedRelayed = "";
+
+    const pageUuid = (): string => {
+        return new URL(livereloadishUrl, document.location.href).searchParams.get("uuid") ?? "";
+    }
+
+    const everyTabHidden = (): boolean => {
+        if (document.visibilityState !== "hidden") {
+            return false;
+        }
+        for (const key in followers) {
+            if (followers[key]) {
+                return false;
+            }
+        }
+        return true;
+    }
+
+    /**
+     * Followers tell the leading tab whether they're visible, and the tab holding
+     * the SSE connection tells the server, when that or the set of followers
+     * changes (or when forced).
+     * Uses navigator.sendBeacon so that it still gets sent as the page goes away.
+     */
+    const reportVisibility = (force: boolean): void => {
+        if (relay !== null && isFollowing) {
+            const relayed: RelayedEvent = {
+                type: "visibility",
+                data: JSON.stringify({uuid: pageUuid(), hidden: document.visibilityState === "hidden"}),
+            };
+            relay.postMessage(relayed);
+            return;
+        }
+        if (evtSource === null) {
+            return;
+        }
+        const hidden = everyTabHidden();
+        const relayed = Object.keys(followers).sort().join(",");
+        if (hidden === reportedHidden && relayed === reportedRelayed && !force) {
+            return;
+        }
+        reportedHidden = hidden;
+        reportedRelayed = relayed;
+        const visibilityUrl = new URL("../visibility/", new URL(livereloadishUrl, document.location.href));
+        visibilityUrl.search = `?uuid=${pageUuid()}&hidden=${hidden ? "1" : "0"}&relayed=${relayed}`;
+        console.debug(logPrefix, logFmt, `Telling the server this page is ${hidden ? "hidden" : "visible"}`);
+        if (typeof navigator.sendBeacon === "function") {
+            navigator.sendBeacon(visibilityUrl.toString());
+        } else {
+            window.fetch(visibilityUrl.toString(), {
+                'method': 'POST',
+                'mode': 'same-origin',
+                'credentials': 'same-origin',
+                'keepalive': true,
+            }).catch((_error) => undefined);
+        }
+    }
+
+    /**
+     * A following tab was shown or hidden, or is going away.
+     */
+    const followerVisibilityChanged = (event: Event): void => {
+        const msg = JSON.parse((event as MessageEvent).data) as { uuid: string, hidden: boolean, gone?: boolean };
+        if (msg.gone) {
+            delete followers[msg.uuid];
+        } else {
+            followers[msg.uuid] = !msg.hidden;
+        }
+        if (!isFollowing) {
+            reportVisibility(false);
+        }
+    }
+
+    /**
+     * A tab has just become the leader, and needs to know which of the others
+     * are visible.
+     */
+    const visibilityRequested = (_event: Event): void => {
+        if (isFollowing) {
+            reportVisibility(false);
+        }
+    }
+
+    /**
+     * The events worth passing on to the other tabs; connection state is
+     * only of interest to the leader. The visibility ones go the other way,
+     * from the followers to the leader.
+     */
+    const relayedEventHandlers: { [key: string]: (event: Event) => void } = {
+        "assets_change": assetHasChanged,
+        "assets_delete": assetHasDeleted,
+        "restarting": restartRequested,
+        "visibility": followerVisibilityChanged,
+        "visibility-query": visibilityRequested,
+    }
+
+    /**
+     * Bound to the leader's EventSource before the normal handlers, so the other
+     * tabs get told before anything (eg: a confirm dialog) might block.
+     */
+    const relayEvent = (event: Event): void => {
+        if (relay !== null) {
+            const relayed: RelayedEvent = {type: event.type, data: (event as MessageEvent).data};
+            relay.postMessage(relayed);
+        }
+    }
+
+    /**
+     * Handle an event from the leading tab as if this tab's own EventSource
+     * had been sent it.
+     */
+    const relayedEventReceived = (event: MessageEvent): void => {
+        const relayed = event.data as RelayedEvent;
+        const handler = relayedEventHandlers[relayed.type];
+        if (handler !== undefined) {
+            console.debug(logPrefix, logFmt, `Received ${relayed.type} from another tab`);
+            handler(new MessageEvent(relayed.type, {data: relayed.data}));
+        }
+    }
+
+    /**
+     * Queue up for the lock, following along with the leading tab's events in
+     * the meantime. Returns false if the browser can't do it (or it's not a secure
+     * context, eg: accessing runserver by IP from another device) in which case
+     * this tab needs its own SSE connection.
+     */
+    const electLeader = (): boolean => {
+        if (typeof BroadcastChannel === "undefined" || typeof AbortController === "undefined" || !("locks" in navigator)) {
+            console.debug(logPrefix, logFmt, `Unable to share an SSE connection between tabs, using a separate one`);
+            return false;
+        }
+        relay = new BroadcastChannel(relayChannelName);
+        relay.addEventListener('message', relayedEventReceived);
+        leadershipAbort = new AbortController();
+        isFollowing = true;
+        console.debug(logPrefix, logFmt, `Following the leading tab's SSE connection until this one takes over`);
+        (navigator as Navigator & { locks: LockManager }).locks.request(leaderLockName, {signal: leadershipAbort.signal}, (_lock) => {
+            isFollowing = false;
+            console.debug(logPrefix, logFmt, `This tab is now the leader, holding the SSE connection for the others`);
+            connectEventSource();
+            if (relay !== null) {
+                // The others have been keeping track of this one as a follower.
+                const leading: RelayedEvent = {type: "visibility", data: JSON.stringify({uuid: pageUuid(), hidden: true, gone: true})};
+                relay.postMessage(leading);
+                const query: RelayedEvent = {type: "visibility-query", data: ""};
+                relay.postMessage(query);
+            }
+            // Held until the page goes away.
+            return new Promise<void>((resolve) => {
+                releaseLeadership = resolve;
+            });
+        }).catch((error: Error) => {
+            if (error.name === "AbortError") {
+                return;
+            }
+            console.error(logPrefix, logFmt, `Failed to become the leading tab, using a separate SSE connection`, error);
+            isFollowing = false;
+            if (evtSource === null) {
+                connectEventSource();
+            }
+        });
+        return true;
+    }
+
+    let livereloadishUrl = "";
+    /**
+     * Open the SSE connection, either for this tab alone or as the leader.
+     */
+    const connectEventSource = (): void => {
+        const jsLoad = new Date().getTime() / 1000;
+        evtSource = new EventSource(livereloadishUrl.replace('js_load=0', `js_load=${jsLoad}`));
+        evtSource.addEventListener('open', connectionOpened);
+        evtSource.addEventListener('error', connectionErrored);
+        if (relay !== null) {
+            evtSource.addEventListener('assets_change', relayEvent);
+            evtSource.addEventListener('assets_delete', relayEvent);
+            evtSource.addEventListener('restarting', relayEvent);
+        }
+        evtSource.addEventListener('assets_change', assetHasChanged);
+        evtSource.addEventListener('assets_delete', assetHasDeleted);
+        evtSource.addEventListener('disconnect', disconnectRequested);
+        evtSource.addEventListener('reconnect', reconnectRequested);
+        evtSource.addEventListener('restarting', restartRequested);
+    }
+
     /**
      * Your basic setup of event source + various event listeners.
      */
     const livereloadishSetup = (): void => {
         const includer: NodeListOf<HTMLElement> = document.querySelectorAll("script[data-livereloadish-url]");
         if (includer.length === 1) {
-            const livereloadishUrl = includer[0].dataset.livereloadishUrl ?? "";
+            livereloadishUrl = includer[0].dataset.livereloadishUrl ?? "";
             if (livereloadishUrl) {
-                const jsLoad = new Date().getTime() / 1000;
-                evtSource = new EventSource(livereloadishUrl.replace('js_load=0', `js_load=${jsLoad}`));
-                evtSource.addEventListener('open', connectionOpened);
-                evtSource.addEventListener('error', connectionErrored);
-                evtSource.addEventListener('assets_change', assetHasChanged);
-                evtSource.addEventListener('assets_delete', assetHasDeleted);
-                evtSource.addEventListener('disconnect', disconnectRequested);
-                evtSource.addEventListener('reconnect', reconnectRequested);
+                assetIndex.start();
+                if (!electLeader()) {
+                    connectEventSource();
+                }
+                // Let the leading tab know this one is visible (or not).
+                reportVisibility(false);
                 window.addEventListener('pagehide', livereloadishTeardown);
                 document.addEventListener('visibilitychange', switchStrategies);
             } else {
@@ -2030,6 +2816,16 @@
         if (errorTimer !== null) {
             clearTimeout(errorTimer);
         }
+        if (restartTimer !== null) {
+            clearTimeout(restartTimer);
+            restartTimer = null;
+        }
+        restartedWhileHidden = null;
+        if (pendingCSSTimer !== null) {
+            clearTimeout(pendingCSSTimer);
+            pendingCSSTimer = null;
+        }
+        assetIndex.stop();
         errorCount = 0;
         for (const key in queuedUp) {
             delete queuedUp[key];
@@ -2038,6 +2834,11 @@
         for (const key in promptDecisions) {
             delete promptDecisions[key];
         }
+        for (const key in followers) {
+            delete followers[key];
+        }
+        reportedHidden = false;
+        reportedRelayed = "";
         while (promptedAssetDeletedPreviously.length) {
             promptedAssetDeletedPreviously.pop();
         }
@@ -2049,13 +2850,37 @@
             console.debug(logPrefix, logFmt, `SSE connection closed, not reconnecting`);
             evtSource.removeEventListener('open', connectionOpened);
             evtSource.removeEventListener('error', connectionErrored);
+            evtSource.removeEventListener('assets_change', relayEvent);
+            evtSource.removeEventListener('assets_delete', relayEvent);
+            evtSource.removeEventListener('restarting', relayEvent);
             evtSource.removeEventListener('assets_change', assetHasChanged);
             evtSource.removeEventListener('assets_delete', assetHasDeleted);
             evtSource.removeEventListener('disconnect', disconnectRequested);
             evtSource.removeEventListener('reconnect', reconnectRequested);
+            evtSource.removeEventListener('restarting', restartRequested);
             console.debug(logPrefix, logFmt, `Event listeners unbound`);
             evtSource = null;
         }
+        // Let another tab take over the SSE connection, or stop waiting to.
+        if (releaseLeadership !== null) {
+            releaseLeadership();
+            releaseLeadership = null;
+        }
+        if (leadershipAbort !== null) {
+            leadershipAbort.abort();
+            leadershipAbort = null;
+        }
+        if (relay !== null) {
+            if (isFollowing) {
+                // No longer hidden or visible, as far as the leader is concerned.
+                const relayed: RelayedEvent = {type: "visibility", data: JSON.stringify({uuid: pageUuid(), hidden: true, gone: true})};
+                relay.postMessage(relayed);
+            }
+            relay.removeEventListener('message', relayedEventReceived);
+            relay.close();
+            relay = null;
+        }
+        isFollowing = false;
     }
 
     // https://cwestblog.com/2020/02/19/javascript-snippet-domready-function/
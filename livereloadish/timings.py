@@ -0,0 +1,103 @@
+import logging
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter
+from typing import Any, Callable, Dict, Iterator, List, Optional, TypeVar, cast
+
+from django.apps import apps
+
+__all__ = ["logger", "Timings", "current_timings", "timed", "untimed"]
+logger = logging.getLogger(__name__)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+class Timings:
+    """
+    How long was spent in each of the patches during a request, and how many
+    times each was called, excluding the time spent in whatever they patched
+    over, so that it's only livereloadish's own overhead which is counted.
+    Rendered into a Server-Timing header by the middleware, for the browser's
+    devtools to show alongside everything else.
+    """
+
+    __slots__ = ("totals", "frames")
+    prefix = "livereloadish"
+
+    def __init__(self) -> None:
+        # name -> [seconds, calls]
+        self.totals: Dict[str, List[float]] = {}
+        # The time spent in the original function, for each timed call
+        # currently in progress, innermost last.
+        self.frames: List[float] = []
+
+    def add(self, name: str, seconds: float, calls: int = 1) -> None:
+        total = self.totals.setdefault(name, [0.0, 0])
+        total[0] += seconds
+        total[1] += calls
+
+    def total(self) -> float:
+        return sum(seconds for seconds, calls in self.totals.values())
+
+    def header(self) -> str:
+        metrics = [
+            f'{self.prefix};dur={self.total() * 1000:.3f};desc="livereloadish total"'
+        ]
+        for name, (seconds, calls) in self.totals.items():
+            metrics.append(
+                f'{self.prefix}-{name};dur={seconds * 1000:.3f};desc="{name} x{calls:.0f}"'
+            )
+        return ", ".join(metrics)
+
+
+def current_timings() -> Optional[Timings]:
+    try:
+        return apps.get_app_config("livereloadish").during_request.timings  # type: ignore[attr-defined,no-any-return]
+    except (LookupError, AttributeError):
+        # We're outside of the request/response cycle, or haven't got the
+        # middleware, or the Server-Timing header is turned off.
+        return None
+
+
+def timed(name: str) -> Callable[[F], F]:
+    """
+    Record how long each call to the decorated patch takes, less any time
+    spent within untimed() blocks inside it.
+    """
+
+    def decorator(func: F) -> F:
+        @wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            __traceback_hide__ = True
+            timings = current_timings()
+            if timings is None:
+                return func(*args, **kwargs)
+            timings.frames.append(0.0)
+            started = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = perf_counter() - started
+                timings.add(name, elapsed - timings.frames.pop())
+
+        return cast(F, wrapper)
+
+    return decorator
+
+
+@contextmanager
+def untimed() -> Iterator[None]:
+    """
+    For calling the original, un-patched function from within a timed() patch,
+    so that only the patch's own work is counted against it. Any timed patches
+    called within it still record their own time.
+    """
+    timings = current_timings()
+    if timings is None or not timings.frames:
+        yield
+        return
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        timings.frames[-1] += perf_counter() - started
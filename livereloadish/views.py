@@ -2,16 +2,16 @@ import atexit
 import json
 import logging
 import os
-import socket
+import re
 import sys
+import threading
 import time
-from typing import Any, Union, Iterator
+from functools import lru_cache, partial
+from gzip import compress as gzip_compress
+from hashlib import sha1
+from typing import NamedTuple, Tuple, Union, Iterator
 from uuid import UUID
 
-try:
-    from psutil import sensors_battery
-except ImportError:
-    sensors_battery = None
 from django.apps import apps
 from django.conf import settings
 from django.core.exceptions import (
@@ -20,42 +20,39 @@ from django.core.exceptions import (
     ImproperlyConfigured,
 )
 from django.core.handlers.wsgi import WSGIRequest
-from django.core.servers.basehttp import ServerHandler
 from django.http import (
     StreamingHttpResponse,
     JsonResponse,
     HttpResponse,
     HttpResponseNotAllowed,
+    HttpResponseNotModified,
     Http404,
     FileResponse,
 )
 from django.template.response import TemplateResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
 from django.views import static, View
 
 from livereloadish import LiveReloadishConfig
+from livereloadish.patches import etag_matches
+from livereloadish.watcher import Subscription
 
-__all__ = ["logger", "js", "SSEView", "sse", "stats"]
+__all__ = [
+    "logger",
+    "js",
+    "WatcherScript",
+    "watcher_script",
+    "watcher_script_digest",
+    "fingerprinted_js",
+    "SSEView",
+    "sse",
+    "ready",
+    "visibility",
+    "stats",
+]
 logger = logging.getLogger(__name__)
-
-
-class Timer:
-    __slots__ = ("start", "end")
-
-    def __new__(cls) -> "Timer":
-        instance: "Timer" = super().__new__(cls)
-        instance.start = 0
-        instance.end = 0
-        return instance
-
-    def __enter__(self) -> "Timer":
-        self.start = time.perf_counter_ns()
-        return self
-
-    def __exit__(self, exc_type: Any, exc_val: Any, exc_tb: Any) -> None:
-        self.end = time.perf_counter_ns()
-
-    def elapsed(self) -> float:
-        return (self.end - self.start) * 1e-9  # 1e-6
+re_accepts_brotli = re.compile(r"\bbr\b")
+re_accepts_gzip = re.compile(r"\bgzip\b")
 
 
 def js(
@@ -79,6 +76,107 @@ def js(
     )  # type: ignore[return-value]
 
 
+class WatcherScript(NamedTuple):
+    """
+    The compiled JS, compressed up front rather than by gzip_page on every
+    request, and identified by a hash of its contents so that browsers can
+    cache it forever.
+    """
+
+    digest: str
+    identity: bytes
+    gzip: bytes
+    # Only if brotli is installed, otherwise empty.
+    br: bytes
+
+    @staticmethod
+    def digest_of(content: bytes) -> str:
+        return sha1(content).hexdigest()[:12]
+
+    @classmethod
+    def from_file(cls, path: str) -> "WatcherScript":
+        # brotli is only imported (if it's installed) when it's needed.
+        try:
+            import brotli
+        except ImportError:
+            brotli = None  # type: ignore[assignment]
+        with open(path, "rb") as f:
+            content = f.read()
+        return cls(
+            digest=cls.digest_of(content),
+            identity=content,
+            gzip=gzip_compress(content, compresslevel=9, mtime=0),
+            br=brotli.compress(content) if brotli is not None else b"",
+        )
+
+    def negotiate(self, accept_encoding: str) -> Tuple[str, bytes]:
+        if self.br and re_accepts_brotli.search(accept_encoding):
+            return "br", self.br
+        if re_accepts_gzip.search(accept_encoding):
+            return "gzip", self.gzip
+        return "", self.identity
+
+
+watcher_script_path = os.path.join(
+    os.path.dirname(__file__), "static", "js", "livereloadish.js"
+)
+
+
+watcher_script_lock = threading.Lock()
+
+
+def watcher_script() -> WatcherScript:
+    # Compressed in a background thread by each middleware instance, which
+    # mustn't result in compressing it more than once.
+    with watcher_script_lock:
+        return _watcher_script()
+
+
+@lru_cache(maxsize=1)
+def _watcher_script() -> WatcherScript:
+    return WatcherScript.from_file(watcher_script_path)
+
+
+@lru_cache(maxsize=1)
+def watcher_script_digest() -> str:
+    """
+    The digest alone, which is all that's needed to render pages, without
+    waiting for the script to be compressed.
+    """
+    with open(watcher_script_path, "rb") as f:
+        return WatcherScript.digest_of(f.read())
+
+
+def fingerprinted_js(
+    request: WSGIRequest, digest: str
+) -> Union[HttpResponse, HttpResponseNotModified, HttpResponseNotAllowed]:
+    if request.method not in {"GET"}:
+        return HttpResponseNotAllowed({"GET"})
+    if not settings.DEBUG:
+        raise Http404("Only available when DEBUG=True")
+    script = watcher_script()
+    if digest != script.digest:
+        raise Http404("Invalid file specified")
+    etag = f'"{script.digest}"'
+    response: Union[HttpResponse, HttpResponseNotModified]
+    if etag_matches(request, etag):
+        response = HttpResponseNotModified()
+    else:
+        encoding, content = script.negotiate(
+            request.META.get("HTTP_ACCEPT_ENCODING", "")
+        )
+        response = HttpResponse(content, content_type="text/javascript")
+        if encoding:
+            response["Content-Encoding"] = encoding
+        response["Content-Length"] = len(content)
+    response["ETag"] = etag
+    patch_vary_headers(response, ("Accept-Encoding",))
+    # The URL changes whenever the content does, so there's never any need to
+    # ask again.
+    patch_cache_control(response, public=True, max_age=31536000, immutable=True)
+    return response
+
+
 class SSEView(View):
     def get(self, request: WSGIRequest) -> StreamingHttpResponse:
         if not settings.DEBUG:
@@ -107,6 +205,7 @@ class SSEView(View):
         return StreamingHttpResponse(
             streaming_content=self.loop(
                 request=request,
+                page=req_uuid,
                 reqid=short_req_uuid,
                 last_scan=last_scan,
                 appconf=appconf,
@@ -117,11 +216,11 @@ class SSEView(View):
     def loop(
         self,
         request: WSGIRequest,
+        page: str,
         reqid: str,
         last_scan: float,
         appconf: LiveReloadishConfig,
-    ) -> Iterator[str]:
-        loop_count = 0
+    ) -> Iterator[Union[str, bytes]]:
         logger.info(
             "[%s] Livereloadish SSE client connected at %s, starting",
             reqid,
@@ -130,229 +229,196 @@ class SSEView(View):
         )
         yield f'id: {reqid},{last_scan}\nevent: connect\ndata: {{"msg": "starting file watcher"}}\n\n'
 
-        socket_is_open = True
-        # This is me just finding out and documenting where these things live.
-        # By no means is it an endorsement for trying to use anything other than
-        # runserver for this. AFAIK It'll lock a whole thread permanently until
-        # a client disconnects, so it's only really suitable for local stuff.
-        if "gunicorn.socket" in request.environ:
-            socket_handler: socket.socket = request.environ["gunicorn.socket"]
-        elif "waitress.client_disconnected" in request.environ:
-            # So Waitress has waitress.channel.HTTPChannel.check_client_disconnected
-            # passed in, buuuuuuut calling it once the client has gone away doesn't
-            # work if the channel_request_lookahead isn't set to > 0 ... which requires
-            # setting that for the whole WSGI app via config or CLI. So let's
-            # test the socket the same way as we do for the others, by finding it
-            # in the stack. Bleh.
-            parent_frame = sys._getframe().f_back
-            server_handler = parent_frame.f_locals.get("self", None)  # type: ignore[union-attr]
-            try:
-                socket_handler = server_handler.channel.socket
-            except AttributeError:
-                logger.error(
-                    "[%s] Livereloadish failed to walk the stack backwards to find the socket using waitress as a server, for connection termination",
-                    reqid,
-                    extra={"request": request},
-                )
-                yield f'id: {reqid},{last_scan}\nevent: disconnect\ndata: {{"msg": "stopping file watcher"}}\n\n'
-                socket_is_open = False
-                # runserver and Gunicorn both allow using
-                # raise EnvironmentError(ECONNRESET, "Cancelling SSE before it loops")
-                # but waitress doesn't catch it so it bleeds up.
-                # return ""
-        else:
-            parent_frame = sys._getframe().f_back
-            server_handler = parent_frame.f_locals.get("self", None)  # type: ignore[union-attr]
-            if not isinstance(server_handler, ServerHandler):
-                logger.error(
-                    "[%s] Livereloadish failed to walk the stack backwards to find the ServerHandler in charge of the socket, for connection termination",
-                    reqid,
-                    extra={"request": request},
-                )
-                yield f'id: {reqid},{last_scan}\nevent: disconnect\ndata: {{"msg": "stopping file watcher"}}\n\n'
-                socket_is_open = False
-                # runserver and Gunicorn both allow using
-                # raise EnvironmentError(ECONNRESET, "Cancelling SSE before it loops")
-                # but waitress doesn't catch it so it bleeds up.
-                # return ""
-            socket_handler = server_handler.request_handler.connection
-
-        while socket_is_open:
-            # Test whether the client has hung up, apparently.
-            # https://stackoverflow.com/a/62277798 and
-            # https://stackoverflow.com/a/7589126 combined yo...
-            # Fun fact, all this seems to work fine until you try and kill a waitress
-            # server with current SSE connections, and then it terminates after
-            # timeout with N threads still running (and presumably finally killed)
-            # because in all of these scenarios, BlockingIOError(errno=35) is
-            # returned regardless.
-            is_blocking = socket_handler.getblocking()
-            try:
-                socket_handler.setblocking(False)
-                # I don't know that I need socket.MSG_DONTWAIT | socket.MSG_PEEK if
-                # setblock is already false...
-                socket_data = socket_handler.recv(
-                    16, socket.MSG_DONTWAIT | socket.MSG_PEEK
-                )
-                socket_is_open = len(socket_data) > 0
-            except BlockingIOError:
-                socket_is_open = True
-            except ConnectionResetError:
-                socket_is_open = False
-                logger.debug(
-                    "[%s] Livereloadish client disappeared via 'connection reset by peer'",
-                    reqid,
-                    extra={"request": request},
-                )
-            finally:
-                if is_blocking:
-                    socket_handler.setblocking(is_blocking)
+        watcher = appconf.watcher
+        subscription = watcher.subscribe(reqid)
+        monitor = appconf.disconnect_monitor
+        # The caller of the generator is the server's handler, which is where
+        # the socket lives for anything but gunicorn.
+        server_name, socket_handler = monitor.find_socket(
+            request, sys._getframe().f_back
+        )
+        if socket_handler is None:
+            logger.error(
+                "[%s] Livereloadish failed to find the socket using %s as a server, for connection termination",
+                reqid,
+                server_name,
+                extra={"request": request},
+            )
+            watcher.unsubscribe(subscription)
+            yield f'id: {reqid},{last_scan}\nevent: disconnect\ndata: {{"msg": "stopping file watcher"}}\n\n'
+            # runserver and Gunicorn both allow using
+            # raise EnvironmentError(ECONNRESET, "Cancelling SSE before it loops")
+            # but waitress doesn't catch it so it bleeds up.
+            return
+        if not monitor.register(socket_handler, partial(watcher.close, subscription)):
+            logger.warning(
+                "[%s] Livereloadish cannot monitor the socket using %s as a server, disconnects will only be noticed when sending",
+                reqid,
+                server_name,
+                extra={"request": request},
+            )
+        watcher.start()
+
+        try:
+            yield from self.stream(
+                request, page, reqid, last_scan, appconf, subscription
+            )
+        finally:
+            monitor.unregister(socket_handler)
+            watcher.unsubscribe(subscription)
+
+    def stream(
+        self,
+        request: WSGIRequest,
+        page: str,
+        reqid: str,
+        last_scan: float,
+        appconf: LiveReloadishConfig,
+        subscription: Subscription,
+    ) -> Iterator[Union[str, bytes]]:
+        watcher = appconf.watcher
+
+        # Anything which changed between the page being rendered and the
+        # connection being established won't come through the watcher, because
+        # it may have been noticed before this subscription existed.
+        # Basically a race condition where I'm saving & alt-tabbing quickly after
+        # refreshing and I don't want to miss a change and then assume it's got
+        # stuck and refresh manually again.
+        # Sort of defeats the point of livereload if I don't have faith in it working.
+        for content_type, files in tuple(appconf.seen.items()):
+            for key, file in tuple(files.items()):
+                if file.mtime > last_scan:
+                    data = json.dumps(
+                        {
+                            "msg": "file updated elsewhere",
+                            "asset_type": content_type,
+                            "old_time": last_scan,
+                            "new_time": file.mtime,
+                            "info": file.to_dict(),
+                        }
+                    )
+                    logger.info(
+                        "[%s] Livereloadish change detected before connecting in %s",
+                        reqid,
+                        file.relative_path,
+                        extra={"request": request},
+                    )
+                    yield f"id: {reqid},{last_scan}\nevent: assets_change\ndata: {data}\n\n"
 
-            if not socket_is_open:
+        ping_count = 0
+        while True:
+            # Block until the watcher says something changed, only waking up
+            # without anything to send when it's time for a keep-alive ping,
+            # or when the disconnect monitor says the client went away.
+            changes = watcher.wait(subscription, timeout=appconf.sleep_keepalive)
+
+            if subscription.closed:
                 logger.info(
                     "[%s] Livereloadish client disconnected after %s, cancelling",
                     reqid,
                     last_scan,
                     extra={"request": request},
                 )
-                break
                 # runserver and Gunicorn both allow using
                 # raise EnvironmentError(ECONNRESET, "Cancelling SSE in the loop")
                 # but waitress doesn't catch it so it bleeds up.
-                # return ""
-
-            loop_count += 1
+                return
 
-            min_increment = appconf.sleep_quick
-            if loop_count % 20 == 0:
-                if sensors_battery:
-                    battery_percentage = sensors_battery()
-                    if battery_percentage and battery_percentage.percent <= 50:
-                        min_increment = appconf.sleep_quick * 2
-                yield f'id: {reqid},{last_scan}\nevent: ping\ndata: {{"msg": "keep-alive ping after {loop_count} loops, scanning every {min_increment}s"}}\n\n'
+            last_scan = watcher.last_scan
+            if not changes:
+                ping_count += 1
+                # The page (and any tabs it's relaying for) is still open, so
+                # whatever it used is still being looked at, and shouldn't be
+                # evicted for not being requested.
+                relayed = watcher.relayed_pages.get(reqid, ())
+                appconf.touch_pages((page, *relayed))
+                yield f'id: {reqid},{last_scan}\nevent: ping\ndata: {{"msg": "keep-alive ping after {ping_count} pings, scanning every {watcher.interval}s"}}\n\n'
                 logger.info(
                     "[%s] Livereloadish keep-alive ping, scanning every %ss",
                     reqid,
-                    min_increment,
+                    watcher.interval,
                     extra={"request": request},
                 )
-                appconf.dump_to_lockfile()
-
-            with Timer() as fileiterator:
-                file_count = 0
-                for content_type, files in tuple(appconf.seen.items()):
-                    for key, file in tuple(files.items()):
-                        file_count += 1
-                        # When multiple SSEs are running, each is doing a separate
-                        # scan (yeah not ideal but I also don't care that much and
-                        # don't have more than 2 browsers in play at once so whatever)
-                        # and another scan could trigger a reload in between this
-                        # one's scans, so for it to be picked up we need to track
-                        # when this one last completed and check the mtime against
-                        # that first.
-                        if file.mtime > last_scan:
-                            data = json.dumps(
-                                {
-                                    "msg": "file updated elsewhere",
-                                    "asset_type": content_type,
-                                    "old_time": last_scan,
-                                    "new_time": file.mtime,
-                                    "info": file.to_dict(),
-                                }
-                            )
-                            logger.info(
-                                "[%s] Livereloadish change detected between runs in %s",
-                                reqid,
-                                file.relative_path,
-                                extra={"request": request},
-                            )
-                            yield f"id: {reqid},{last_scan}\nevent: assets_change\ndata: {data}\n\n"
-                            continue
-
-                        # If mtime throws an error, the file in question was deleted
-                        # so trigger a reload, otherwise see if it's newer and if it
-                        # is trigger a change request.
-                        try:
-                            new_mtime: float = os.path.getmtime(key)
-                        except FileNotFoundError:
-                            data = json.dumps(
-                                {
-                                    "msg": "file deleted",
-                                    "asset_type": content_type,
-                                    "old_time": file.mtime,
-                                    "new_time": 0,
-                                    "info": file.to_dict(),
-                                }
-                            )
-                            logger.info(
-                                "[%s] Livereloadish deletion/move detected for %s",
-                                reqid,
-                                file.relative_path,
-                                extra={"request": request},
-                            )
-                            yield f"id: {reqid},{last_scan}\nevent: assets_delete\ndata: {data}\n\n"
-                            appconf.seen[content_type].pop(key, None)
-                        else:
-                            if new_mtime > file.mtime:
-                                data = json.dumps(
-                                    {
-                                        "msg": "file updated",
-                                        "asset_type": content_type,
-                                        "old_time": file.mtime,
-                                        "new_time": new_mtime,
-                                        "info": file.to_dict(),
-                                    }
-                                )
-                                logger.info(
-                                    "[%s] Livereloadish change detected in %s",
-                                    reqid,
-                                    file.relative_path,
-                                    extra={"request": request},
-                                )
-                                yield f"id: {reqid},{last_scan}\nevent: assets_change\ndata: {data}\n\n"
-                                appconf.seen[content_type][key] = file._replace(
-                                    mtime=new_mtime
-                                )
-            last_scan = time.time()
-            scan_duration = fileiterator.elapsed()
-            # Slow down (or stop) the watcher if it starts taking too long...
-            if scan_duration >= min_increment:
-                increment = appconf.sleep_slow
-            elif scan_duration >= appconf.sleep_slow:
-                socket_is_open = False
+                continue
+
+            id_line = f"id: {reqid},{last_scan}\n".encode("utf-8")
+            for change in changes:
                 logger.info(
-                    "[%s] Checking mtimes for %s files took too long (%ss), turning off SSE permanently",
+                    "[%s] Livereloadish sending %s for %s",
                     reqid,
-                    file_count,
-                    scan_duration,
+                    change.event,
+                    change.file.relative_path,
                     extra={"request": request},
                 )
-                continue
-            elif file_count == 0:
-                increment = appconf.sleep_slow
-            else:
-                increment = min_increment
-
-            logger.debug(
-                "[%s] Checking mtimes for %s files took %ss, checking again in %ss",
-                reqid,
-                file_count,
-                scan_duration,
-                increment,
-                extra={"request": request},
-            )
-            # Sleep at the end, because on the first iteration it's probably on
-            # page load and there may have been something to change since
-            # page_load/js_load were set. Basically a race condition where I'm
-            # saving & alt-tabbing quickly after refreshing and I don't want to
-            # miss a change and then assume it's got stuck and refresh manually again.
-            # Sort of defeats the point of livereload if I don't have faith in it working.
-            time.sleep(increment)
+                yield id_line + change.frame
 
 
 sse = SSEView.as_view()
 
 
+def ready(request: WSGIRequest) -> Union[HttpResponse, HttpResponseNotAllowed]:
+    """
+    A cheap way for the client to find out when the server is back after
+    restarting; the outgoing process says it's unavailable until it's gone.
+    """
+    if request.method not in {"GET", "HEAD"}:
+        return HttpResponseNotAllowed({"GET", "HEAD"})
+    if not settings.DEBUG:
+        raise Http404("Only available when DEBUG=True")
+    try:
+        appconf: LiveReloadishConfig = apps.get_app_config("livereloadish")  # type: ignore[assignment]
+    except LookupError:
+        raise Http404("Only available when the livereloadish app is in INSTALLED_APPS")
+    # Until the recently rendered pages have been warmed up, the browser is
+    # better off waiting than racing them.
+    if appconf.watcher.restarting or not appconf.recent_pages.warmed.is_set():
+        return HttpResponse(status=503)
+    return HttpResponse(status=204)
+
+
+def visibility(request: WSGIRequest) -> Union[HttpResponse, HttpResponseNotAllowed]:
+    """
+    Told by the client (using navigator.sendBeacon, so it's a POST even as the
+    page goes away) when it's been hidden or shown, so the watcher can stop
+    scanning while nobody is looking, and catch the page up once they are.
+    """
+    if request.method not in {"POST"}:
+        return HttpResponseNotAllowed({"POST"})
+    if not settings.DEBUG:
+        raise Http404("Only available when DEBUG=True")
+    try:
+        req_uuid = str(UUID(request.GET["uuid"]))
+        short_req_uuid, _ignored, _ignored = req_uuid.partition("-")
+    except (ValueError, KeyError) as e:
+        raise PermissionDenied("Missing livereloadish UUID") from e
+    try:
+        appconf: LiveReloadishConfig = apps.get_app_config("livereloadish")  # type: ignore[assignment]
+    except LookupError:
+        raise Http404("Only available when the livereloadish app is in INSTALLED_APPS")
+    hidden = request.GET.get("hidden", "0") == "1"
+    # The other tabs following along with this one's SSE connection.
+    try:
+        relayed = tuple(
+            str(UUID(page))
+            for page in request.GET.get("relayed", "").split(",")[:100]
+            if page
+        )
+    except ValueError as e:
+        raise PermissionDenied("Invalid livereloadish UUID") from e
+    if appconf.shared_registry is not None:
+        # The SSE connection may be held by another process.
+        appconf.shared_registry.push_visibility(short_req_uuid, hidden, relayed)
+    connections = appconf.watcher.set_hidden(short_req_uuid, hidden, relayed)
+    logger.info(
+        "[%s] Livereloadish page is %s, affecting %s connections",
+        short_req_uuid,
+        "hidden" if hidden else "visible",
+        connections,
+        extra={"request": request},
+    )
+    return HttpResponse(status=204)
+
+
 def stats(
     request: WSGIRequest,
 ) -> Union[TemplateResponse, JsonResponse, HttpResponseNotAllowed]:
@@ -0,0 +1,175 @@
+import json
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+from io import BytesIO
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from django.apps import apps
+from django.core.handlers.wsgi import WSGIHandler, WSGIRequest
+
+__all__ = ["logger", "RecentPage", "RecentPages"]
+logger = logging.getLogger(__name__)
+
+
+class RecentPage(NamedTuple):
+    # No cookies are kept, so the page is rendered anonymously; remembering
+    # the session would mean leaving a usable login lying around in the
+    # temporary directory, and replaying requests as whoever it belonged to.
+    path: str
+    host: str
+    secure: bool
+
+    @classmethod
+    def from_request(cls, request: WSGIRequest) -> "RecentPage":
+        return cls(
+            path=request.get_full_path(),
+            host=request.get_host(),
+            secure=request.is_secure(),
+        )
+
+    def environ(self) -> Dict[str, Any]:
+        path, sep, query = self.path.partition("?")
+        host, sep, port = self.host.partition(":")
+        environ = {
+            "REQUEST_METHOD": "GET",
+            "SCRIPT_NAME": "",
+            "PATH_INFO": path,
+            "QUERY_STRING": query,
+            "SERVER_NAME": host,
+            "SERVER_PORT": port or ("443" if self.secure else "80"),
+            "SERVER_PROTOCOL": "HTTP/1.1",
+            "HTTP_HOST": self.host,
+            "HTTP_ACCEPT": "text/html",
+            RecentPages.header: "1",
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": "https" if self.secure else "http",
+            "wsgi.input": BytesIO(),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        return environ
+
+
+class RecentPages:
+    """
+    The last few HTML pages which were successfully rendered, remembered
+    across restarts so that when the autoreloader brings the server back up,
+    they can be rendered once in the background; that way it's not the
+    browser's reload which pays for URL resolution, imports, compiling
+    templates and so on all being done for the first time.
+
+    Until that's finished, the ready view says the server isn't available, so
+    the browser waits for a warm server rather than racing it, though never for
+    longer than the budget, however long any one page takes to render.
+    """
+
+    # Sent with each of the warm-up requests so they can be told apart.
+    header = "HTTP_X_LIVERELOADISH_WARMUP"
+    # After this many seconds, stop starting new warm-up requests, and stop
+    # saying the server isn't ready because of them.
+    budget = 5.0
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.pages: "OrderedDict[RecentPage, float]" = OrderedDict()
+        self.warmed = threading.Event()
+        self.warmed.set()
+
+    def add(self, request: WSGIRequest) -> int:
+        if self.maxsize < 1 or self.header in request.META:
+            return 0
+        page = RecentPage.from_request(request)
+        with self.lock:
+            self.pages[page] = time.time()
+            self.pages.move_to_end(page)
+            while len(self.pages) > self.maxsize:
+                self.pages.popitem(last=False)
+            return len(self.pages)
+
+    def dumps(self) -> str:
+        with self.lock:
+            return json.dumps(
+                [[*page, when] for page, when in self.pages.items()],
+            )
+
+    def loads(self, data: str, stale_before: float) -> int:
+        try:
+            entries: List[Tuple[str, str, bool, float]] = json.loads(data)
+            pages = [
+                (RecentPage(path, host, secure), when)
+                for path, host, secure, when in entries
+                if when >= stale_before
+            ]
+        except (ValueError, TypeError) as e:
+            logger.warning(
+                "Livereloadish recently rendered pages cache is corrupt", exc_info=e
+            )
+            return 0
+        with self.lock:
+            for page, when in pages[-self.maxsize :]:
+                self.pages[page] = when
+            return len(self.pages)
+
+    def warm_up(self) -> Optional[threading.Thread]:
+        with self.lock:
+            pages = list(reversed(self.pages))
+        if not pages:
+            return None
+        self.warmed.clear()
+        thread = threading.Thread(
+            target=self.render,
+            args=(pages,),
+            daemon=True,
+            name="livereloadish-warmup",
+        )
+        thread.start()
+        # The budget is only checked between pages, and one of them may hang.
+        timer = threading.Timer(self.budget, self.warmed.set)
+        timer.daemon = True
+        timer.start()
+        return thread
+
+    def render(self, pages: List[RecentPage]) -> int:
+        rendered = 0
+        try:
+            # The URLconf and middleware can't be loaded until every app is.
+            apps.ready_event.wait()
+            handler = WSGIHandler()
+            started = time.time()
+            for page in pages:
+                if time.time() - started > self.budget:
+                    logger.debug(
+                        "Livereloadish ran out of time warming up pages, %s left",
+                        len(pages) - rendered,
+                    )
+                    break
+                try:
+                    response = handler(page.environ(), self.start_response)
+                    try:
+                        for chunk in response:
+                            pass
+                    finally:
+                        response.close()
+                except Exception as e:
+                    logger.debug(
+                        "Livereloadish failed to warm up %s", page.path, exc_info=e
+                    )
+                rendered += 1
+            logger.info(
+                "Livereloadish warmed up %s recently rendered pages in %.3fs",
+                rendered,
+                time.time() - started,
+            )
+        finally:
+            self.warmed.set()
+        return rendered
+
+    @staticmethod
+    def start_response(status: str, headers: Any, exc_info: Any = None) -> Any:
+        return lambda data: None
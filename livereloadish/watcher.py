@@ -0,0 +1,560 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import (
+    Any,
+    Deque,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    TYPE_CHECKING,
+)
+
+from .patches import cached_template_count, etag_from_stat
+from .policy import LoadPolicy
+from .signals import asset_changed
+
+if TYPE_CHECKING:
+    from .apps import LiveReloadishConfig, Seen
+    from .registry import SharedRegistry
+
+__all__ = ["logger", "Timer", "Change", "Subscription", "Watcher"]
+logger = logging.getLogger(__name__)
+
+
+class Timer:
+    __slots__ = ("start", "end")
+
+    def __new__(cls) -> "Timer":
+        instance: "Timer" = super().__new__(cls)
+        instance.start = 0
+        instance.end = 0
+        return instance
+
+    def __enter__(self) -> "Timer":
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type: Any, exc_val: Any, exc_tb: Any) -> None:
+        self.end = time.perf_counter_ns()
+
+    def elapsed(self) -> float:
+        return (self.end - self.start) * 1e-9  # 1e-6
+
+
+class Change(NamedTuple):
+    sequence: int
+    event: str
+    msg: str
+    asset_type: str
+    old_time: float
+    new_time: float
+    file: "Seen"
+    # The event and data lines of the SSE message, serialised once by the
+    # watcher and shared by every subscriber, each of which only prefixes its
+    # own id line.
+    frame: bytes = b""
+
+    def encode(self) -> bytes:
+        data = json.dumps(
+            {
+                "msg": self.msg,
+                "asset_type": self.asset_type,
+                "old_time": self.old_time,
+                "new_time": self.new_time,
+                "info": self.file.to_dict(),
+            }
+        )
+        return f"event: {self.event}\ndata: {data}\n\n".encode("utf-8")
+
+
+class Subscription:
+    """
+    The position of a single SSE connection within the Watcher's stream of
+    changes; anything with a sequence higher than the cursor is yet to be sent.
+    While the page (and any tabs relaying through it) is hidden, the cursor
+    stays put, and everything since is sent in one go once it's visible again.
+    """
+
+    __slots__ = ("reqid", "cursor", "closed", "hidden")
+
+    def __init__(self, reqid: str, cursor: int, hidden: bool = False) -> None:
+        self.reqid = reqid
+        self.cursor = cursor
+        self.closed = False
+        self.hidden = hidden
+
+
+class WakeupHandler:
+    """
+    Quacks enough like watchdog's FileSystemEventHandler for an Observer to
+    dispatch to, without needing watchdog imported to define it.
+    """
+
+    __slots__ = ("watcher",)
+
+    def __init__(self, watcher: "Watcher") -> None:
+        self.watcher = watcher
+
+    def dispatch(self, event: Any) -> None:
+        self.watcher.wakeup.set()
+
+
+class Watcher:
+    """
+    A single thread per process which checks the mtimes of everything in the
+    seen registry, and wakes up any SSE connections waiting on the condition
+    when it finds something changed or deleted.
+
+    If watchdog is installed, filesystem events for the directories of the
+    seen files wake the thread up immediately, so changes are picked up in
+    tens of milliseconds and the polling only happens every sleep_slow as a
+    safety net. Otherwise it polls every sleep_quick, as each SSE connection
+    used to do separately, or more or less often as the LoadPolicy decides.
+
+    When every page connected to this process is hidden (or there aren't any)
+    nobody is going to see a change yet, so it only scans every sleep_hidden,
+    ignoring filesystem events, until one of them becomes visible again; unless
+    templates are being cached (see cache_templates), which would go stale.
+    """
+
+    # How many changes are kept around for slow consumers to catch up on.
+    history = 1000
+    # Changes to these will cause Django's autoreloader to restart the process.
+    restart_content_types = ("text/x-python", "application/x-python-code")
+
+    def __init__(self, appconf: "LiveReloadishConfig") -> None:
+        self.appconf = appconf
+        self.condition = threading.Condition()
+        self.changes: Deque[Change] = deque(maxlen=self.history)
+        self.sequence = 0
+        self.wakeup = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.running = False
+        self.observer: Optional[Any] = None
+        self.observed_directories: Set[str] = set()
+        self.scan_count = 0
+        self.last_scan = 0.0
+        self.interval = appconf.sleep_quick
+        self.policy = LoadPolicy(appconf)
+        self.subscriptions: Set[Subscription] = set()
+        # The reqids of pages which said they were hidden, including those
+        # which said so before their SSE connection subscribed.
+        self.hidden_pages: Set[str] = set()
+        # The uuids of the other tabs each page's SSE connection is relaying
+        # for, by reqid, so that their files are kept alive by its pings too.
+        self.relayed_pages: Dict[str, Tuple[str, ...]] = {}
+        # Set once the process is about to be restarted by Django's autoreloader.
+        self.restarting = False
+
+    def start(self) -> bool:
+        with self.condition:
+            if self.thread is not None and self.thread.is_alive():
+                return False
+            self.running = True
+            self.thread = threading.Thread(
+                target=self.run, name="livereloadish-watcher", daemon=True
+            )
+            self.thread.start()
+        logger.debug("Livereloadish watcher thread started")
+        return True
+
+    def stop(self) -> bool:
+        if not self.running:
+            return False
+        self.running = False
+        self.wakeup.set()
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer = None
+            self.observed_directories.clear()
+        return True
+
+    def is_fresh(self) -> bool:
+        """
+        Whether the mtimes in the seen registry can be trusted without stat'ing
+        the files again, because this is running and has checked them recently.
+        """
+        return self.running and (time.time() - self.last_scan) <= (
+            self.interval + self.appconf.sleep_slow
+        )
+
+    def start_observer(self) -> bool:
+        # watchdog takes a while to import, so it's left until the watcher
+        # thread starts rather than slowing down every restart.
+        try:
+            from watchdog.observers import Observer
+        except ImportError:
+            logger.debug(
+                "Livereloadish watcher is polling, install watchdog for filesystem events"
+            )
+            return False
+        self.observer = Observer()
+        self.observer.daemon = True
+        self.observer.start()
+        for files in tuple(self.appconf.seen.values()):
+            for key in tuple(files):
+                self.watch(key)
+        return True
+
+    def watch(self, absolute_path: str) -> bool:
+        """
+        Ask for filesystem events for the directory containing the given file,
+        if watchdog is available and it's not already being observed.
+        """
+        if self.observer is None:
+            return False
+        directory = os.path.dirname(absolute_path)
+        if directory in self.observed_directories:
+            return False
+        self.observed_directories.add(directory)
+        try:
+            self.observer.schedule(WakeupHandler(self), directory, recursive=False)
+        except OSError as e:
+            logger.debug(
+                "Livereloadish failed to observe %s for filesystem events",
+                directory,
+                exc_info=e,
+            )
+            return False
+        return True
+
+    def run(self) -> None:
+        self.start_observer()
+        while self.running:
+            try:
+                with Timer() as fileiterator:
+                    registry = self.appconf.shared_registry
+                    if registry is None:
+                        file_count = self.scan()
+                    else:
+                        if registry.pull_seen(self.appconf.seen):
+                            # Files seen by other processes need observing too.
+                            for files in tuple(self.appconf.seen.values()):
+                                for key in tuple(files):
+                                    self.watch(key)
+                        # Pages may say they're hidden or visible to any of
+                        # the processes, not just the one they're connected to.
+                        for reqid, hidden, relayed in registry.pull_visibility():
+                            self.set_hidden(reqid, hidden, relayed)
+                        if registry.lead():
+                            file_count = self.scan(registry)
+                        else:
+                            file_count = self.follow(registry)
+            except Exception as e:
+                logger.exception(
+                    "Livereloadish watcher failed to check mtimes", exc_info=e
+                )
+                file_count = 0
+            self.last_scan = time.time()
+            self.scan_count += 1
+            self.policy.sample(self.last_scan)
+            self.interval = self.policy.interval(
+                fileiterator.elapsed(), file_count, observing=self.observer is not None
+            )
+            logger.debug(
+                "Checking mtimes for %s files took %ss, checking again in %ss",
+                file_count,
+                fileiterator.elapsed(),
+                self.interval,
+            )
+            if self.scan_count % 20 == 0:
+                self.appconf.evict_stale()
+                self.appconf.dump_to_lockfile()
+            if self.is_unwatched():
+                self.wait_until_visible()
+            elif self.wakeup.wait(self.interval):
+                self.wakeup.clear()
+                # Editors tend to write files in more than one step (truncate,
+                # write, chmod...) so let the burst of events settle first.
+                time.sleep(self.appconf.sleep_settle)
+
+    def is_unwatched(self) -> bool:
+        """
+        Whether there's no visible page for changes to be sent to. Only ever
+        the case without a shared registry, because this process may be
+        scanning on behalf of pages connected to the others, and without any
+        cached templates, which need evicting before they're next rendered.
+        """
+        if self.appconf.shared_registry is not None:
+            return False
+        if self.appconf.cache_templates and cached_template_count():
+            return False
+        with self.condition:
+            return all(
+                subscription.closed or subscription.hidden
+                for subscription in self.subscriptions
+            )
+
+    def wait_until_visible(self) -> bool:
+        """
+        Sleep for sleep_hidden, waking up early only if a page connects or
+        becomes visible (or templates get cached), rather than for filesystem
+        events. Returns whether it woke up early.
+        """
+        deadline = time.time() + self.appconf.sleep_hidden
+        logger.debug(
+            "Livereloadish has no visible pages, checking again in %ss",
+            self.appconf.sleep_hidden,
+        )
+        while self.running:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            # Templates being cached doesn't wake anything up, so look again
+            # as often as the scanning otherwise would.
+            if self.wakeup.wait(min(remaining, self.interval)):
+                self.wakeup.clear()
+            if not self.is_unwatched():
+                return True
+        return False
+
+    def scan(self, registry: Optional["SharedRegistry"] = None) -> int:
+        file_count = 0
+        found: List[Change] = []
+        for content_type, files in tuple(self.appconf.seen.items()):
+            for key, file in tuple(files.items()):
+                file_count += 1
+                # If mtime throws an error, the file in question was deleted
+                # so trigger a reload, otherwise see if it's newer and if it
+                # is trigger a change request.
+                try:
+                    stat = os.stat(key)
+                except FileNotFoundError:
+                    logger.info(
+                        "Livereloadish deletion/move detected for %s",
+                        file.relative_path,
+                    )
+                    found.append(
+                        Change(
+                            sequence=0,
+                            event="assets_delete",
+                            msg="file deleted",
+                            asset_type=content_type,
+                            old_time=file.mtime,
+                            new_time=0,
+                            file=file,
+                        )
+                    )
+                    files.pop(key, None)
+                    if registry is not None:
+                        registry.forget(key)
+                else:
+                    new_mtime: float = stat.st_mtime
+                    if (
+                        new_mtime > file.mtime
+                        and content_type in self.restart_content_types
+                        and self.appconf.django_reloader is not None
+                    ):
+                        # Django's autoreloader is going to restart the process
+                        # because of this, and listen_for_python_changes will
+                        # announce it when it does.
+                        files[key] = file._replace(mtime=new_mtime)
+                    elif new_mtime > file.mtime:
+                        logger.info(
+                            "Livereloadish change detected in %s",
+                            file.relative_path,
+                        )
+                        found.append(
+                            Change(
+                                sequence=0,
+                                event="assets_change",
+                                msg="file updated",
+                                asset_type=content_type,
+                                old_time=file.mtime,
+                                new_time=new_mtime,
+                                file=file,
+                            )
+                        )
+                        files[key] = file._replace(
+                            mtime=new_mtime,
+                            etag=etag_from_stat(stat) if file.etag else "",
+                        )
+                        if registry is not None:
+                            registry.remember(content_type, files[key])
+        if found:
+            if registry is not None:
+                registry.push_changes(found)
+            self.publish(found)
+        return file_count
+
+    def follow(self, registry: "SharedRegistry") -> int:
+        """
+        Another process is doing the scanning, so publish whatever it found
+        to the SSE connections held by this one.
+        """
+        changes = registry.pull_changes()
+        for change in changes:
+            files = self.appconf.seen.get(change.asset_type, {})
+            if change.event == "assets_delete":
+                files.pop(change.file.absolute_path, None)
+            else:
+                files[change.file.absolute_path] = change.file._replace(
+                    mtime=change.new_time, etag=""
+                )
+        if changes:
+            logger.info(
+                "Livereloadish received %s changes from the scanning process",
+                len(changes),
+            )
+            self.publish(changes)
+        return sum(len(files) for files in self.appconf.seen.values())
+
+    def publish(self, changes: List[Change]) -> int:
+        # Let anything holding onto the old contents (eg: cached templates)
+        # throw them away before the browser is told to fetch them again.
+        for change in changes:
+            for receiver, response in asset_changed.send_robust(
+                sender=self.__class__, change=change
+            ):
+                if isinstance(response, Exception):
+                    logger.error(
+                        "Livereloadish asset_changed receiver %r failed for %s",
+                        receiver,
+                        change.file.relative_path,
+                        exc_info=response,
+                    )
+        with self.condition:
+            for change in changes:
+                self.sequence += 1
+                self.changes.append(
+                    change._replace(sequence=self.sequence, frame=change.encode())
+                )
+            self.condition.notify_all()
+            return self.sequence
+
+    def subscribe(self, reqid: str) -> Subscription:
+        registry = self.appconf.shared_registry
+        hidden = registry is not None and registry.is_hidden(reqid)
+        with self.condition:
+            subscription = Subscription(
+                reqid=reqid,
+                cursor=self.sequence,
+                hidden=hidden or reqid in self.hidden_pages,
+            )
+            self.subscriptions.add(subscription)
+        if not subscription.hidden:
+            # Anything changed while nobody was looking gets found now.
+            self.wakeup.set()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self.condition:
+            self.subscriptions.discard(subscription)
+            if not any(
+                other.reqid == subscription.reqid for other in self.subscriptions
+            ):
+                self.hidden_pages.discard(subscription.reqid)
+                self.relayed_pages.pop(subscription.reqid, None)
+            self.condition.notify_all()
+
+    def set_hidden(
+        self, reqid: str, hidden: bool, relayed: Tuple[str, ...] = ()
+    ) -> int:
+        """
+        Record whether the page with the given reqid can be seen, and which
+        other tabs it's relaying for, returning how many SSE connections it
+        had. Becoming visible scans immediately and sends anything held back
+        while it was hidden.
+        """
+        with self.condition:
+            if hidden:
+                self.hidden_pages.add(reqid)
+            else:
+                self.hidden_pages.discard(reqid)
+            if relayed:
+                self.relayed_pages[reqid] = relayed
+            else:
+                self.relayed_pages.pop(reqid, None)
+            count = 0
+            for subscription in self.subscriptions:
+                if subscription.reqid == reqid:
+                    subscription.hidden = hidden
+                    count += 1
+            self.condition.notify_all()
+        if not hidden:
+            self.wakeup.set()
+        return count
+
+    def close(self, subscription: Subscription) -> None:
+        """
+        Wake up the given subscription so that it can stop, because the client
+        went away.
+        """
+        with self.condition:
+            subscription.closed = True
+            self.condition.notify_all()
+
+    def wait(self, subscription: Subscription, timeout: float) -> List[Change]:
+        """
+        Block until there are changes the subscription hasn't seen yet, or
+        until the timeout expires, in which case nothing is returned and it's
+        time for a keep-alive ping. Also returns early if the subscription
+        was closed.
+
+        Hidden subscriptions are only woken for a restart, and otherwise get
+        everything they missed when they're visible again, reduced to the
+        latest change for each file.
+        """
+        with self.condition:
+            self.condition.wait_for(
+                lambda: subscription.closed
+                or (
+                    self.sequence > subscription.cursor
+                    and (self.restarting or not subscription.hidden)
+                ),
+                timeout=timeout,
+            )
+            if subscription.hidden and not self.restarting:
+                return []
+            changes = self.coalesce(
+                [
+                    change
+                    for change in self.changes
+                    if change.sequence > subscription.cursor
+                ]
+            )
+            subscription.cursor = self.sequence
+            if self.restarting:
+                # Let announce_restart know this one has been told.
+                self.condition.notify_all()
+        return changes
+
+    @staticmethod
+    def coalesce(changes: List[Change]) -> List[Change]:
+        """
+        Only the last change for each file, in the order they last changed,
+        so a file saved repeatedly while the page was hidden is fetched once.
+        """
+        latest: Dict[str, Change] = {}
+        for change in changes:
+            latest.pop(change.file.absolute_path, None)
+            latest[change.file.absolute_path] = change
+        return list(latest.values())
+
+    def announce_restart(self, change: Change, timeout: float) -> bool:
+        """
+        Tell every SSE connection that the process is about to go away, and
+        wait (briefly) for them to have picked that up, so that the clients
+        can start waiting for the new process rather than finding out when
+        their connection drops.
+        """
+        self.restarting = True
+        sequence = self.publish([change])
+        with self.condition:
+            flushed = self.condition.wait_for(
+                lambda: all(
+                    subscription.closed or subscription.cursor >= sequence
+                    for subscription in self.subscriptions
+                ),
+                timeout=timeout,
+            )
+        # Give the connections a moment to actually write it out.
+        time.sleep(self.appconf.sleep_settle)
+        return flushed
@@ -0,0 +1,21 @@
+import os
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEBUG = True
+SECRET_KEY = "livereloadish-tests"
+ALLOWED_HOSTS = ["*"]
+ROOT_URLCONF = "tests.urls"
+INSTALLED_APPS = [
+    "django.contrib.staticfiles",
+    "livereloadish.apps.LiveReloadishConfig",
+]
+MIDDLEWARE = ["livereloadish.middleware.LivereloadishMiddleware"]
+STATIC_URL = "/static/"
+TEMPLATES = [
+    {
+        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        "DIRS": [],
+        "OPTIONS": {},
+    }
+]
+DATABASES = {}
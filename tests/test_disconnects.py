@@ -0,0 +1,50 @@
+import socket
+import threading
+
+from django.test import RequestFactory, SimpleTestCase
+
+from livereloadish.disconnects import (
+    DisconnectMonitor,
+    GunicornAdapter,
+    SocketAdapter,
+)
+
+
+class DisconnectMonitorTestCase(SimpleTestCase):
+    def setUp(self) -> None:
+        self.server, self.client = socket.socketpair()
+        self.addCleanup(self.server.close)
+        self.addCleanup(self.client.close)
+        self.monitor = DisconnectMonitor(adapters=(SocketAdapter(), GunicornAdapter()))
+        self.monitor.select_timeout = 0.05
+
+    def test_finds_socket_with_the_first_adapter_which_applies(self) -> None:
+        request = RequestFactory().get("/")
+        self.assertEqual(self.monitor.find_socket(request, None), ("unknown", None))
+        request.environ["gunicorn.socket"] = self.server
+        self.assertEqual(
+            self.monitor.find_socket(request, None), ("gunicorn", self.server)
+        )
+
+    def test_hanging_up_calls_back(self) -> None:
+        disconnected = threading.Event()
+        self.assertTrue(self.monitor.register(self.server, disconnected.set))
+        self.assertFalse(disconnected.wait(0.1))
+        self.client.close()
+        self.assertTrue(disconnected.wait(2.0))
+        # Only called back the once, and then forgotten about.
+        self.assertFalse(self.monitor.unregister(self.server))
+
+    def test_sending_data_stops_monitoring_without_calling_back(self) -> None:
+        disconnected = threading.Event()
+        self.assertTrue(self.monitor.register(self.server, disconnected.set))
+        self.client.sendall(b"x")
+        self.assertFalse(disconnected.wait(0.3))
+        self.assertFalse(self.monitor.unregister(self.server))
+
+    def test_unregistered_socket_is_not_called_back(self) -> None:
+        disconnected = threading.Event()
+        self.assertTrue(self.monitor.register(self.server, disconnected.set))
+        self.assertTrue(self.monitor.unregister(self.server))
+        self.client.close()
+        self.assertFalse(disconnected.wait(0.2))
@@ -0,0 +1,64 @@
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from livereloadish.fragments import extract_fragment
+from livereloadish.middleware import LivereloadishMiddleware
+
+PAGE = """<!DOCTYPE html>
+<html>
+<head><title>Page</title><link rel="stylesheet" href="/a.css"><style>p{}</style></head>
+<body class="x">
+<div id="main">
+  <div class="inner"><div>nested</div></div>
+  <p>after</p>
+</div>
+<div id="footer">footer</div>
+</body>
+</html>"""
+
+
+class ExtractFragmentTestCase(SimpleTestCase):
+    def test_body(self) -> None:
+        self.assertEqual(
+            extract_fragment(PAGE, "body"),
+            "<title>Page</title><style>p{}</style>"
+            + PAGE[PAGE.index("<body") : PAGE.index("</html>") - 1],
+        )
+
+    def test_element_by_id(self) -> None:
+        self.assertEqual(
+            extract_fragment(PAGE, "main"),
+            "<title>Page</title><style>p{}</style>"
+            '<div id="main">\n'
+            '  <div class="inner"><div>nested</div></div>\n'
+            "  <p>after</p>\n"
+            "</div>",
+        )
+
+    def test_unknown_id(self) -> None:
+        self.assertIsNone(extract_fragment(PAGE, "missing"))
+
+    def test_no_body(self) -> None:
+        self.assertIsNone(extract_fragment("<p>partial</p>", "body"))
+
+
+@override_settings(DEBUG=True)
+class FragmentMiddlewareTestCase(SimpleTestCase):
+    def get(self, fragment: str) -> HttpResponse:
+        middleware = LivereloadishMiddleware(lambda request: HttpResponse(PAGE))
+        request = RequestFactory().get("/", HTTP_X_LIVERELOADISH_FRAGMENT=fragment)
+        return middleware(request)  # type: ignore[return-value]
+
+    def test_only_the_element_is_sent(self) -> None:
+        response = self.get("main")
+        self.assertEqual(response["X-Livereloadish-Fragment"], "main")
+        content = response.content.decode("utf-8")
+        self.assertTrue(content.startswith("<title>Page</title>"))
+        self.assertNotIn("footer", content)
+
+    def test_unknown_id_falls_back_to_the_whole_page(self) -> None:
+        response = self.get("missing")
+        self.assertNotIn("X-Livereloadish-Fragment", response)
+        content = response.content.decode("utf-8")
+        self.assertTrue(content.startswith("<!DOCTYPE html>"))
+        self.assertIn('<div id="footer">footer</div>', content)
@@ -0,0 +1,148 @@
+import os
+import shutil
+import tempfile
+
+from unittest import mock
+
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage
+from django.template import Context, Engine, RequestContext, Template
+from django.test import RequestFactory, SimpleTestCase
+from django.utils.http import http_date
+
+from livereloadish import patches
+from livereloadish.apps import Seen
+from livereloadish.patches import (
+    patched_serve,
+    patched_template_render,
+    storage_file_mtime,
+)
+
+
+class PatchedServeTestCase(SimpleTestCase):
+    def setUp(self) -> None:
+        self.document_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.document_root)
+        self.path = os.path.join(self.document_root, "test.css")
+        self.factory = RequestFactory()
+
+    def write(self, content: str, mtime_ns: int) -> None:
+        with open(self.path, "w") as f:
+            f.write(content)
+        os.utime(self.path, ns=(mtime_ns, mtime_ns))
+
+    def test_changed_within_the_same_second_is_not_304(self) -> None:
+        second = 1_700_000_000 * 10**9
+        self.write("a{}", second + 100)
+        first = patched_serve(
+            self.factory.get("/static/test.css"), "test.css", self.document_root
+        )
+        self.assertEqual(first.status_code, 200)
+        first.close()
+        self.write("a{color:red}", second + 200)
+        request = self.factory.get(
+            "/static/test.css",
+            HTTP_IF_NONE_MATCH=first["ETag"],
+            HTTP_IF_MODIFIED_SINCE=http_date(second // 10**9),
+        )
+        response = patched_serve(request, "test.css", self.document_root)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], first["ETag"])
+        response.close()
+
+    def test_unchanged_is_304_by_etag(self) -> None:
+        self.write("a{}", 1_700_000_000 * 10**9)
+        first = patched_serve(
+            self.factory.get("/static/test.css"), "test.css", self.document_root
+        )
+        first.close()
+        request = self.factory.get(
+            "/static/test.css", HTTP_IF_NONE_MATCH=first["ETag"]
+        )
+        response = patched_serve(request, "test.css", self.document_root)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], first["ETag"])
+
+
+class PatchedTemplateRenderTestCase(SimpleTestCase):
+    def setUp(self) -> None:
+        self.engine = Engine(
+            loaders=[
+                (
+                    "django.template.loaders.locmem.Loader",
+                    {
+                        "page.html": "{% include 'row.html' %}{% include 'row.txt' %}",
+                        "row.html": "<p>{{ value }}</p>",
+                        "row.txt": "<{{ value }}>",
+                    },
+                )
+            ]
+        )
+        appconf = apps.get_app_config("livereloadish")
+        appconf.during_request.templates = {}
+        self.addCleanup(delattr, appconf.during_request, "templates")
+        patcher = mock.patch.object(Template, "render", patched_template_render)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_html_rendered_with_the_request_is_annotated(self) -> None:
+        request = RequestFactory().get("/")
+        output = self.engine.get_template("page.html").render(
+            RequestContext(request, {"value": "a"})
+        )
+        self.assertEqual(
+            output,
+            "<!--livereloadish:row.html--><p>a</p><!--/livereloadish:row.html--><a>",
+        )
+
+    def test_rendered_without_the_request_is_not_annotated(self) -> None:
+        output = self.engine.get_template("page.html").render(Context({"value": "a"}))
+        self.assertEqual(output, "<p>a</p><a>")
+
+
+class StorageFileMtimeTestCase(SimpleTestCase):
+    def setUp(self) -> None:
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location)
+        self.storage = FileSystemStorage(location=self.location)
+        self.path = os.path.join(self.location, "upload.png")
+        with open(self.path, "wb") as f:
+            f.write(b"png")
+        os.utime(self.path, (1_000_000, 1_000_000))
+        for cache in (patches.storage_file_mtimes, patches.found_storage_files):
+            patcher = mock.patch.dict(cache, clear=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.appconf = apps.get_app_config("livereloadish")
+
+    def test_stat_at_most_every_sleep_slow(self) -> None:
+        with mock.patch("livereloadish.patches.time.time", return_value=5_000.0):
+            self.assertEqual(
+                storage_file_mtime(self.storage, "upload.png"),
+                (self.path, 1_000_000),
+            )
+            os.utime(self.path, (1_000_010, 1_000_010))
+            self.assertEqual(
+                storage_file_mtime(self.storage, "upload.png"),
+                (self.path, 1_000_000),
+            )
+        later = 5_000.0 + self.appconf.sleep_slow + 0.1
+        with mock.patch("livereloadish.patches.time.time", return_value=later):
+            self.assertEqual(
+                storage_file_mtime(self.storage, "upload.png"),
+                (self.path, 1_000_010),
+            )
+
+    def test_missing(self) -> None:
+        self.assertIsNone(storage_file_mtime(self.storage, "missing.png"))
+
+    def test_tracked_file_uses_the_watchers_mtime(self) -> None:
+        seen = Seen("upload.png", self.path, "upload.png", 1_000_020, False)
+        with mock.patch.object(
+            self.appconf, "seen", {"image/png": {self.path: seen}}
+        ), mock.patch.object(self.appconf.watcher, "is_fresh", return_value=True):
+            self.assertEqual(
+                storage_file_mtime(self.storage, "upload.png"),
+                (self.path, 1_000_020),
+            )
+        self.assertEqual(patches.storage_file_mtimes, {})
@@ -0,0 +1,61 @@
+from unittest import mock
+
+from django.apps import apps
+from django.test import SimpleTestCase
+
+from livereloadish.policy import LoadPolicy
+
+
+class LoadPolicyIntervalTestCase(SimpleTestCase):
+    def setUp(self) -> None:
+        self.appconf = apps.get_app_config("livereloadish")
+        self.policy = LoadPolicy(self.appconf)
+        # Somewhere between idle and busy, on mains power.
+        self.policy.load = (self.appconf.load_idle + self.appconf.load_busy) / 2
+
+    def interval(
+        self, scan: float = 0.001, files: int = 10, observing: bool = False
+    ) -> float:
+        return self.policy.interval(scan, files, observing)
+
+    def test_normal(self) -> None:
+        self.assertEqual(self.interval(), self.appconf.sleep_quick)
+
+    def test_nothing_to_scan(self) -> None:
+        self.assertEqual(self.interval(files=0), self.appconf.sleep_slow)
+
+    def test_busy(self) -> None:
+        self.policy.load = self.appconf.load_busy
+        self.assertEqual(self.interval(), self.appconf.sleep_slow)
+        self.policy.load = None
+        self.policy.cpu_share = self.appconf.load_self
+        self.assertEqual(self.interval(), self.appconf.sleep_slow)
+
+    def test_idle(self) -> None:
+        self.policy.load = 0.0
+        self.assertEqual(self.interval(), self.appconf.sleep_idle)
+        # Unless the battery's low.
+        self.policy.on_battery = True
+        self.assertEqual(self.interval(), self.appconf.sleep_quick * 2)
+
+    def test_slow_scan(self) -> None:
+        self.assertEqual(
+            self.interval(scan=self.appconf.sleep_quick),
+            max(self.appconf.sleep_quick, self.appconf.sleep_slow),
+        )
+
+    def test_observing(self) -> None:
+        self.assertEqual(self.interval(observing=True), self.appconf.sleep_slow)
+        self.policy.load = self.appconf.load_busy
+        self.assertEqual(self.interval(observing=True), self.appconf.sleep_slow * 2)
+
+
+class LoadPolicySampleTestCase(SimpleTestCase):
+    def test_only_sampled_every_so_often(self) -> None:
+        appconf = apps.get_app_config("livereloadish")
+        policy = LoadPolicy(appconf)
+        with mock.patch.object(LoadPolicy, "battery_is_low", return_value=True):
+            self.assertTrue(policy.sample(1000.0))
+            self.assertTrue(policy.on_battery)
+            self.assertFalse(policy.sample(1000.0 + appconf.sleep_sample / 2))
+            self.assertTrue(policy.sample(1000.0 + appconf.sleep_sample))
@@ -0,0 +1,50 @@
+import os
+import shutil
+import tempfile
+
+from django.test import SimpleTestCase
+
+from livereloadish.manifests import PageManifests
+from livereloadish.registry import SharedRegistry
+
+
+class SharedRegistryTestCase(SimpleTestCase):
+    def setUp(self) -> None:
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "seen.sqlite3")
+        # Two processes, as far as the registry can tell.
+        self.first = SharedRegistry(path)
+        self.second = SharedRegistry(path)
+
+    def test_page_manifest_rendered_by_another_process(self) -> None:
+        PageManifests(registry=self.first).add(
+            "a" * 32,
+            {"page.html": "/templates/page.html"},
+            {"app.css": "/static/app.css"},
+        )
+        manifest = PageManifests(registry=self.second).get("a" * 32)
+        self.assertEqual(
+            manifest,
+            {
+                "templates": {"page.html": "/templates/page.html"},
+                "files": {"app.css": "/static/app.css"},
+            },
+        )
+        self.assertIsNone(PageManifests(registry=self.second).get("b" * 32))
+
+    def test_visibility_reported_to_another_process(self) -> None:
+        # Nothing from before this process first looked gets replayed.
+        self.first.push_visibility("old", True)
+        self.assertEqual(self.second.pull_visibility(), [])
+        self.first.push_visibility("abc", True)
+        self.first.push_visibility("def", True)
+        self.first.push_visibility("abc", False, ("a" * 32, "b" * 32))
+        self.assertEqual(
+            self.second.pull_visibility(),
+            [("def", True, ()), ("abc", False, ("a" * 32, "b" * 32))],
+        )
+        self.assertEqual(self.second.pull_visibility(), [])
+        self.assertTrue(self.second.is_hidden("def"))
+        self.assertFalse(self.second.is_hidden("abc"))
+        self.assertFalse(self.second.is_hidden("xyz"))
@@ -0,0 +1,24 @@
+from django.apps import apps
+from django.test import SimpleTestCase
+
+from livereloadish.rules import WatchRules
+
+
+class WatchRulesTestCase(SimpleTestCase):
+    installed = (
+        "/venv/lib/python3.9/site-packages/django/contrib/admin/static/admin/base.css"
+    )
+
+    def test_everything_tracked_by_default(self) -> None:
+        appconf = apps.get_app_config("livereloadish")
+        self.assertEqual(appconf.watch_exclude, ())
+        self.assertTrue(appconf.watch_rules.allows(self.installed, "text/css"))
+        self.assertTrue(appconf.should_track("text/css", self.installed))
+
+    def test_excluding_packages(self) -> None:
+        rules = WatchRules(include=(), exclude=WatchRules.packages)
+        self.assertFalse(rules.allows(self.installed, "text/css"))
+        self.assertFalse(
+            rules.allows("/srv/app/node_modules/x/x.js", "text/javascript")
+        )
+        self.assertTrue(rules.allows("/srv/app/static/app.css", "text/css"))
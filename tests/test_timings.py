@@ -0,0 +1,66 @@
+from unittest import mock
+
+from django.apps import apps
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from livereloadish.middleware import LivereloadishMiddleware
+from livereloadish.timings import Timings, timed, untimed
+
+
+class TimingsTestCase(SimpleTestCase):
+    def test_header(self) -> None:
+        timings = Timings()
+        timings.add("find-static", 0.001)
+        timings.add("find-static", 0.002)
+        timings.add("html", 0.0005, calls=1)
+        self.assertAlmostEqual(timings.total(), 0.0035)
+        self.assertEqual(
+            timings.header(),
+            'livereloadish;dur=3.500;desc="livereloadish total", '
+            'livereloadish-find-static;dur=3.000;desc="find-static x2", '
+            'livereloadish-html;dur=0.500;desc="html x1"',
+        )
+
+    def test_timed_excludes_untimed(self) -> None:
+        timings = Timings()
+        appconf = apps.get_app_config("livereloadish")
+        appconf.during_request.timings = timings
+        self.addCleanup(delattr, appconf.during_request, "timings")
+
+        @timed("patch")
+        def patch() -> str:
+            with untimed():
+                return "original"
+
+        # Started, untimed started, untimed finished, finished.
+        with mock.patch(
+            "livereloadish.timings.perf_counter", side_effect=[0, 1, 9, 10]
+        ):
+            self.assertEqual(patch(), "original")
+        self.assertEqual(timings.totals, {"patch": [2.0, 1]})
+        self.assertEqual(timings.frames, [])
+
+    def test_nothing_recorded_outside_a_request(self) -> None:
+        @timed("patch")
+        def patch() -> int:
+            return 1
+
+        with mock.patch("livereloadish.timings.perf_counter") as clock:
+            self.assertEqual(patch(), 1)
+        clock.assert_not_called()
+
+
+@override_settings(DEBUG=True)
+class ServerTimingMiddlewareTestCase(SimpleTestCase):
+    def test_header_added_to_existing(self) -> None:
+        def view(request: object) -> HttpResponse:
+            response = HttpResponse("<html><head></head><body></body></html>")
+            response["Server-Timing"] = "db;dur=1"
+            return response
+
+        response = LivereloadishMiddleware(view)(RequestFactory().get("/"))
+        header = response["Server-Timing"]
+        self.assertTrue(header.startswith("db;dur=1, livereloadish;dur="))
+        self.assertIn("livereloadish-html;dur=", header)
+        self.assertIn('desc="html x1"', header)
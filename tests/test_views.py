@@ -0,0 +1,62 @@
+import time
+import uuid
+from unittest import mock
+
+from django.apps import apps
+from django.core.exceptions import PermissionDenied
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from livereloadish.views import SSEView, visibility
+
+
+@override_settings(DEBUG=True)
+class RelayedPagesTestCase(SimpleTestCase):
+    def setUp(self) -> None:
+        self.appconf = apps.get_app_config("livereloadish")
+        self.factory = RequestFactory()
+        self.leader = str(uuid.uuid4())
+        self.follower = str(uuid.uuid4())
+        self.reqid = self.leader.partition("-")[0]
+        self.appconf.page_manifests.add(
+            self.leader, {"base.html": "/templates/base.html"}, {}
+        )
+        # Only the following tab has this one, and it never pings for itself.
+        self.appconf.page_manifests.add(
+            self.follower, {}, {"follower.css": "/static/follower.css"}
+        )
+        for path in ("/templates/base.html", "/static/follower.css"):
+            self.addCleanup(self.appconf.last_requested.pop, path, None)
+
+    def test_leaders_ping_keeps_follower_only_files_alive(self) -> None:
+        response = visibility(
+            self.factory.post(f"/?uuid={self.leader}&hidden=0&relayed={self.follower}")
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(
+            self.appconf.watcher.relayed_pages[self.reqid], (self.follower,)
+        )
+        watcher = self.appconf.watcher
+        subscription = watcher.subscribe(self.reqid)
+        self.addCleanup(watcher.unsubscribe, subscription)
+        request = self.factory.get(f"/?uuid={self.leader}")
+        with mock.patch.object(self.appconf, "sleep_keepalive", 0.01):
+            frames = SSEView().stream(
+                request,
+                self.leader,
+                self.reqid,
+                time.time(),
+                self.appconf,
+                subscription,
+            )
+            for frame in frames:
+                if "event: ping" in frame:
+                    break
+            frames.close()
+        self.assertIn("/templates/base.html", self.appconf.last_requested)
+        self.assertIn("/static/follower.css", self.appconf.last_requested)
+
+    def test_invalid_relayed_page(self) -> None:
+        with self.assertRaises(PermissionDenied):
+            visibility(
+                self.factory.post(f"/?uuid={self.leader}&hidden=0&relayed=nope")
+            )
@@ -0,0 +1,59 @@
+import os
+import shutil
+import stat
+import tempfile
+import threading
+from unittest import mock
+
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage
+from django.test import RequestFactory, SimpleTestCase
+
+from livereloadish.warmup import RecentPages
+
+
+class RecentPagesTestCase(SimpleTestCase):
+    def setUp(self) -> None:
+        self.factory = RequestFactory()
+        self.request = self.factory.get("/private/?page=2")
+        self.request.COOKIES["sessionid"] = "secret-session-key"
+
+    def test_session_is_not_remembered_or_replayed(self) -> None:
+        pages = RecentPages(maxsize=5)
+        self.assertEqual(pages.add(self.request), 1)
+        self.assertNotIn("secret-session-key", pages.dumps())
+        (page,) = pages.pages
+        self.assertEqual(page.path, "/private/?page=2")
+        self.assertNotIn("HTTP_COOKIE", page.environ())
+
+    def test_off_by_default(self) -> None:
+        appconf = apps.get_app_config("livereloadish")
+        self.assertEqual(appconf.warm_up_pages, 0)
+        self.assertEqual(appconf.recent_pages.add(self.request), 0)
+
+    def test_dumped_file_is_private(self) -> None:
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        appconf = apps.get_app_config("livereloadish")
+        pages = RecentPages(maxsize=5)
+        pages.add(self.request)
+        with mock.patch.object(
+            appconf, "lockfile_storage", FileSystemStorage(location=directory)
+        ), mock.patch.object(appconf, "recent_pages", pages), mock.patch.object(
+            appconf, "warm_up_pages", 5
+        ):
+            self.assertTrue(appconf.dump_recent_pages())
+            path = appconf.lockfile_storage.path(f"{appconf.lockfile_name}.pages")
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o600)
+
+    def test_ready_after_the_budget_even_if_a_page_hangs(self) -> None:
+        pages = RecentPages(maxsize=5)
+        pages.budget = 0.1
+        pages.add(self.request)
+        hanging = threading.Event()
+        self.addCleanup(hanging.set)
+        with mock.patch.object(pages, "render", lambda pages: hanging.wait(5.0)):
+            pages.warm_up()
+        self.assertFalse(pages.warmed.is_set())
+        self.assertTrue(pages.warmed.wait(2.0))
+        self.assertFalse(hanging.is_set())
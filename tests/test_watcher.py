@@ -0,0 +1,129 @@
+import os
+import shutil
+import tempfile
+import threading
+from typing import List
+from unittest import mock
+
+from django.apps import apps
+from django.test import SimpleTestCase
+
+from livereloadish.apps import Seen
+from livereloadish.watcher import Change, Watcher
+
+
+class WatcherVisibilityTestCase(SimpleTestCase):
+    def setUp(self) -> None:
+        self.watcher = Watcher(appconf=apps.get_app_config("livereloadish"))
+
+    def test_reconnecting_page_reported_visible_again(self) -> None:
+        self.watcher.set_hidden("abc", True)
+        # Reconnecting carries the last report over, until the client (which
+        # reports on every connect) says otherwise.
+        subscription = self.watcher.subscribe("abc")
+        self.assertTrue(subscription.hidden)
+        self.assertEqual(self.watcher.set_hidden("abc", False), 1)
+        self.assertFalse(subscription.hidden)
+        self.assertNotIn("abc", self.watcher.hidden_pages)
+
+    def test_hidden_before_subscribing(self) -> None:
+        # The report may arrive before the SSE connection has subscribed.
+        self.assertEqual(self.watcher.set_hidden("def", True), 0)
+        self.assertTrue(self.watcher.subscribe("def").hidden)
+        self.assertFalse(self.watcher.subscribe("ghi").hidden)
+
+
+class WatcherScanTestCase(SimpleTestCase):
+    def setUp(self) -> None:
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, "app.css")
+        self.other = os.path.join(directory, "other.css")
+        for path in (self.path, self.other):
+            with open(path, "w") as f:
+                f.write("a{}")
+            os.utime(path, (1_000_000, 1_000_000))
+        self.seen = {
+            "text/css": {
+                path: Seen(
+                    relative_path=os.path.basename(path),
+                    absolute_path=path,
+                    filename=os.path.basename(path),
+                    mtime=1_000_000,
+                    requires_full_reload=False,
+                )
+                for path in (self.path, self.other)
+            }
+        }
+        appconf = apps.get_app_config("livereloadish")
+        patcher = mock.patch.object(appconf, "seen", self.seen)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.watcher = Watcher(appconf=appconf)
+
+    def touch(self, path: str, mtime: float) -> None:
+        os.utime(path, (mtime, mtime))
+
+    def test_scan_finds_a_change_and_wakes_the_waiter(self) -> None:
+        subscription = self.watcher.subscribe("abc")
+        received: List[Change] = []
+        waiter = threading.Thread(
+            target=lambda: received.extend(self.watcher.wait(subscription, 5.0))
+        )
+        waiter.start()
+        self.touch(self.path, 1_000_010)
+        self.assertEqual(self.watcher.scan(), 2)
+        waiter.join(5.0)
+        self.assertFalse(waiter.is_alive())
+        (change,) = received
+        self.assertEqual(change.event, "assets_change")
+        self.assertEqual(change.file.absolute_path, self.path)
+        self.assertEqual(change.new_time, 1_000_010)
+        self.assertEqual(subscription.cursor, self.watcher.sequence)
+        self.assertEqual(self.seen["text/css"][self.path].mtime, 1_000_010)
+        # Nothing changed since, so nothing more is found.
+        self.assertEqual(self.watcher.scan(), 2)
+        self.assertEqual(self.watcher.wait(subscription, 0.01), [])
+
+    def test_scan_finds_a_deletion(self) -> None:
+        subscription = self.watcher.subscribe("abc")
+        os.remove(self.other)
+        self.watcher.scan()
+        (change,) = self.watcher.wait(subscription, 0.01)
+        self.assertEqual(change.event, "assets_delete")
+        self.assertNotIn(self.other, self.seen["text/css"])
+
+    def test_subscriptions_only_get_changes_after_subscribing(self) -> None:
+        early = self.watcher.subscribe("abc")
+        self.touch(self.path, 1_000_010)
+        self.watcher.scan()
+        late = self.watcher.subscribe("def")
+        self.touch(self.other, 1_000_020)
+        self.watcher.scan()
+        early_changes = self.watcher.wait(early, 0.01)
+        late_changes = self.watcher.wait(late, 0.01)
+        self.assertEqual(
+            [change.file.absolute_path for change in early_changes],
+            [self.path, self.other],
+        )
+        self.assertEqual(late_changes, early_changes[1:])
+        # The frame is encoded once and shared by both.
+        self.assertIs(late_changes[0].frame, early_changes[1].frame)
+
+    def test_hidden_subscription_gets_coalesced_changes_once_visible(self) -> None:
+        subscription = self.watcher.subscribe("abc")
+        self.watcher.set_hidden("abc", True)
+        for mtime in (1_000_010, 1_000_020):
+            self.touch(self.path, mtime)
+            self.watcher.scan()
+        self.touch(self.other, 1_000_030)
+        self.watcher.scan()
+        self.touch(self.path, 1_000_040)
+        self.watcher.scan()
+        self.assertEqual(self.watcher.wait(subscription, 0.01), [])
+        self.watcher.set_hidden("abc", False)
+        changes = self.watcher.wait(subscription, 0.01)
+        self.assertEqual(
+            [(change.file.absolute_path, change.new_time) for change in changes],
+            [(self.other, 1_000_030), (self.path, 1_000_040)],
+        )